@@ -322,11 +322,12 @@ class ArtisanController():
         :param axis: Axis to move ('X', 'Y', or 'Z').
         :param position: Position to move to.
         :param speed: Speed of movement.
+        :return: False if the move was refused, True if it was sent
         """
 
         if self.process_state == "Running" and not job_save:
             self.last_log = "Error: Cannot move axis while a process is running. Please pause or cancel the process first."
-            return
+            return False
 
         if speed is None:
             speed = self.speed
@@ -349,14 +350,16 @@ class ArtisanController():
 
         # Switch back to absolute positioning
         self.send_command("G90")
+        return True
     
-    def move_axis_absolute(self, x, y, z, speed=None, z_save=True, job_save=False):
+    def move_axis_absolute(self, x, y, z, speed=None, z_save=True, job_save=False, pos_now=None):
         """
         Move the axis in absolute machine coordinates.
         :param x: X-coordinate to move to.
         :param y: Y-coordinate to move to.
         :param z: Z-coordinate to move to.
         :param speed: Speed of movement.
+        :param pos_now: Known absolute position for z_save. If None, the position is queried from the machine.
         """
 
         if self.process_state == "Running" and not job_save:
@@ -380,7 +383,8 @@ class ArtisanController():
 
         # Move the axis
         if z_save:
-            pos_now = self.get_absolute_position()
+            if pos_now is None:
+                pos_now = self.get_absolute_position()
             if pos_now[2]>z:
                 self.send_command(f"G0 X{x_move} Y{y_move} F{speed*60}")
                 self.send_command(f"G0 Z{z_move} F{speed*60}")
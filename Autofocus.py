@@ -0,0 +1,237 @@
+import threading
+import time
+import cv2
+import numpy as np
+from Cross_Detection import LaserCrossDetector
+
+GOLDEN_RATIO = (np.sqrt(5) - 1)/2  # 0.618
+
+class Autofocus():
+    """
+    Finds the Z height at which the laser cross is in focus by moving Z and measuring the cross in the laser camera.
+    A coarse sweep over the Z range brackets the best height, a golden-section search inside the bracket refines it
+    until it is narrower than tolerance, then the machine moves to the best height.
+    Every measurement is taken from frames that were exposed after the machine stopped (add_sync_position).
+
+    Metrics (higher is sharper):
+    "gap": distance between the vertical arm lines of the cross detection. Out of focus the laser light is spread,
+           the saturated core of the arm between the lines gets narrower. If target_gap is set (the gap in pixels
+           measured once at the focus height), the search goes for that gap instead of the widest one.
+    "sharpness": variance of the laplacian in a window around the cross, also works if the arm lines are not found.
+                 The window is placed once per run, on the cross in the first frame or on the crosshair overlay if the
+                 cross is not found there, so every height is measured on the same pixels.
+
+    Z is moved relative to the start height, the search is centered on it, so the head has to start close to focus.
+    Runs in its own thread.
+    """
+    def __init__(self, settings, camera_controller, artisan_controller):
+        self.s = settings
+        self.camera_controller = camera_controller
+        self.artisan_controller = artisan_controller
+        self.thread = None
+        self._stop = threading.Event()
+        self._last_log = ''
+        self.samples = []  # (z offset from the start height, metric) of the running search
+        self.window_center = None  # (x, y) in the captured frame of the sharpness window of the running search
+        self.focus_height = None  # Z in work coordinates of the last successful search
+
+        # Callbacks for GUI updates
+        self.log_callbacks = []
+        self.finished_callbacks = []
+
+        self.load_settings()
+        settings.settingChanged.connect(self.load_settings)  # Reload settings if they change
+        settings.settingsReplaced.connect(self.load_settings)  # Reload settings if they are replaced
+
+    def load_settings(self):
+        self.metric = self.s.get("laser_camera.autofocus.metric", "sharpness")  # "gap" or "sharpness"
+        self.z_range = self.s.get("laser_camera.autofocus.range", 4.0)  # mm, searched around the start height
+        self.coarse_steps = self.s.get("laser_camera.autofocus.coarse_steps", 5)  # heights of the coarse sweep
+        self.target_gap = self.s.get("laser_camera.autofocus.target_gap", None)  # pixels, None for the widest gap
+        self.tolerance = self.s.get("laser_camera.autofocus.tolerance", 0.1)  # mm, width of the final bracket
+        self.max_moves = self.s.get("laser_camera.autofocus.max_moves", 20)
+        self.samples_per_height = self.s.get("laser_camera.autofocus.samples", 3)  # frames averaged per height
+        self.backlash = self.s.get("laser_camera.autofocus.backlash", 0.1)  # mm, every height is approached from below
+        self.settle_frames = self.s.get("laser_camera.autofocus.settle_frames", 2)  # frames dropped after a move
+        self.window = 160  # pixels around the cross for the sharpness metric
+        self.frame_timeout = 2.0  # seconds
+        self.detector = LaserCrossDetector(hough_threshold=self.s.get("laser_camera.cross_detection.hough_threshold", 80),
+                                           line_budget=self.s.get("laser_camera.cross_detection.line_budget", 30))
+
+    @property
+    def last_log(self):
+        return self._last_log
+
+    @last_log.setter
+    def last_log(self, value):
+        self._last_log = value
+        for callback in self.log_callbacks:
+            callback(value)
+
+    def set_log_callback(self, callback):
+        self.log_callbacks.append(callback)
+
+    def set_finished_callback(self, callback):
+        """
+        :param callback: called with the focus height (work coordinates) or None if the search failed
+        """
+        self.finished_callbacks.append(callback)
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self):
+        if self.running:
+            self.last_log = "Autofocus is already running."
+            return
+        if self.artisan_controller is None or not self.artisan_controller.connected:
+            self.last_log = "Autofocus needs a connected Artisan."
+            return
+        if self.artisan_controller.process_state != "Idle":
+            self.last_log = "Autofocus can only run while no process is running or paused."
+            return
+        if self.camera_controller.latest_frame() is None:
+            self.last_log = "Autofocus needs a running laser camera."
+            return
+        self._stop.clear()
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def find_window_center(self, image):
+        """
+        Center of the sharpness window: the cross if it is found, otherwise the crosshair overlay of the laser camera.
+        """
+        result = self.detector.detect(image)
+        if result.found:
+            return int(result.center[0]), int(result.center[1])
+        # the overlay position is a share of the displayed (flipped) image
+        height, width = image.shape[:2]
+        x = self.s.get("laser_camera.crosshair_overlay.horizontal_position", 0.5)
+        y = self.s.get("laser_camera.crosshair_overlay.vertical_position", 0.5)
+        x = 1 - x if self.camera_controller.flip_horizontal else x
+        y = 1 - y if self.camera_controller.flip_vertical else y
+        return int(x*width), int(y*height)
+
+    def measure(self, image):
+        """
+        Focus metric of one frame, None if the cross was not found.
+        """
+        if self.metric == "sharpness":
+            # only the surroundings of the cross, the rest of the image may be far from the focal plane
+            x, y = self.window_center
+            gray = image[max(y - self.window//2, 0):y + self.window//2, max(x - self.window//2, 0):x + self.window//2, 1]
+            return float(cv2.Laplacian(gray, cv2.CV_32F).var()) if gray.size else None
+        result = self.detector.detect(image)
+        if result.arm_gap is None or self.target_gap is None:
+            return result.arm_gap
+        return -abs(result.arm_gap - self.target_gap)
+
+    def measure_frames(self):
+        """
+        Mean metric of the next frames that were exposed after the machine stopped, None if the cross was not found in any.
+        """
+        latest = self.camera_controller.latest_frame()
+        frame_id = latest.frame_id + self.settle_frames - 1 if latest is not None else -1
+        values = []
+        for _ in range(self.samples_per_height):
+            frame = self.camera_controller.frames.wait_newer(frame_id, timeout=self.frame_timeout)
+            if frame is None:
+                break
+            frame_id = frame.frame_id
+            value = self.measure(frame.image.copy())  # the ring buffer slot is reused by the capture thread
+            if value is not None:
+                values.append(value)
+        return float(np.mean(values)) if values else None
+
+    def move_to(self, z):
+        """
+        Move Z to the offset z from the start height. Downward moves go backlash further and come back up,
+        so every height is reached from the same direction.
+        """
+        delta = z - self.z
+        if delta < 0 and self.backlash > 0:
+            self.move_relative(delta - self.backlash)
+            delta = self.backlash
+        self.move_relative(delta)
+        self.artisan_controller.add_sync_position(timeout=30)  # returns when the machine stands still
+        self.z = z
+        self.moves += 1
+
+    def move_relative(self, dz):
+        if self.artisan_controller.process_state != "Idle" or \
+                not self.artisan_controller.move_axis_to("relative", x=0, y=0, z=round(dz, 4)):
+            raise Exception("move refused, a process was started")
+
+    def evaluate(self, z):
+        """
+        Metric at the offset z, every height is only measured once.
+        """
+        for sample_z, value in self.samples:
+            if abs(sample_z - z) < 1e-6:
+                return value
+        self.move_to(z)
+        value = self.measure_frames()
+        value = -np.inf if value is None else value
+        self.samples.append((float(z), value))
+        return value
+
+    def run(self):
+        start_time = time.monotonic()
+        start_z = self.artisan_controller.current_position[2]
+        self.z = 0.0
+        self.moves = 0
+        self.samples = []
+        focus = None
+        try:
+            latest = self.camera_controller.latest_frame()
+            if latest is None:
+                raise Exception("no camera frame")
+            self.window_center = self.find_window_center(latest.image.copy())
+            # coarse sweep upwards, the best height and its neighbours bracket the focus
+            heights = np.linspace(-self.z_range/2, self.z_range/2, max(self.coarse_steps, 3))
+            values = []
+            for z in heights:
+                if self._stop.is_set():
+                    break
+                values.append(self.evaluate(float(z)))
+            if len(values) < len(heights):
+                self.last_log = "Autofocus cancelled."
+            elif not np.isfinite(values).any():
+                self.last_log = "Autofocus: laser cross not found at any height."
+            else:
+                best = int(np.argmax(values))
+                a, b = float(heights[max(best - 1, 0)]), float(heights[min(best + 1, len(heights) - 1)])
+
+                # golden-section search for the maximum in [a, b]
+                c, d = b - GOLDEN_RATIO*(b - a), a + GOLDEN_RATIO*(b - a)
+                value_c, value_d = self.evaluate(c), self.evaluate(d)
+                while b - a > self.tolerance and self.moves < self.max_moves and not self._stop.is_set():
+                    if value_c >= value_d:
+                        b, d, value_d = d, c, value_c
+                        c = b - GOLDEN_RATIO*(b - a)
+                        value_c = self.evaluate(c)
+                    else:
+                        a, c, value_c = c, d, value_d
+                        d = a + GOLDEN_RATIO*(b - a)
+                        value_d = self.evaluate(d)
+
+                if self._stop.is_set():
+                    self.last_log = "Autofocus cancelled."
+                else:
+                    focus = (a + b)/2
+                    self.move_to(focus)
+                    self.focus_height = start_z + focus
+                    self.last_log = (f"Autofocus: Z {self.focus_height:.3f} ({focus:+.3f} from the start, bracket {b - a:.3f} mm) "
+                                     f"after {self.moves} moves in {time.monotonic() - start_time:.1f} s.")
+            if focus is None and self.z != 0.0:
+                self.move_to(0.0)  # back to the start height
+        except Exception as e:
+            focus = None
+            self.last_log = f"Autofocus failed: {e}"
+        for callback in self.finished_callbacks:
+            callback(None if focus is None else self.focus_height)
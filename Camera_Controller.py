@@ -1,38 +1,190 @@
 import sys
+import time
+import threading
+from collections import deque
 import cv2
 from PyQt6 import QtWidgets, uic, QtGui, QtCore
 from Settings_Manager import SettingsManager
+from Frame_Bus import FrameBus
+
+class CameraFrame():
+    def __init__(self, image, frame_id, timestamp):
+        self.image = image  # BGR image as returned by cv2
+        self.frame_id = frame_id  # counts up with every captured frame of the camera
+        self.timestamp = timestamp  # time.monotonic() when the frame was read
+
+
+class FrameRingBuffer():
+    """
+    The last few frames of a camera. The capture thread puts every frame in, the oldest frame is dropped.
+    Consumers get the latest frame without waiting for the camera, or wait for a frame newer than the one they have.
+    The image buffers of the slots are reused: a frame is overwritten capacity frames later,
+    so consumers that keep a frame longer have to copy it or hold it.
+    """
+    def __init__(self, capacity=4):
+        self.capacity = capacity
+        self._frames = []
+        self._next_id = 0
+        self._buffers = [None]*capacity
+        self._held = None  # image buffer that is not reused, see hold
+        self._condition = threading.Condition()
+
+    def write_buffer(self):
+        """
+        Image buffer of the slot the next frame goes to (the oldest frame), None if the slot was not used yet or is held.
+        """
+        with self._condition:
+            buffer = self._buffers[self._next_id % self.capacity]
+            return None if buffer is self._held else buffer
+
+    def hold(self, frame):
+        """
+        Keep the image buffer of frame from being overwritten until another frame is held, without copying it.
+        When the writer reaches the slot, the next frame gets a new buffer. Used by the GUI for the displayed frame,
+        which has to stay intact however long the GUI takes to paint it.
+        :return: False if the buffer may already be overwritten (capacity newer frames came in), the frame can not be used
+        """
+        with self._condition:
+            if frame.frame_id <= self._next_id - self.capacity:
+                return False
+            self._held = frame.image
+            return True
+
+    @property
+    def next_id(self):
+        """
+        Id the next frame will get, only meaningful in the thread that puts the frames.
+        """
+        return self._next_id
+
+    def put(self, image, timestamp=None):
+        with self._condition:
+            self._buffers[self._next_id % self.capacity] = image
+            frame = CameraFrame(image, self._next_id, time.monotonic() if timestamp is None else timestamp)
+            self._next_id += 1
+            self._frames.append(frame)
+            if len(self._frames) > self.capacity:
+                self._frames.pop(0)
+            self._condition.notify_all()
+        return frame
+
+    def latest(self, max_age=None):
+        """
+        :param max_age: in seconds. Older frames (camera stalled) are not returned
+        :return: newest CameraFrame or None
+        """
+        with self._condition:
+            frame = self._frames[-1] if self._frames else None
+        if frame is None or (max_age is not None and time.monotonic()-frame.timestamp > max_age):
+            return None
+        return frame
+
+    def wait_newer(self, frame_id, timeout=None):
+        """
+        Block until a frame newer than frame_id is available.
+        :param frame_id: id of the last frame the consumer has seen, -1 for any frame
+        :return: newest CameraFrame or None on timeout
+        """
+        with self._condition:
+            if self._condition.wait_for(lambda: self._frames and self._frames[-1].frame_id > frame_id, timeout):
+                return self._frames[-1]
+        return None
+
+    def clear(self):
+        with self._condition:
+            self._frames = []
+
+
+# capture backends that can be selected in the settings, DirectShow gives the most control over the format on Windows
+CAPTURE_BACKENDS = {"auto": cv2.CAP_ANY, "dshow": cv2.CAP_DSHOW, "msmf": cv2.CAP_MSMF, "v4l2": cv2.CAP_V4L2}
+
+# modes tried by probe_modes, the driver answers with the nearest mode it supports
+PROBE_RESOLUTIONS = [(640, 480), (800, 600), (1280, 720), (1280, 960), (1600, 1200), (1920, 1080), (2592, 1944), (3840, 2160)]
+PROBE_FOURCCS = ["MJPG", "YUYV"]
+FOURCC_ALIASES = {"YUY2": "YUYV"}  # the same format under the names of different drivers
+
+def fourcc_to_string(value):
+    value = int(value)
+    return "".join(chr((value >> 8*i) & 0xFF) for i in range(4)).strip("\x00 ") if value > 0 else ""
+
+
 class USBCameraController:
     def __init__(self, settings: SettingsManager,camera_type):
         self.s = settings
         self.camera_type=camera_type #'laser_camera' or 'overview_camera'
-        self.timer = QtCore.QTimer()
         self.load_settings()
         # self.camera_index = settings.get(camera_type+".camera_index", -1)
         # self.camera_name = f"Camera {self.camera_index}"
         self.cap = None
         self.connected = False
-        self._current_frame = None
-        self.frame_changed_callback = None
+        self.frame_changed_callbacks = []
+        self.log_callback = None
         # self._frame_rate = settings.get(camera_type+".frame_rate", 30)
         self._last_log = ''
 
+        # Frames are read continuously in a capture thread, so a slow cap.read() never blocks the GUI
+        self.frames = FrameRingBuffer(capacity=4)
+        self.capture_thread = None
+        self.capture_stop = threading.Event()
+        self.capture_lock = threading.Lock()  # between stop_camera/disconnect and the exit of the capture thread
+        self.capture_running = False  # the capture thread has not left its loop yet
+        self.release_on_exit = False  # the capture thread releases the camera and the frame bus when it exits
+        self.max_read_failures = 30  # consecutive failed reads before the capture thread gives up
+        self.frame_times = deque(maxlen=60)  # timestamps of the last frames, for the delivered frame rate
+        self.read_times = deque(maxlen=60)  # seconds cap.read() blocked for the last frames
+        self.stats_logged = False
+        self.capture_format = None  # mode the camera accepted: dict with width, height, fourcc, fps, buffer_size
+        self.frame_bus = None  # shared memory ring for consumers in other processes, see frame_bus_name
+        self.frame_bus_requested = False  # frames are only copied to the bus once a consumer asked for it
+
         #Callbacks for Setting changes
         settings.settingChanged.connect(self.load_settings)  # Reload settings if they change
         settings.settingsReplaced.connect(self.load_settings)  # Reload settings if they are replaced
 
     @property
     def current_frame(self):
-        return self._current_frame
-    
-    @current_frame.setter
-    def current_frame(self, value):
-        self._current_frame = value
-        if self.frame_changed_callback:
-            self.frame_changed_callback(value)
-            
+        frame = self.frames.latest()
+        return frame.image if frame is not None else None
+
+    def latest_frame(self, max_age=None):
+        """
+        Newest CameraFrame (image, frame_id, timestamp) without waiting for the camera. None if there is none.
+        """
+        return self.frames.latest(max_age)
+
     def set_frame_changed_callback(self, callback):
-        self.frame_changed_callback = callback 
+        """
+        The callbacks are called with every new frame in the capture thread and hold it up, they have to be fast.
+        The frame is the image as captured, flip_vertical/flip_horizontal are not applied (see orient), and its buffer
+        is reused by the ring buffer, copy it to keep it.
+        GUI code should poll latest_frame instead, other processes read the frame bus.
+        """
+        self.frame_changed_callbacks.append(callback)
+
+    @property
+    def frame_bus_name(self):
+        """
+        Name to attach to the frame bus from another process (FrameBus.attach), None if there is none (yet).
+        The bus is created with the next frame after the first request, until then no frame is copied to it. It stays
+        until the camera is disconnected. It is replaced when the frame size grows, subscribers see it closed and have
+        to attach to the new name.
+        """
+        if self.frame_bus_enabled:
+            self.frame_bus_requested = True
+        return self.frame_bus.name if self.frame_bus is not None else None
+
+    def publish_to_bus(self, image, frame_id, timestamp):
+        if self.frame_bus is not None and not self.frame_bus.fits(image):
+            self.close_frame_bus()
+        if self.frame_bus is None:
+            self.frame_bus = FrameBus.create(image.nbytes, slots=self.frame_bus_slots)
+            self.last_log = f"Camera {self.camera_name} frame bus {self.frame_bus.name} with {self.frame_bus_slots} frames."
+        self.frame_bus.publish(image, frame_id, timestamp)
+
+    def close_frame_bus(self):
+        if self.frame_bus is not None:
+            self.frame_bus.close()
+            self.frame_bus = None
 
     @property
     def last_log(self):
@@ -54,59 +206,287 @@ class USBCameraController:
         self.camera_name = f"Camera {self.camera_index}"
         self._frame_rate = self.s.get(self.camera_type + ".frame_rate", 30)
         self.set_frame_rate(self._frame_rate)
+        # the frames are stored as the camera delivers them, the flips are applied by the display (see orient)
         self.flip_vertical = self.s.get(self.camera_type + ".flip_vertical", False)
         self.flip_horizontal = self.s.get(self.camera_type + ".flip_horizontal", False)   
+        # format requested from the camera when it connects, 0 or "" keeps the driver default.
+        # The resolution is part of the camera calibration (H21, crosshair overlay), change it only together with these
+        self.capture_backend = self.s.get(self.camera_type + ".capture.backend", "auto")
+        self.capture_width = self.s.get(self.camera_type + ".capture.width", 0)
+        self.capture_height = self.s.get(self.camera_type + ".capture.height", 0)
+        self.capture_fourcc = self.s.get(self.camera_type + ".capture.fourcc", "")  # e.g. "MJPG" or "YUYV"
+        self.capture_fps = self.s.get(self.camera_type + ".capture.fps", 0)
+        self.capture_buffer_size = self.s.get(self.camera_type + ".capture.buffer_size", 1)  # frames queued in the driver
+        self.frame_bus_enabled = self.s.get(self.camera_type + ".frame_bus.enabled", True)
+        self.frame_bus_slots = self.s.get(self.camera_type + ".frame_bus.slots", 8)
+
+    def orient(self, image):
+        """
+        Copy of a captured image with the flips of the settings applied, as it is shown in the GUI.
+        """
+        if self.flip_vertical and self.flip_horizontal:
+            return cv2.flip(image, -1)
+        if self.flip_vertical:
+            return cv2.flip(image, 0)
+        if self.flip_horizontal:
+            return cv2.flip(image, 1)
+        return image.copy()
 
     def connect(self):
         try:
+            if self.capture_running:
+                raise Exception(f"Camera {self.camera_name} is still stopping, its last read did not return yet.")
             if self.camera_index < 0:
                 raise ValueError("No Camera selected for connection.")
-            self.cap = cv2.VideoCapture(self.camera_index)
+            self.cap = self.open_capture()
             if not self.cap.isOpened():
                 self.connected = False
                 raise Exception(f"Error connecting to camera:Could not open camera {self.camera_name}")
             else:
                 self.connected = True
-                self.last_log = f"Camera {self.camera_name} connected successfully."
+                self.capture_format = self.apply_format(self.cap, self.capture_width, self.capture_height, self.capture_fourcc,
+                                                        self.capture_fps, self.capture_buffer_size)
+                self.last_log = f"Camera {self.camera_name} connected successfully, {self.format_text(self.capture_format)}."
                 self.start_camera()
         except Exception as e:
             self.last_log = f"{str(e)}"
 
+    def open_capture(self):
+        backend = CAPTURE_BACKENDS.get(self.capture_backend, cv2.CAP_ANY)
+        return cv2.VideoCapture(self.camera_index, backend)
+
+    @staticmethod
+    def apply_format(cap, width=0, height=0, fourcc="", fps=0, buffer_size=0):
+        """
+        Request a format from an opened camera and read back what it accepted. Values of 0 or "" are not requested.
+        The FOURCC has to be set before the resolution, some drivers reset it otherwise. Compressed MJPEG usually allows
+        higher resolutions and frame rates over USB than raw YUYV.
+        A small buffer_size keeps the driver from queueing old frames, which would add their age to the latency.
+        :return: dict with the width, height, fourcc, fps and buffer_size the camera reports after the request
+        """
+        if fourcc:
+            cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*fourcc[:4].ljust(4)))
+        if width and height:
+            cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+            cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        if fps:
+            cap.set(cv2.CAP_PROP_FPS, fps)
+        if buffer_size:
+            cap.set(cv2.CAP_PROP_BUFFERSIZE, buffer_size)  # not supported by every backend, the read back value tells
+        return {"width": int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), "height": int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+                "fourcc": fourcc_to_string(cap.get(cv2.CAP_PROP_FOURCC)), "fps": float(cap.get(cv2.CAP_PROP_FPS)),
+                "buffer_size": int(cap.get(cv2.CAP_PROP_BUFFERSIZE))}
+
+    @staticmethod
+    def format_text(capture_format):
+        if capture_format is None:
+            return "no format"
+        text = f"{capture_format['width']}x{capture_format['height']} {capture_format['fourcc'] or '?'} {capture_format['fps']:g} fps"
+        if capture_format.get("buffer_size"):
+            text += f", buffer {capture_format['buffer_size']}"
+        if capture_format.get("measured_fps") is not None:
+            text += f", delivers {capture_format['measured_fps']:.1f} fps"
+        return text
+
+    def probe_modes(self, resolutions=PROBE_RESOLUTIONS, fourccs=PROBE_FOURCCS, measure_frames=0):
+        """
+        Modes the camera accepts: every combination of resolution and FOURCC is requested and the answer of the
+        driver is collected. Stops the capture while probing and restores the format the camera ran in afterwards.
+        :param measure_frames: if > 0, so many frames are read in every mode to measure the delivered frame rate
+        :return: list of dicts with width, height, fourcc, fps (and measured_fps), without duplicates
+        """
+        was_capturing = self.capture_thread is not None
+        if not self.stop_camera():
+            return []
+        # the mode the camera runs in, settings of 0 (driver default) are restored with the values it had
+        restore = dict(self.capture_format) if self.capture_format is not None else {}
+        restore.update({key: value for key, value in [("width", self.capture_width), ("height", self.capture_height),
+                        ("fourcc", self.capture_fourcc), ("fps", self.capture_fps), ("buffer_size", self.capture_buffer_size)] if value})
+        cap = self.cap if self.cap is not None and self.cap.isOpened() else self.open_capture()
+        modes = []
+        try:
+            if not cap.isOpened():
+                self.last_log = f"Could not open camera {self.camera_name} for probing."
+                return modes
+            for fourcc in fourccs:
+                for width, height in resolutions:
+                    mode = self.apply_format(cap, width, height, fourcc)
+                    mode.pop("buffer_size")
+                    if FOURCC_ALIASES.get(mode["fourcc"], mode["fourcc"]) != FOURCC_ALIASES.get(fourcc, fourcc) or any((m["width"], m["height"], m["fourcc"]) == (mode["width"], mode["height"], mode["fourcc"]) for m in modes):
+                        continue  # not accepted, the driver kept another format
+                    if measure_frames > 0:
+                        mode["measured_fps"] = self.measure_fps(cap, measure_frames)
+                    modes.append(mode)
+        finally:
+            if cap is not self.cap:
+                cap.release()
+            elif self.cap is not None:
+                self.capture_format = self.apply_format(self.cap, restore.get("width", 0), restore.get("height", 0), restore.get("fourcc", ""),
+                                                        restore.get("fps", 0), restore.get("buffer_size", 0))
+        self.last_log = f"Camera {self.camera_name} modes: " + "; ".join(self.format_text(mode) for mode in modes)
+        if was_capturing:
+            self.start_camera()
+        return modes
+
+    @staticmethod
+    def measure_fps(cap, n_frames=30):
+        """
+        Frame rate a camera delivers, from the time of n_frames reads. The first reads are not counted,
+        they return frames that were queued before.
+        """
+        for _ in range(3):
+            cap.read()
+        start = time.monotonic()
+        frames = 0
+        for _ in range(n_frames):
+            if cap.read()[0]:
+                frames += 1
+        duration = time.monotonic() - start
+        return frames/duration if duration > 0 else 0.0
+
+    @property
+    def measured_fps(self):
+        """
+        Frame rate the capture thread received over the last frames, None if there are not enough.
+        """
+        times = list(self.frame_times)
+        if len(times) < 2 or times[-1] == times[0]:
+            return None
+        return (len(times) - 1)/(times[-1] - times[0])
+
+    def measure_latency(self, trigger, threshold=40, timeout=2.0):
+        """
+        End-to-end latency from an event in front of the camera to the frame that shows it in this program:
+        trigger() has to cause a large brightness change in the image (e.g. switch the laser crosshair or a screen
+        the camera looks at between dark and bright). The camera has to be capturing.
+        :return: seconds from calling trigger until the first frame with a changed mean brightness, None on timeout
+        """
+        frame = self.frames.wait_newer(-1, timeout=timeout)
+        if frame is None:
+            return None
+        before = float(frame.image.mean())
+        frame_id = frame.frame_id
+        start = time.monotonic()
+        trigger()
+        while time.monotonic() - start < timeout:
+            frame = self.frames.wait_newer(frame_id, timeout=timeout)
+            if frame is None:
+                return None
+            frame_id = frame.frame_id
+            if abs(float(frame.image.mean()) - before) > threshold:
+                return frame.timestamp - start
+        return None
+
     def capture_frame(self):
+        """
+        Read one frame into the next buffer of the ring buffer. Blocks until the camera delivers the frame.
+        A new buffer is only allocated by cv2 when the resolution changes.
+        """
         if self.cap is None or not self.cap.isOpened():
             raise Exception(f"Camera {self.camera_name} is not opened")
-        ret, frame = self.cap.read()
+        buffer = self.frames.write_buffer()
+        read_start = time.monotonic()
+        ret, frame = self.cap.read(buffer) if buffer is not None else self.cap.read()
         if not ret:
             raise Exception(f"Failed to capture frame on camera {self.camera_name}")
-        
-        if self.flip_vertical:
-            frame = cv2.flip(frame, 0)
-        if self.flip_horizontal:
-            frame = cv2.flip(frame, 1)
+        timestamp = time.monotonic()
+        self.frame_times.append(timestamp)
+        self.read_times.append(timestamp - read_start)
+
+        if self.frame_bus_enabled and self.frame_bus_requested:
+            # on the bus before the ring buffer wakes up its consumers, they may hand the frame id to other processes
+            self.publish_to_bus(frame, self.frames.next_id, timestamp)
+        camera_frame = self.frames.put(frame, timestamp)
+        for callback in self.frame_changed_callbacks:
+            callback(frame)
+        return camera_frame
+
+    def capture_loop(self):
+        """
+        Runs in the capture thread: read frames as fast as the camera delivers them until stop_camera is called.
+        """
+        try:
+            self._capture_loop()
+        finally:
+            with self.capture_lock:
+                self.capture_running = False
+                if self.release_on_exit:
+                    # disconnect did not wait for the read that hung
+                    self.release_on_exit = False
+                    self.close_frame_bus()
+                    if self.cap is not None:
+                        self.cap.release()
+                        self.cap = None
 
-        self.current_frame = frame
-        #return frame
+    def _capture_loop(self):
+        failures = 0
+        while not self.capture_stop.is_set():
+            try:
+                self.capture_frame()
+                failures = 0
+                if not self.stats_logged and len(self.frame_times) == self.frame_times.maxlen:
+                    # once per start: what the camera really delivers, a read that hardly blocks means the frames
+                    # come from the driver's buffer and are older than they look
+                    self.stats_logged = True
+                    if self.capture_format is not None:
+                        self.capture_format["measured_fps"] = self.measured_fps
+                    mean_read = sum(self.read_times)/len(self.read_times)
+                    self.last_log = f"Camera {self.camera_name} delivers {self.measured_fps:.1f} fps, reads block {mean_read*1000:.1f} ms."
+            except Exception as e:
+                failures += 1
+                if failures >= self.max_read_failures:
+                    self.last_log = f"Camera {self.camera_name} stopped: {str(e)}"
+                    break
+                time.sleep(0.01)  # temporary failures occur e.g. while the camera starts
     
     def start_camera(self):
         try:
             if not self.cap or not self.cap.isOpened():
                 self.last_log = f"Camera {self.camera_name} is not connected."
                 return
-            # self.camera_controller.connect()
-            self.timer.timeout.connect(self.capture_frame)
-            self.timer.start(self._frame_rate)  # Update frame every 30 ms
-            self.last_log = f"Camera {self.camera_name} started with frame rate {self._frame_rate} ms."
+            if self.capture_thread is not None and self.capture_thread.is_alive():
+                return
+            self.capture_stop.clear()
+            self.frames.clear()
+            self.frame_times.clear()
+            self.read_times.clear()
+            self.stats_logged = False
+            self.capture_running = True
+            self.capture_thread = threading.Thread(target=self.capture_loop)
+            self.capture_thread.daemon = True
+            self.capture_thread.start()
+            self.last_log = f"Camera {self.camera_name} started, display interval {self._frame_rate} ms."
         except Exception as e:
             self.last_log = f"Error starting the camera: {str(e)}"
 
     def stop_camera(self):
-        if self.timer.isActive():
-            self.timer.stop()
-            self.last_log = f"Camera {self.camera_name} stopped."
+        """
+        :return: True if the capture thread has exited. It is waited for 1 s only, a read that hangs in the driver
+        must not freeze the GUI. The thread still exits as soon as the read returns.
+        """
+        if self.capture_thread is None:
+            return True
+        self.capture_stop.set()
+        self.capture_thread.join(timeout=1.0)
+        if self.capture_thread.is_alive():
+            self.last_log = f"Camera {self.camera_name} stops when its read returns."
+            return False
+        self.capture_thread = None
+        self.last_log = f"Camera {self.camera_name} stopped."
+        return True
 
     def disconnect(self):
         self.stop_camera()
-            
+        self.frame_bus_requested = False
+        with self.capture_lock:
+            if self.capture_running:
+                # the capture thread still reads from the camera, it releases the camera and the frame bus when it exits
+                self.release_on_exit = True
+                self.connected = False
+                self.last_log = f"Camera {self.camera_name} disconnected, it is released when its read returns."
+                return
+        self.close_frame_bus()
+
         if self.cap is not None and self.cap.isOpened():
             self.cap.release()
             self.cap = None
@@ -125,8 +505,14 @@ class USBCameraController:
             self.camera_name = f"Camera {camera_index}"
     
     def set_frame_rate(self, frame_rate):
+        """
+        :param frame_rate: interval in ms in which the GUI shows the latest frame. The camera itself is read as fast as it delivers.
+        """
         self._frame_rate = frame_rate
-        self.timer.setInterval(self._frame_rate)
+
+    @property
+    def frame_rate(self):
+        return self._frame_rate
 
 
     def __del__(self):
@@ -1,25 +1,78 @@
 import cv2
-from PyQt6 import QtWidgets, QtGui
+from PyQt6 import QtWidgets, QtGui, QtCore
 from PyQt6.QtCore import pyqtSignal, QObject
 import datetime
 import numpy as np
 import cv2
+from Cross_Detection import CrossDetectionWorker, create_cross_detector
+
+class FrameItem(QtWidgets.QGraphicsItem):
+    """
+    Shows a BGR camera frame without converting or copying it in python: the QImage wraps the frame buffer directly
+    and the flips are applied when painting. Item coordinates are pixel coordinates of the flipped (displayed) image.
+    The frame buffer must not change while it is shown, a frame of the camera's ring buffer has to be held (FrameRingBuffer.hold).
+    """
+    def __init__(self):
+        super().__init__()
+        self.image = None
+        self.frame = None  # the QImage does not own the frame buffer
+        self.flip_horizontal = False
+        self.flip_vertical = False
+        self.width = 0
+        self.height = 0
+
+    def set_frame(self, frame, flip_horizontal=False, flip_vertical=False):
+        if not frame.flags.c_contiguous:
+            frame = np.ascontiguousarray(frame)
+        height, width = frame.shape[:2]
+        if (width, height) != (self.width, self.height):
+            self.prepareGeometryChange()
+            self.width, self.height = width, height
+        self.frame = frame
+        self.image = QtGui.QImage(frame.data, width, height, frame.strides[0], QtGui.QImage.Format.Format_BGR888)
+        self.flip_horizontal = flip_horizontal
+        self.flip_vertical = flip_vertical
+        self.update()
+
+    def map_from_frame(self, x, y):
+        """
+        Item coordinates of the center of pixel (x, y) of the captured (not flipped) frame.
+        """
+        x, y = x + 0.5, y + 0.5
+        return QtCore.QPointF(self.width - x if self.flip_horizontal else x, self.height - y if self.flip_vertical else y)
+
+    def boundingRect(self):
+        return QtCore.QRectF(0, 0, self.width, self.height)
+
+    def paint(self, painter, option, widget=None):
+        if self.image is None:
+            return
+        painter.save()
+        if self.flip_horizontal or self.flip_vertical:
+            painter.translate(self.width if self.flip_horizontal else 0, self.height if self.flip_vertical else 0)
+            painter.scale(-1 if self.flip_horizontal else 1, -1 if self.flip_vertical else 1)
+        painter.drawImage(0, 0, self.image)
+        painter.restore()
+
 
 class CameraInterface():
-    def __init__(self, gui, settings, camera_controller):
+    def __init__(self, gui, settings, camera_controller, recorder=None):
         super().__init__()
         self.gui = gui
         self.s = settings
         self.camera_controller = camera_controller
         self.camera_type = self.camera_controller.camera_type
+        self.display_timer = QtCore.QTimer()
         self.load_settings()
         
 
         self.camera_view = gui.findChild(QtWidgets.QGraphicsView, self.camera_type+"_view")
         self.camera_scene = QtWidgets.QGraphicsScene()
         self.camera_view.setScene(self.camera_scene)
-        self.pixmap_item = QtWidgets.QGraphicsPixmapItem()
-        self.camera_scene.addItem(self.pixmap_item)
+        self.frame_item = FrameItem()
+        self.camera_scene.addItem(self.frame_item)
+        self.cross_items = []
+        self._crosshair_geometry = None
 
         self.camera_start_button = gui.findChild(QtWidgets.QPushButton, self.camera_type+"_start_button")
         self.camera_start_button.clicked.connect(self.camera_controller.start_camera)
@@ -32,16 +85,46 @@ class CameraInterface():
 
         self.laser_camera_track_crosshair_button = gui.findChild(QtWidgets.QPushButton, "laser_camera_track_crosshair_button")
 
+        # The laser cross is detected in a worker thread on the newest frame, the latest result is drawn over the frame
+        self.cross_detection = None
+        self.detection_emitter = SignalEmitter()
+        self.detection_emitter.detection_signal.connect(self.show_cross_detection)
+        self.detection_items = {}  # line color -> QGraphicsPathItem of the detection overlay
+        if self.camera_type == "laser_camera":
+            self.cross_detection = CrossDetectionWorker(self.camera_controller, create_cross_detector(self.s))
+            self.cross_detection.set_result_callback(self.detection_emitter.detection_signal.emit)
+            self.cross_detection.set_log_callback(self.threadsafe_append_log)
+            self.laser_camera_track_crosshair_button.toggled.connect(self.track_crosshair)
+
+        # Recording of every frame or a time-lapse, the recorder tags the frames with the machine position
+        self.recorder = recorder
+        self.record_button = gui.findChild(QtWidgets.QPushButton, self.camera_type+"_record_button")
+        self.timelapse_button = gui.findChild(QtWidgets.QPushButton, self.camera_type+"_timelapse_button")
+        self.recording_emitter = SignalEmitter()
+        self.recording_emitter.recording_signal.connect(self.show_recording)
+        if self.recorder is not None:
+            self.record_button.toggled.connect(lambda checked: self.record(checked, timelapse=False))
+            self.timelapse_button.toggled.connect(lambda checked: self.record(checked, timelapse=True))
+            self.recorder.set_recording_changed_callback(self.recording_emitter.recording_signal.emit)
+        else:
+            self.record_button.setEnabled(False)
+            self.timelapse_button.setEnabled(False)
+
         #gui.test_button.clicked.connect(self.fit_image)
 
-        #connect interface to camera controller callback to receive frames
-        self.camera_controller.set_frame_changed_callback(self.update_frame)
+        #the latest frame of the capture thread is shown by a timer in the GUI thread
+        self.last_frame_id = -1
+        self.display_timer.timeout.connect(self.show_latest_frame)
+        self.display_timer.start()
+        self.camera_start_button.clicked.connect(lambda: self.display_timer.start())
 
         #logging for the camera
         self.log_textEdit=gui.log_textEdit
         self.log_emitter = SignalEmitter()
         self.log_emitter.log_signal.connect(self.append_log)
         self.camera_controller.set_log_callback(self.threadsafe_append_log)
+        if self.recorder is not None:
+            self.recorder.set_log_callback(self.threadsafe_append_log)
 
          #Callbacks for Setting changes
         settings.settingChanged.connect(self.load_settings)  # Reload settings if they change
@@ -54,6 +137,19 @@ class CameraInterface():
         self.crosshair_vertical = self.s.get(self.camera_type + ".crosshair_overlay.vertical_position", 0.5)
         self.crosshair_color = self.s.get(self.camera_type + ".crosshair_overlay.color", "green")
         self.crosshair_thickness = self.s.get(self.camera_type + ".crosshair_overlay.thickness", 2)   
+        self.display_timer.setInterval(self.s.get(self.camera_type + ".frame_rate", 30))
+
+    def show_latest_frame(self):
+        """
+        Show the newest frame of the camera if it was not shown yet. Never waits for the camera.
+        """
+        frame = self.camera_controller.latest_frame()
+        if frame is None or frame.frame_id == self.last_frame_id:
+            return
+        if not self.camera_controller.frames.hold(frame):
+            return  # overwritten already, the next tick shows a newer frame
+        self.last_frame_id = frame.frame_id
+        self.update_frame(frame.image)
 
     def update_frame(self, frame):
         try:
@@ -61,45 +157,113 @@ class CameraInterface():
                 # empty frame often occurs on temporary camera startup failure
                 return
 
-            display_frame = frame.copy()
-            if self.camera_type == "laser_camera" and self.laser_camera_track_crosshair_button.isChecked():
-                output = self.detect_laser_cross_refined(display_frame)
-                if output is not None:
-                    display_frame = output
-
-            frame_rgb = cv2.cvtColor(display_frame, cv2.COLOR_BGR2RGB)
-            height, width, channel = frame_rgb.shape
-            bytes_per_line = 3 * width
-            q_img = QtGui.QImage(frame_rgb.data, width, height, bytes_per_line, QtGui.QImage.Format.Format_RGB888)
-            self.pixmap_item.setPixmap(QtGui.QPixmap.fromImage(q_img))
-
-            # Remove previous cross items if they exist
-            if hasattr(self, 'cross_items'):
-                for item in self.cross_items:
-                    self.camera_scene.removeItem(item)
-                self.cross_items = []
-
-            if self.crosshair_active:
-                pen = QtGui.QPen(QtGui.QColor(*self.crosshair_color))
-                pen.setWidth(self.crosshair_thickness)
-                v_pos = int(height * self.crosshair_horizontal)
-                h_pos = int(width * self.crosshair_vertical)
-                h_line = QtWidgets.QGraphicsLineItem(0, v_pos, width, v_pos)
-                v_line = QtWidgets.QGraphicsLineItem(h_pos, 0, h_pos, height)
-                h_line.setPen(pen)
-                v_line.setPen(pen)
-                self.camera_scene.addItem(h_line)
-                self.camera_scene.addItem(v_line)
-                self.cross_items = [h_line, v_line]
+            self.frame_item.set_frame(frame, self.camera_controller.flip_horizontal, self.camera_controller.flip_vertical)
+            height, width = frame.shape[:2]
+            self.update_crosshair(width, height)
         except Exception as e:
             QtWidgets.QMessageBox.critical(self.gui, "Error", str(e))
-            # timer is optional and may not exist in this object
-            if hasattr(self, 'timer') and hasattr(self.timer, 'stop'):
-                self.timer.stop()
+            self.display_timer.stop()
+
+    def update_crosshair(self, width, height):
+        """
+        Show the crosshair overlay. The line items are only changed when the frame size or the settings change.
+        """
+        geometry = (width, height, self.crosshair_active, self.crosshair_horizontal, self.crosshair_vertical,
+                    str(self.crosshair_color), self.crosshair_thickness)
+        if geometry == self._crosshair_geometry:
+            return
+        self._crosshair_geometry = geometry
+
+        for item in self.cross_items:
+            self.camera_scene.removeItem(item)
+        self.cross_items = []
+
+        if self.crosshair_active:
+            pen = QtGui.QPen(QtGui.QColor(*self.crosshair_color))
+            pen.setWidth(self.crosshair_thickness)
+            v_pos = int(height * self.crosshair_horizontal)
+            h_pos = int(width * self.crosshair_vertical)
+            h_line = QtWidgets.QGraphicsLineItem(0, v_pos, width, v_pos)
+            v_line = QtWidgets.QGraphicsLineItem(h_pos, 0, h_pos, height)
+            h_line.setPen(pen)
+            v_line.setPen(pen)
+            self.camera_scene.addItem(h_line)
+            self.camera_scene.addItem(v_line)
+            self.cross_items = [h_line, v_line]
+
+    def track_crosshair(self, checked):
+        if checked:
+            self.cross_detection.start()
+        else:
+            self.cross_detection.stop()
+            self.show_cross_detection(None)
+
+    def show_cross_detection(self, result):
+        """
+        Draw the latest CrossDetection over the frame: all line pieces thin, the lines at the gap thick, the center as a cross
+        and the search window of the tracker.
+        :param result: CrossDetection or None to remove the overlay
+        """
+        if result is not None and not self.cross_detection.running:
+            return  # arrived after tracking was switched off
+        paths = {}
+        if result is not None:
+            def add_line(color, x1, y1, x2, y2):
+                path = paths.setdefault(color, QtGui.QPainterPath())
+                path.moveTo(self.frame_item.map_from_frame(x1, y1))
+                path.lineTo(self.frame_item.map_from_frame(x2, y2))
+            for line in result.v_lines:
+                add_line((0, 0, 255, 1), *line)
+            for line in result.h_lines:
+                add_line((0, 255, 255, 1), *line)
+            for line in result.arm_lines:
+                add_line((255, 0, 0, 2), *line)
+            if result.roi is not None:
+                # window the tracker searched in
+                x0, y0, x1, y1 = result.roi
+                for line in [(x0, y0, x1, y0), (x1, y0, x1, y1), (x1, y1, x0, y1), (x0, y1, x0, y0)]:
+                    add_line((128, 128, 128, 1), *line)
+            if result.center is not None:
+                x, y = result.center
+                add_line((0, 255, 0, 2), x - 30, y, x + 30, y)
+                add_line((0, 255, 0, 2), x, y - 30, x, y + 30)
+
+        for key in list(self.detection_items):
+            if key not in paths:
+                self.camera_scene.removeItem(self.detection_items.pop(key))
+        for key, path in paths.items():
+            item = self.detection_items.get(key)
+            if item is None:
+                item = QtWidgets.QGraphicsPathItem()
+                pen = QtGui.QPen(QtGui.QColor(*key[0:3]))
+                pen.setWidth(key[3])
+                item.setPen(pen)
+                self.camera_scene.addItem(item)
+                self.detection_items[key] = item
+            item.setPath(path)
+
+    def record(self, checked, timelapse):
+        if not checked:
+            self.recorder.stop()
+        elif self.recorder.recording:
+            self.show_recording(True)  # only one recording at a time
+        elif (self.recorder.start_timelapse() if timelapse else self.recorder.start()) is None:
+            self.show_recording(False)
+
+    def show_recording(self, recording):
+        """
+        Check the button of the running recording, uncheck both when it ended (also for recordings started by a job).
+        """
+        timelapse = recording and self.recorder.interval > 0
+        for button, checked in [(self.record_button, recording and not timelapse), (self.timelapse_button, timelapse)]:
+            button.blockSignals(True)
+            button.setChecked(checked)
+            button.blockSignals(False)
 
     def save_image(self):
         frame = self.camera_controller.current_frame
         if frame is not None:
+            frame = self.camera_controller.orient(frame)  # as shown in the GUI
             file_path, _ = QtWidgets.QFileDialog.getSaveFileName(self.gui, "Save Image", "", "PNG Files (*.png);;JPEG Files (*.jpg);;All Files (*)")
             if file_path:
                 cv2.imwrite(file_path, frame)
@@ -182,209 +346,8 @@ class CameraInterface():
 
     #     QtWidgets.QMessageBox.warning(self.gui, "Warning", f"X is {x} with: {float(x/width)}, Y is {y} with: {float(y/height)}")
     #     return float(x/width), float(y/height)  # sub-pixel center in image coordinates (0...1, 0...1)
-    
-    def detect_laser_cross_refined(self, img):
-                
-        output_img = img.copy()
-
-        # 2. Convert to HSV color space
-        hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
-
-        # 3. Create a strict mask for RED color
-        # We use a high Saturation threshold (>100) to ignore the white glare completely
-        # We use a high Value threshold (>100) to ignore dark red background noise
-        lower_red_1 = np.array([0, 100, 100])
-        upper_red_1 = np.array([10, 255, 255])
-        mask1 = cv2.inRange(hsv, lower_red_1, upper_red_1)
-
-        lower_red_2 = np.array([160, 100, 100])
-        upper_red_2 = np.array([180, 255, 255])
-        mask2 = cv2.inRange(hsv, lower_red_2, upper_red_2)
-
-        red_mask = mask1 | mask2
-
-        # 4. Clean up the mask to remove tiny specks of noise
-        kernel = np.ones((3,3), np.uint8)
-        red_mask = cv2.morphologyEx(red_mask, cv2.MORPH_OPEN, kernel)
-
-        # 5. Detect lines using Probabilistic Hough Transform
-        # minLineLength=40 ensures we only care about long, distinct laser arms
-        too_many_lines = True
-        threshold = 200
-        while too_many_lines:
-            lines = cv2.HoughLinesP(
-                red_mask, 
-                rho=1, 
-                theta=np.pi/180, 
-                threshold=threshold, 
-                minLineLength=50, 
-                maxLineGap=200 # Bridge the massive white gap in the center
-            )
-
-            if lines is None:
-                #print("No cross arms detected.")
-                return output_img
-
-            if threshold > 600:
-                #print("Too many lines detected, even with high threshold. Consider adjusting parameters.")
-                return output_img
-            if len(lines) > 30:
-                threshold += 10
-            else:
-                too_many_lines = False
-
-        # 6. Group coordinates by orientation
-        v_coords_x = []
-        h_coords_y = []
-
-        v_lines = []
-        h_lines = []
-        
-        for line in lines:
-            x1, y1, x2, y2 = line[0]
-            angle = np.abs(np.arctan2(y2 - y1, x2 - x1) * 180.0 / np.pi)
-
-            # Is it a vertical arm? (Angle near 90 degrees)
-            if 70 < angle < 110:
-                v_coords_x.extend([x1, x2])
-                v_lines.append((x1, y1, x2, y2))
-                
-                cv2.line(output_img, (x1, y1), (x2, y2), (255, 0, 0), 1)
-            # Is it a horizontal arm? (Angle near 0 or 180 degrees)
-            elif angle < 20 or angle > 160:
-                h_coords_y.extend([y1, y2])
-                h_lines.append((x1, y1, x2, y2))
-
-                cv2.line(output_img, (x1, y1), (x2, y2), (255, 255, 0), 1)
-
-        not_enough_h_lines = False
-        if len(h_lines) < 2:
-            not_enough_h_lines = True
-        if len(v_lines) < 4: # vertical lines are the one that give us the focal depth, without them we are basically lost, so we require at least 4 to be able to find the gap between them
-            #print("Not enough lines detected to determine cross center.")
-            return output_img
-
-        # 7. Calculate the Median Intersection as a first guess for the center (Median is more robust to outliers than mean)
-        # The median naturally ignores outliers (like a false line detected on the glare edge)
-        center_x_guess, center_y_guess = None, None
-        
-        if v_coords_x:
-            center_x_guess = int(np.median(v_coords_x))
-        else:
-            #print("No vertical lines detected.")
-            return None
-        if not not_enough_h_lines and h_coords_y:
-            center_y_guess = int(np.median(h_coords_y))
-        else:
-            #print("No horizontal lines detected.")
-            return None
-
-        #8. Calculate all intersactions of vertical and horizontal lines that are close to the median guess (within 20 pixels), and use these to refine the center guess
-        close_v_lines = [line for line in v_lines if abs(line[0] - center_x_guess) < 20 or abs(line[2] - center_x_guess) < 20]
-        if not not_enough_h_lines:
-            close_h_lines = [line for line in h_lines if abs(line[1] - center_y_guess) < 20 or abs(line[3] - center_y_guess) < 20]
-
-        intersections_x = []
-        intersections_y = []
-        # for v_line in close_v_lines:
-        #     for h_line in close_h_lines:
-        #         x_inter,y_inter = get_intersection(v_line, h_line)
-                
-        #         intersections_x.append(x_inter)
-        #         intersections_y.append(y_inter)
-
-
-        #get the lines closest to the gap
-        #get closest vertical lines
-        for i, v_line in enumerate(close_v_lines):
-            h_line = (0, center_y_guess, img.shape[1], center_y_guess) # A horizontal line through the center guess
-
-            x_inter,y_inter = self.get_intersection(v_line, h_line)
-            intersections_x.append([x_inter,i])
-        
-        sorted_x = sorted(intersections_x)
-        gaps = [sorted_x[i+1][0] - sorted_x[i][0] for i in range(len(sorted_x)-1)]
-        max_gap_index = np.argmax(gaps)
-
-        v_line_1 = close_v_lines[sorted_x[max_gap_index][1]]
-        v_line_2 = close_v_lines[sorted_x[max_gap_index + 1][1]]
-        
-        #get closest horizontal lines
-        if not not_enough_h_lines:
-            for i,h_line in enumerate(close_h_lines):
-                v_line =(center_x_guess, 0, center_x_guess, img.shape[0]) # A vertical line through the center guess
-
-                x_inter,y_inter = self.get_intersection(v_line, h_line)
-                intersections_y.append([y_inter,i])
-            sorted_y = sorted(intersections_y)
-            gaps = [sorted_y[i+1][0] - sorted_y[i][0] for i in range(len(sorted_y)-1)]
-            max_gap_index = np.argmax(gaps)
-            
-            h_line_1 = close_h_lines[sorted_y[max_gap_index][1]]
-            h_line_2 = close_h_lines[sorted_y[max_gap_index + 1][1]]
-        
-            #find the intersections of the closest lines to get a refined center guess
-            intersections_x = []
-            intersections_y = []
-            for v_line in [v_line_1, v_line_2]:
-                for h_line in [h_line_1, h_line_2]:
-                    x_inter,y_inter = self.get_intersection(v_line, h_line)
-                    
-                    intersections_x.append(x_inter)
-                    intersections_y.append(y_inter)
-
-            for line in [v_line_1, v_line_2, h_line_1, h_line_2]:
-                x1, y1, x2, y2 = line
-                cv2.line(output_img, (x1, y1), (x2, y2), (0, 0, 255), 2)
-
-            # 9. Refine the center guess by taking the median of these intersections
-            center_x_guess = int(np.mean(intersections_x))
-            center_y_guess = int(np.mean(intersections_y))
-        
-        else: #no h_lines, only guess based on v_lines
-            for v_line in [v_line_1, v_line_2]:
-                center_x_guess = int((v_line[0] + v_line[2]) / 2)
-
-  
-        # 10. Draw the final result
-        if center_x_guess is not None and center_y_guess is not None:
-            center = (center_x_guess, center_y_guess)
-            
-            
-            # Draw a bright green crosshair over the calculated center
-            # cv2.circle(output_img, center, 8, (0, 255, 0), -1)
-            cv2.line(output_img, (center_x_guess - 30, center_y_guess), (center_x_guess + 30, center_y_guess), (0, 255, 0), 2)
-            cv2.line(output_img, (center_x_guess, center_y_guess - 30), (center_x_guess, center_y_guess + 30), (0, 255, 0), 2)
-            
-            #print(f"Precise cross center found at: {center}")
-
-        return output_img
-    
-    def get_intersection(self, line1, line2):
-        """
-        Calculates the intersection point of two infinite lines.
-        Line 1 is defined by (x1, y1) and (x2, y2).
-        Line 2 is defined by (x3, y3) and (x4, y4).
-        """
-
-        x1, y1, x2, y2 = line1
-        x3, y3, x4, y4 = line2
-        # 1. Calculate the denominator
-        d = (x1 - x2) * (y3 - y4) - (y1 - y2) * (x3 - x4)
-        
-        # 2. Check for parallel lines (denominator is 0)
-        if d == 0:
-            return None, None # Or raise an exception, depending on your needs
-            
-        # 3. Pre-calculate the cross products to avoid repeating operations
-        cross_12 = (x1 * y2 - y1 * x2)
-        cross_34 = (x3 * y4 - y3 * x4)
-        
-        # 4. Calculate the intersection point
-        x_inter = (cross_12 * (x3 - x4) - (x1 - x2) * cross_34) / d
-        y_inter = (cross_12 * (y3 - y4) - (y1 - y2) * cross_34) / d
-        
-        return x_inter, y_inter
 
 class SignalEmitter(QObject):
     log_signal = pyqtSignal(str)
+    detection_signal = pyqtSignal(object)
+    recording_signal = pyqtSignal(bool)
@@ -0,0 +1,525 @@
+import threading
+import cv2
+import numpy as np
+
+class CrossDetection():
+    """
+    Result of a laser cross detection in pixel coordinates of the captured (not flipped) frame.
+    """
+    def __init__(self, center=None, v_lines=None, h_lines=None, arm_lines=None, confidence=0.0, frame_id=-1, timestamp=None, frame_size=None):
+        self.center = center  # (x, y) of the cross center, None if no cross was found
+        self.v_lines = v_lines if v_lines is not None else []  # (x1, y1, x2, y2) of all detected vertical line pieces
+        self.h_lines = h_lines if h_lines is not None else []  # (x1, y1, x2, y2) of all detected horizontal line pieces
+        self.arm_lines = arm_lines if arm_lines is not None else []  # the lines at the gap the center was calculated from
+        self.confidence = confidence  # 0..1, share of the detected lines that belong to the cross
+        self.frame_id = frame_id  # CameraFrame the detection was made on
+        self.timestamp = timestamp
+        self.frame_size = frame_size  # (width, height) of the frame
+        self.roi = None  # (x0, y0, x1, y1) of the searched window, None for the full frame
+        self.threshold = None  # Hough threshold the lines were found with
+
+    def shift(self, dx, dy):
+        """
+        Move all coordinates by (dx, dy), e.g. from a window to the full frame.
+        """
+        shift_line = lambda line: (line[0]+dx, line[1]+dy, line[2]+dx, line[3]+dy)
+        self.v_lines = [shift_line(line) for line in self.v_lines]
+        self.h_lines = [shift_line(line) for line in self.h_lines]
+        self.arm_lines = [shift_line(line) for line in self.arm_lines]
+        if self.center is not None:
+            self.center = (self.center[0]+dx, self.center[1]+dy)
+
+    @property
+    def found(self):
+        return self.center is not None
+
+    @property
+    def arm_gap(self):
+        """
+        Distance in pixels between the two vertical arm lines at the height of the center, None if it is unknown.
+        The gap changes with the focal depth, it is the metric of the autofocus.
+        """
+        if self.center is None or len(self.arm_lines) < 4:
+            return None
+        positions = line_intersections(np.array(self.arm_lines[:2]), (0, self.center[1], 1, self.center[1]))[:, 0]
+        if not np.isfinite(positions).all():
+            return None
+        return float(abs(positions[1] - positions[0]))
+
+
+def line_angles(lines):
+    """
+    Absolute angles in degrees (0..180) of an (N, 4) array of lines (x1, y1, x2, y2).
+    """
+    lines = np.asarray(lines, dtype=np.float64).reshape(-1, 4)
+    return np.abs(np.degrees(np.arctan2(lines[:, 3] - lines[:, 1], lines[:, 2] - lines[:, 0])))
+
+
+def classify_lines(lines, tolerance=20):
+    """
+    Masks of the vertical (angle near 90 degrees) and horizontal (near 0 or 180 degrees) lines.
+    """
+    angles = line_angles(lines)
+    vertical = np.abs(angles - 90) < tolerance
+    horizontal = (angles < tolerance) | (angles > 180 - tolerance)
+    return vertical, horizontal
+
+
+def line_intersections(lines1, lines2):
+    """
+    Intersection points of infinite lines, each defined by (x1, y1, x2, y2).
+    The arrays are broadcast against each other like numpy arrays of shape (..., 4), e.g. (N, 4) and (4,) gives the
+    intersections of N lines with one line, (N, 1, 4) and (1, M, 4) the intersections of every pair.
+    :return: array of shape (..., 2), nan for parallel lines
+    """
+    lines1 = np.asarray(lines1, dtype=np.float64)
+    lines2 = np.asarray(lines2, dtype=np.float64)
+    x1, y1, x2, y2 = lines1[..., 0], lines1[..., 1], lines1[..., 2], lines1[..., 3]
+    x3, y3, x4, y4 = lines2[..., 0], lines2[..., 1], lines2[..., 2], lines2[..., 3]
+    d = (x1 - x2) * (y3 - y4) - (y1 - y2) * (x3 - x4)
+    d = np.where(d == 0, np.nan, d)  # parallel lines
+    cross_12 = x1 * y2 - y1 * x2
+    cross_34 = x3 * y4 - y3 * x4
+    intersections = np.empty(d.shape + (2,))
+    intersections[..., 0] = (cross_12 * (x3 - x4) - (x1 - x2) * cross_34) / d
+    intersections[..., 1] = (cross_12 * (y3 - y4) - (y1 - y2) * cross_34) / d
+    return intersections
+
+
+def largest_gap(positions):
+    """
+    Indices of the two neighbouring positions with the largest gap between them.
+    """
+    order = np.argsort(positions, kind='stable')
+    i = int(np.argmax(np.diff(positions[order])))
+    return order[i], order[i+1]
+
+
+def line_support(mask, lines):
+    """
+    Number of mask pixels along each line piece, sampled in steps of about one pixel.
+    """
+    height, width = mask.shape[:2]
+    lines = np.asarray(lines, dtype=np.float64).reshape(-1, 4)
+    if len(lines) == 0:
+        return np.zeros(0)
+    lengths = np.hypot(lines[:, 2] - lines[:, 0], lines[:, 3] - lines[:, 1])
+    samples = int(np.ceil(lengths.max())) + 1
+    t = np.linspace(0.0, 1.0, samples)
+    x = np.clip(np.rint(lines[:, 0, None] + (lines[:, 2] - lines[:, 0])[:, None]*t), 0, width - 1).astype(np.intp)
+    y = np.clip(np.rint(lines[:, 1, None] + (lines[:, 3] - lines[:, 1])[:, None]*t), 0, height - 1).astype(np.intp)
+    # shorter pieces are sampled more densely, the step length converts the hits back to pixels
+    return np.count_nonzero(mask[y, x], axis=1)*lengths/max(samples - 1, 1)
+
+
+class LaserCrossDetector():
+    """
+    Finds the center of the red laser cross: red mask in HSV, line pieces with one pass of the probabilistic Hough
+    transform, clusters of these pieces by orientation and offset, then the two vertical and two horizontal lines at the
+    gap in the middle of the cross.
+    """
+    def __init__(self, hough_threshold=80, line_budget=30):
+        # We use a high Saturation threshold (>100) to ignore the white glare completely
+        # We use a high Value threshold (>100) to ignore dark red background noise
+        self.red_ranges = [(np.array([0, 100, 100]), np.array([10, 255, 255])),
+                           (np.array([160, 100, 100]), np.array([180, 255, 255]))]
+        self.kernel = np.ones((3,3), np.uint8)
+        self.hough_threshold = hough_threshold  # votes for a line piece, low on purpose, the clustering picks the arms
+        self.line_budget = line_budget  # line clusters that are considered for the cross
+        self.max_candidates = 500  # line pieces of the Hough pass that are clustered, the longest are kept
+        self.merge_distance = 1  # pixels, line pieces with the same angle and closer offsets are one cluster
+        self.min_support = 0.8  # share of the support of the strongest cluster of an orientation that an arm line needs
+        self.min_support_share = 0.45  # share of the image height (vertical) or width (horizontal) an arm line needs at least
+        self.close_distance = 20  # pixels, lines further from the median guess are not part of the cross
+
+    def reset(self):
+        pass
+
+    def red_mask(self, img, clean=True):
+        """
+        :param clean: remove specks with a morphological opening. Thin lines of downscaled images would vanish with it
+        """
+        hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
+        red_mask = None
+        for lower, upper in self.red_ranges:
+            mask = cv2.inRange(hsv, lower, upper)
+            red_mask = mask if red_mask is None else red_mask | mask
+        if not clean:
+            return red_mask
+        # Clean up the mask to remove tiny specks of noise
+        return cv2.morphologyEx(red_mask, cv2.MORPH_OPEN, self.kernel)
+
+    def hough_lines(self, red_mask, threshold=None):
+        """
+        Line pieces of the mask, found in a single pass.
+        :param threshold: Hough threshold, hough_threshold if None
+        :return: (N, 4) array of (x1, y1, x2, y2), at most max_candidates of the longest, None if there are no lines.
+        And the threshold they were found with
+        """
+        # minLineLength=50 ensures we only care about long, distinct laser arms
+        threshold = self.hough_threshold if threshold is None else threshold
+        lines = cv2.HoughLinesP(red_mask, rho=1, theta=np.pi/180, threshold=threshold,
+                                minLineLength=50, maxLineGap=200)  # Bridge the massive white gap in the center
+        if lines is None:
+            return None, threshold
+        lines = lines.reshape(-1, 4)  # (N,1,4) in OpenCV 4, (N,4) in OpenCV 5
+        if len(lines) > self.max_candidates:
+            lengths = np.hypot(lines[:, 2] - lines[:, 0], lines[:, 3] - lines[:, 1])
+            lines = lines[np.argsort(-lengths, kind='stable')[:self.max_candidates]]
+        return lines, threshold
+
+    def cluster_lines(self, lines, support, width, height):
+        """
+        Merges redundant line pieces and keeps the line_budget strongest clusters.
+        The pieces are binned by angle (the 1 degree resolution of the Hough transform) and by the offset where they
+        cross the middle of the image (merge_distance bins); the piece with the most support represents its bin.
+        :param support: mask pixels along each piece, see line_support
+        :return: the representative lines and their support, strongest first
+        """
+        vertical, horizontal = classify_lines(lines)
+        keep = vertical | horizontal
+        lines, support, vertical = lines[keep], support[keep], vertical[keep]
+        # vertical lines are measured at the middle row, horizontal lines at the middle column
+        crossing = np.where(vertical[:, None], [0, height/2, width, height/2], [width/2, 0, width/2, height])
+        offsets = np.where(vertical, *line_intersections(lines, crossing).T)
+        keys = np.stack([vertical, np.rint(line_angles(lines)) % 180, np.floor(offsets/self.merge_distance)], axis=1)
+        # np.unique returns the first occurrence of each bin, which is the strongest one after sorting by support
+        order = np.argsort(-support, kind='stable')
+        _, first = np.unique(keys[order], axis=0, return_index=True)
+        strongest = order[np.sort(first)][:self.line_budget]
+        return lines[strongest], support[strongest]
+
+    def detect(self, img, threshold=None):
+        """
+        :param img: BGR image
+        :param threshold: Hough threshold, see hough_lines
+        :return: CrossDetection, its center is None if no cross was found
+        """
+        height, width = img.shape[:2]
+        result = CrossDetection(frame_size=(width, height))
+        red_mask = self.red_mask(img)
+        lines, result.threshold = self.hough_lines(red_mask, threshold)
+        if lines is None:
+            return result
+        lines, support = self.cluster_lines(lines, line_support(red_mask, lines), width, height)
+
+        # Group by orientation, only the clusters almost as strong as the strongest one of their orientation are kept.
+        # This takes the place of a Hough threshold that is raised until only the lines of the cross are left.
+        # Without a cross the strongest cluster is noise, the absolute minimum keeps it from counting as an arm
+        vertical, horizontal = classify_lines(lines)
+        vertical &= support >= self.min_support_share*height
+        horizontal &= support >= self.min_support_share*width
+        if vertical.any():
+            vertical &= support >= self.min_support*support[vertical].max()
+        if horizontal.any():
+            horizontal &= support >= self.min_support*support[horizontal].max()
+        v_lines, h_lines = lines[vertical], lines[horizontal]
+        result.v_lines = [tuple(line) for line in v_lines.tolist()]
+        result.h_lines = [tuple(line) for line in h_lines.tolist()]
+
+        # vertical lines are the ones that give us the focal depth, without them we are basically lost,
+        # so we require at least 4 to be able to find the gap between them
+        if len(h_lines) < 2 or len(v_lines) < 4:
+            return result
+
+        # Median of the line ends as a first guess for the center (Median is more robust to outliers than mean)
+        center_x_guess = int(np.median(v_lines[:, [0, 2]]))
+        center_y_guess = int(np.median(h_lines[:, [1, 3]]))
+
+        # Lines with an end close to the median guess
+        close_v_lines = v_lines[(np.abs(v_lines[:, [0, 2]] - center_x_guess) < self.close_distance).any(axis=1)]
+        close_h_lines = h_lines[(np.abs(h_lines[:, [1, 3]] - center_y_guess) < self.close_distance).any(axis=1)]
+        if len(close_v_lines) < 2 or len(close_h_lines) < 2:
+            return result
+
+        # the lines on both sides of the largest gap between the close lines are the edges of the cross arms
+        v_gap_lines = self.gap_lines(close_v_lines, (0, center_y_guess, img.shape[1], center_y_guess), 0)
+        h_gap_lines = self.gap_lines(close_h_lines, (center_x_guess, 0, center_x_guess, img.shape[0]), 1)
+
+        # the center is the mean of the intersections of the gap lines
+        intersections = line_intersections(v_gap_lines[:, None], h_gap_lines[None, :])
+        center = intersections.reshape(-1, 2).mean(axis=0)
+        if not np.isfinite(center).all():
+            return result
+        result.center = (float(center[0]), float(center[1]))
+        result.arm_lines = [tuple(line) for line in np.concatenate([v_gap_lines, h_gap_lines]).tolist()]
+        result.confidence = (len(close_v_lines) + len(close_h_lines)) / (len(v_lines) + len(h_lines))
+        return result
+
+    @staticmethod
+    def gap_lines(lines, crossing_line, axis):
+        """
+        The two neighbouring lines with the largest gap between them, measured along crossing_line.
+        :param lines: (N, 4) array
+        :param axis: 0 to measure the gap in x, 1 in y
+        :return: (2, 4) array
+        """
+        positions = line_intersections(lines, crossing_line)[:, axis]
+        return lines[list(largest_gap(positions))]
+
+
+class TrackingCrossDetector():
+    """
+    Searches the cross only in a window around the last center. If it is lost, the window grows until it covers
+    the frame, which is the full frame detection of the wrapped detector.
+    The window size that worked last time is the start of the next search.
+    """
+    def __init__(self, detector=None, roi_size=320, growth=1.5, shrink_after=30):
+        self.detector = detector if detector is not None else LaserCrossDetector()
+        self.roi_size = roi_size  # edge length in pixels of the smallest window around the last center
+        self.growth = growth  # factor the window grows by after a failed search
+        self.shrink_after = shrink_after  # successful frames after which a smaller window is tried again
+        self.min_threshold = 30
+        self.reset()
+
+    def reset(self):
+        self.center = None
+        self.size = self.roi_size
+        self.successes = 0
+
+    def window_threshold(self, window_edge, frame_edge):
+        # fewer mask pixels lie on a line inside the window, so the threshold is scaled with the window size
+        return max(int(self.detector.hough_threshold*window_edge/frame_edge), self.min_threshold)
+
+    def detect(self, img):
+        height, width = img.shape[:2]
+        if self.center is not None:
+            if self.successes >= self.shrink_after and self.size > self.roi_size:
+                self.size = max(self.size/self.growth, self.roi_size)
+                self.successes = 0
+            while self.size < max(width, height):
+                size = int(self.size)
+                x0 = int(np.clip(self.center[0] - size/2, 0, max(width - size, 0)))
+                y0 = int(np.clip(self.center[1] - size/2, 0, max(height - size, 0)))
+                x1, y1 = min(x0 + size, width), min(y0 + size, height)
+                threshold = self.window_threshold(min(x1 - x0, y1 - y0), min(width, height))
+                result = self.detector.detect(img[y0:y1, x0:x1], threshold)
+                if result.found:
+                    result.shift(x0, y0)
+                    result.frame_size = (width, height)
+                    result.roi = (x0, y0, x1, y1)
+                    self.center = result.center
+                    self.successes += 1
+                    return result
+                self.size *= self.growth
+                self.successes = 0
+
+        # not tracked yet or lost: full frame
+        result = self.detector.detect(img)
+        self.center = result.center
+        self.size = self.roi_size
+        self.successes = 0
+        return result
+
+
+class PyramidCrossDetector():
+    """
+    Coarse to fine cross detection with a runtime that does not depend on the image content:
+    the arms are located in the column and row profiles of the red mask of a downscaled image,
+    then a straight line is fitted (least squares) through the centers of each arm in a band at full resolution.
+    The center is the intersection of the two fitted lines, with sub-pixel resolution.
+    """
+    def __init__(self, coarse_width=160, min_coverage=0.2):
+        self.mask_detector = LaserCrossDetector()  # red mask with the same color ranges
+        self.coarse_width = coarse_width  # approximate width of the downscaled image
+        self.min_coverage = min_coverage  # share of the rows (columns) an arm has to cover
+        self.outlier_distance = 2.5  # in standard deviations of the first fit
+        self.core_level = 0.7  # share between background and maximum brightness of a row that belongs to the arm core
+
+    def reset(self):
+        pass
+
+    @staticmethod
+    def profile_peak(profile):
+        """
+        Position and width at half maximum of the highest peak of a (smoothed) profile.
+        """
+        peak = int(np.argmax(profile))
+        above = profile >= profile[peak]/2
+        left = peak
+        while left > 0 and above[left-1]:
+            left -= 1
+        right = peak
+        while right < len(profile)-1 and above[right+1]:
+            right += 1
+        return peak, right-left+1
+
+    def fit_line(self, u, v):
+        """
+        Least squares fit v = slope*u + offset. Points further than outlier_distance standard deviations
+        (at least one pixel) are removed and the line is fitted again, a fixed number of times.
+        """
+        inliers = np.ones(len(u), dtype=bool)
+        for _ in range(3):
+            slope, offset = np.polyfit(u[inliers], v[inliers], 1)
+            residuals = np.abs(v - (slope*u + offset))
+            new_inliers = residuals <= max(self.outlier_distance*residuals[inliers].std(), 1.0)
+            if new_inliers.sum() < 2 or np.array_equal(new_inliers, inliers):
+                break
+            inliers = new_inliers
+        return slope, offset
+
+    def arm_profile(self, img, axis, position, half_width, exclude_position, exclude_half_width):
+        """
+        Center of one arm at every row (column) it covers, in a band at full resolution.
+        The center is the middle of the saturated core: the run of pixels around the brightest one of the row whose
+        brightness is above core_level between the median of the row (background) and its maximum. The red glow around
+        the core is not symmetric, a centroid of the red pixels would be pulled towards it.
+        :param axis: 0 for the vertical arm (band of columns), 1 for the horizontal arm (band of rows)
+        :param exclude_position, exclude_half_width: the other arm crosses the band there, these rows (columns) are left out
+        :return: coordinates along the arm, arm center across, covered share of the arm length
+        """
+        length = img.shape[0] if axis == 0 else img.shape[1]
+        start = int(max(position - half_width, 0))
+        end = int(min(position + half_width + 1, img.shape[1] if axis == 0 else img.shape[0]))
+        band = img[:, start:end] if axis == 0 else img[start:end, :]
+        red = self.mask_detector.red_mask(band) > 0
+        brightness = band.sum(axis=2, dtype=np.float32)
+        if axis == 1:
+            red, brightness = red.T, brightness.T  # rows are along the arm
+        along = np.flatnonzero(red.any(axis=1))
+        along = along[np.abs(along - exclude_position) > exclude_half_width]
+        brightness = brightness[along]
+
+        background = np.median(brightness, axis=1)
+        level = background + self.core_level*(brightness.max(axis=1) - background)
+        outside = brightness < level[:, None]
+        peak = np.argmax(brightness, axis=1)
+        index = np.arange(brightness.shape[1])
+        rows = np.arange(len(along))
+        # the run around the peak ends at the last pixel outside the core before it and the first one after it
+        last_outside = np.maximum.accumulate(np.where(outside, index, -1), axis=1)[rows, peak]
+        next_outside = np.minimum.accumulate(np.where(outside, index, len(index))[:, ::-1], axis=1)[:, ::-1][rows, peak]
+        across = start + (last_outside + next_outside)/2
+        coverage = len(along)/max(length - 2*exclude_half_width, 1)
+        return along.astype(np.float64), across, coverage
+
+    def detect(self, img, threshold=None):
+        """
+        :param threshold: not used, for the same interface as LaserCrossDetector
+        """
+        height, width = img.shape[:2]
+        result = CrossDetection(frame_size=(width, height))
+
+        # coarse: the arms are the highest peaks of the red share per column and row
+        coarse = img
+        for _ in range(max(int(np.log2(width/self.coarse_width)), 0)):
+            coarse = cv2.pyrDown(coarse)
+        scale = width/coarse.shape[1]
+        mask = self.mask_detector.red_mask(coarse, clean=False) > 0
+        kernel = np.array([0.25, 0.5, 0.25])
+        column_profile = np.convolve(mask.mean(axis=0), kernel, mode='same')
+        row_profile = np.convolve(mask.mean(axis=1), kernel, mode='same')
+        cx, v_width = self.profile_peak(column_profile)
+        cy, h_width = self.profile_peak(row_profile)
+        if column_profile[cx] < self.min_coverage or row_profile[cy] < self.min_coverage:
+            return result
+        cx, cy = (cx + 0.5)*scale, (cy + 0.5)*scale
+        v_half_width, h_half_width = (v_width/2 + 2)*scale, (h_width/2 + 2)*scale
+
+        # fine: fit a line through the centers of each arm at full resolution
+        v_along, v_across, v_coverage = self.arm_profile(img, 0, cx, v_half_width, cy, h_half_width)
+        h_along, h_across, h_coverage = self.arm_profile(img, 1, cy, h_half_width, cx, v_half_width)
+        if v_coverage < self.min_coverage or h_coverage < self.min_coverage or len(v_along) < 2 or len(h_along) < 2:
+            return result
+        a, b = self.fit_line(v_along, v_across)  # x = a*y + b
+        c, d = self.fit_line(h_along, h_across)  # y = c*x + d
+        x = (a*d + b)/(1 - a*c)
+        result.center = (float(x), float(c*x + d))
+        result.arm_lines = [(b, 0, a*(height-1) + b, height-1), (0, d, width-1, c*(width-1) + d)]
+        result.confidence = float(min(v_coverage, h_coverage, 1.0))
+        return result
+
+
+def create_cross_detector(settings):
+    """
+    Cross detector as configured in laser_camera.cross_detection.
+    """
+    mode = settings.get("laser_camera.cross_detection.mode", "tracking")
+    if mode == "pyramid":
+        return PyramidCrossDetector()
+    detector = LaserCrossDetector(hough_threshold=settings.get("laser_camera.cross_detection.hough_threshold", 80),
+                                  line_budget=settings.get("laser_camera.cross_detection.line_budget", 30))
+    if mode == "tracking":
+        return TrackingCrossDetector(detector, roi_size=settings.get("laser_camera.cross_detection.roi_size", 320))
+    return detector
+
+
+class CrossDetectionWorker():
+    """
+    Runs a cross detector on the frames of a camera in its own thread.
+    The worker always takes the newest frame of the camera's ring buffer, frames that arrive while it is busy are skipped.
+    Every result is published to the result callbacks (in the worker thread) and kept as latest_result.
+    """
+    def __init__(self, camera_controller, detector=None):
+        self.camera_controller = camera_controller
+        self.detector = detector if detector is not None else LaserCrossDetector()
+        self.latest_result = None
+        self.frames_processed = 0
+        self.frames_skipped = 0
+        self.thread = None
+        self._stop = threading.Event()
+        self._last_log = ''
+
+        # Callbacks for GUI updates
+        self.result_callbacks = []
+        self.log_callbacks = []
+
+    @property
+    def last_log(self):
+        return self._last_log
+
+    @last_log.setter
+    def last_log(self, value):
+        self._last_log = value
+        for callback in self.log_callbacks:
+            callback(value)
+
+    def set_log_callback(self, callback):
+        self.log_callbacks.append(callback)
+
+    def set_result_callback(self, callback):
+        self.result_callbacks.append(callback)
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self._stop.clear()
+        self.latest_result = None
+        self.detector.reset()
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
+            self.thread = None
+        self.latest_result = None
+
+    def run(self):
+        last_frame_id = -1
+        while not self._stop.is_set():
+            frame = self.camera_controller.frames.wait_newer(last_frame_id, timeout=0.2)
+            if frame is None:
+                continue
+            if last_frame_id >= 0:
+                self.frames_skipped += frame.frame_id - last_frame_id - 1
+            last_frame_id = frame.frame_id
+            image = frame.image.copy()  # the capture thread reuses the buffer of the frame
+            try:
+                result = self.detector.detect(image)
+            except Exception as e:
+                self.last_log = f"Cross detection failed: {e}"
+                continue
+            result.frame_id = frame.frame_id
+            result.timestamp = frame.timestamp
+            self.frames_processed += 1
+            self.latest_result = result
+            for callback in self.result_callbacks:
+                callback(result)
@@ -0,0 +1,181 @@
+import sys
+import time
+import uuid
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+
+class BusFrame():
+    """
+    A frame read from a FrameBus, with the attributes of a CameraFrame. Worker processes import this module without
+    the camera controller and Qt.
+    """
+    def __init__(self, image, frame_id, timestamp):
+        self.image = image  # BGR image, a copy that belongs to the reader
+        self.frame_id = frame_id
+        self.timestamp = timestamp  # time.monotonic() of the capturing process when the frame was read
+
+
+class FrameBus():
+    """
+    Ring of camera frames in shared memory. The capture thread publishes every frame, any number of subscribers in
+    this or other processes read them by frame id, without pickling and without the capture thread waiting for them.
+    Subscribers in other processes attach with the name of the bus (FrameBus.attach(name)).
+
+    Memory layout: a header (newest frame id, slots, slot size, closed flag), per slot a sequence number, the frame id,
+    the image shape and the timestamp, then the image slots. Frame n is in slot n % slots.
+    The writer makes the sequence number of a slot odd while it writes and even when the frame is complete; a reader
+    copies the image and checks that the sequence number did not change, otherwise the frame was overwritten while
+    copying. There is only one writer, the capture thread of the camera.
+
+    Example of a worker process:
+        bus = FrameBus.attach(name)
+        frame_id = -1
+        while True:
+            frame = bus.wait_newer(frame_id, timeout=1.0)
+            if frame is None:
+                if bus.closed:
+                    break
+                continue
+            frame_id = frame.frame_id
+            ...  # work on frame.image
+        bus.close()
+    """
+    HEADER_FIELDS = 4  # newest frame id, slots, slot bytes, closed
+    SLOT_FIELDS = 5  # sequence number, frame id, height, width, channels
+
+    def __init__(self, memory, owner):
+        self.memory = memory
+        self.owner = owner  # the creating process unlinks the memory when it closes the bus
+        self.name = memory.name
+        self._header = np.ndarray((self.HEADER_FIELDS,), np.int64, memory.buf, 0)
+        self.slots, self.slot_bytes = int(self._header[1]), int(self._header[2])
+        offset = self._header.nbytes
+        self._slot_info = np.ndarray((self.slots, self.SLOT_FIELDS), np.int64, memory.buf, offset)
+        offset += self._slot_info.nbytes
+        self._slot_time = np.ndarray((self.slots,), np.float64, memory.buf, offset)
+        offset += self._slot_time.nbytes
+        offset = (offset + 63)//64*64  # images start at a cache line
+        self._images = np.ndarray((self.slots, self.slot_bytes), np.uint8, memory.buf, offset)
+
+    @staticmethod
+    def layout_bytes(slots, slot_bytes):
+        header = (FrameBus.HEADER_FIELDS + slots*FrameBus.SLOT_FIELDS + slots)*8
+        return (header + 63)//64*64 + slots*slot_bytes
+
+    @classmethod
+    def create(cls, slot_bytes, slots=8, name=None):
+        """
+        :param slot_bytes: size of the largest frame (height*width*channels)
+        :param slots: frames kept, a subscriber has to read a frame before slots newer frames arrived
+        """
+        name = name if name is not None else "frame_bus_" + uuid.uuid4().hex[:12]
+        memory = shared_memory.SharedMemory(name=name, create=True, size=cls.layout_bytes(slots, slot_bytes))
+        header = np.ndarray((cls.HEADER_FIELDS,), np.int64, memory.buf, 0)
+        header[:] = (-1, slots, slot_bytes, 0)
+        del header  # no view may be left when the memory is closed
+        bus = cls(memory, owner=True)
+        bus._slot_info[:] = 0
+        bus._slot_info[:, 1] = -1
+        return bus
+
+    @classmethod
+    def attach(cls, name):
+        # before python 3.13 an attaching process registers the memory with its resource tracker, which would unlink
+        # it when that process exits while the camera still uses it. Processes started by multiprocessing after the
+        # tracker of the camera process was running share it, the camera process unregisters the memory when it
+        # unlinks it. Other processes start a tracker of their own with the attach and have to unregister
+        own_tracker = False
+        if sys.platform != "win32" and sys.version_info < (3, 13):
+            from multiprocessing import resource_tracker
+            own_tracker = multiprocessing.parent_process() is None or resource_tracker._resource_tracker._fd is None
+        memory = shared_memory.SharedMemory(name=name)
+        if own_tracker:
+            resource_tracker.unregister(memory._name, "shared_memory")
+        return cls(memory, owner=False)
+
+    @property
+    def latest_id(self):
+        return int(self._header[0])
+
+    @property
+    def closed(self):
+        return self.memory is None or bool(self._header[3])
+
+    def fits(self, image):
+        return image.nbytes <= self.slot_bytes
+
+    def publish(self, image, frame_id, timestamp):
+        """
+        Write a frame, called by the capture thread only.
+        """
+        slot = frame_id % self.slots
+        info = self._slot_info[slot]
+        info[0] += 1  # odd: slot is being written
+        height, width = image.shape[:2]
+        channels = image.shape[2] if image.ndim == 3 else 1
+        self._images[slot, :image.nbytes] = np.ascontiguousarray(image).reshape(-1)
+        info[1:] = (frame_id, height, width, channels)
+        self._slot_time[slot] = timestamp
+        info[0] += 1  # even: slot is complete
+        self._header[0] = frame_id
+
+    def read(self, frame_id):
+        """
+        :return: BusFrame with a copy of frame frame_id, None if it is not (or no longer) in the ring
+        """
+        if frame_id < 0:
+            return None
+        slot = frame_id % self.slots
+        info = self._slot_info[slot]
+        sequence = int(info[0])
+        if sequence % 2 or int(info[1]) != frame_id:
+            return None
+        height, width, channels = (int(v) for v in info[2:5])
+        timestamp = float(self._slot_time[slot])
+        size = height*width*channels
+        image = self._images[slot, :size].copy()
+        if int(info[0]) != sequence:
+            return None  # overwritten while copying
+        return BusFrame(image.reshape((height, width, channels) if channels > 1 else (height, width)), frame_id, timestamp)
+
+    def latest(self):
+        frame_id = self.latest_id
+        return self.read(frame_id)
+
+    def wait_newer(self, frame_id, timeout=None, poll_interval=0.001):
+        """
+        Wait for a frame newer than frame_id. Across processes there is no condition to wait on, the newest frame id
+        is polled.
+        :param frame_id: id of the last frame the subscriber has seen, -1 for any frame
+        :return: newest BusFrame or None on timeout or when the bus was closed
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.closed:
+            latest_id = self.latest_id
+            if latest_id > frame_id:
+                frame = self.read(latest_id)
+                if frame is not None:
+                    return frame
+                continue  # overwritten while reading, the next one is newer
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            time.sleep(poll_interval)
+        return None
+
+    def close(self):
+        """
+        Release the memory of this process, the creating process also marks the bus as closed and removes it.
+        """
+        if self.memory is None:
+            return
+        if self.owner:
+            self._header[3] = 1
+        del self._header, self._slot_info, self._slot_time, self._images
+        self.memory.close()
+        if self.owner:
+            try:
+                self.memory.unlink()
+            except FileNotFoundError:
+                pass
+        self.memory = None
@@ -0,0 +1,288 @@
+import csv
+import datetime
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import cv2
+from Frame_Bus import FrameBus
+
+def encode_frames(frame_queue, status_queue, handled, directory, output_format, codec, fps, image_format):
+    """
+    Runs in the encoder process: writes the frames of the queue to a video or an image sequence in directory and
+    their tags to frames.csv, until None is received.
+    Queue items are (image, tags), tags is a dict with frame_id, time, x, y, z. If the image is None, the frame is read
+    from the frame bus tags["bus"] and flipped by tags["flip"] (cv2.flip code or None), it is lost if it was
+    overwritten in the meantime.
+    handled counts the items taken from the queue, -1 until the encoder is ready.
+    """
+    count = 0
+    lost = 0
+    writer = None
+    bus = None
+    try:
+        with open(os.path.join(directory, "frames.csv"), 'w', newline='') as f:
+            table = csv.writer(f)
+            table.writerow(["index", "frame_id", "time", "x", "y", "z"])
+            handled.value = 0
+            while True:
+                item = frame_queue.get()
+                if item is None:
+                    break
+                handled.value += 1
+                image, tags = item
+                if image is None:
+                    if bus is None or bus.name != tags["bus"]:
+                        if bus is not None:
+                            bus.close()
+                        bus = FrameBus.attach(tags["bus"])
+                    frame = bus.read(tags["frame_id"])
+                    if frame is None:
+                        lost += 1
+                        continue
+                    image = frame.image if tags["flip"] is None else cv2.flip(frame.image, tags["flip"])
+                if output_format == "video":
+                    if writer is None:
+                        height, width = image.shape[:2]
+                        writer = cv2.VideoWriter(os.path.join(directory, "video.mp4" if codec in ("mp4v", "avc1") else "video.avi"),
+                                                 cv2.VideoWriter_fourcc(*codec), fps, (width, height))
+                        if not writer.isOpened():
+                            raise Exception(f"Could not open a video writer with codec {codec}")
+                    writer.write(image)
+                else:
+                    cv2.imwrite(os.path.join(directory, f"frame_{count:06d}.{image_format}"), image)
+                table.writerow([count, tags["frame_id"], tags["time"], tags["x"], tags["y"], tags["z"]])
+                count += 1
+        status_queue.put(("done", (count, lost)))
+    except Exception as e:
+        status_queue.put(("error", f"{e} after {count} frames"))
+    finally:
+        if writer is not None:
+            writer.release()
+        if bus is not None:
+            bus.close()
+
+
+class FrameRecorder():
+    """
+    Records the frames of a camera with their time and the machine position.
+    A sampler thread takes the frames from the camera's ring buffer (every frame, or one every interval seconds for a
+    time-lapse), an encoder process writes them. With the camera's frame bus only the tags go through the queue and the
+    encoder reads the image from shared memory, otherwise the image is copied through the queue.
+    The capture thread and the GUI never wait for the recorder: if the encoder falls behind, frames are dropped and counted.
+    Every recording is a directory with video.mp4 (or the single images) and frames.csv.
+    """
+    def __init__(self, settings, camera_controller, artisan_controller=None):
+        self.s = settings
+        self.camera_controller = camera_controller
+        self.camera_type = camera_controller.camera_type
+        self.artisan_controller = artisan_controller
+        self.job_queue = None
+        self.thread = None  # sampler thread of the current recording
+        self._stop = threading.Event()  # of the current recording, a stopped recording may still be finishing
+        self._last_log = ''
+        self.directory = None  # of the current or last recording
+        self.job_recording = False  # the current recording was started by a job
+
+        # Callbacks for GUI updates
+        self.log_callbacks = []
+        self.recording_changed_callbacks = []
+
+        self.load_settings()
+        settings.settingChanged.connect(self.load_settings)  # Reload settings if they change
+        settings.settingsReplaced.connect(self.load_settings)  # Reload settings if they are replaced
+
+    def load_settings(self):
+        self.base_directory = self.s.get(self.camera_type + ".recording.directory", "")  # "" for recordings/ in the working directory
+        self.output_format = self.s.get(self.camera_type + ".recording.format", "video")  # "video" or "images"
+        self.codec = self.s.get(self.camera_type + ".recording.codec", "mp4v")  # FOURCC of the video
+        self.video_fps = self.s.get(self.camera_type + ".recording.video_fps", 30)  # playback frame rate of the video
+        self.image_format = self.s.get(self.camera_type + ".recording.image_format", "jpg")
+        self.timelapse_interval = self.s.get(self.camera_type + ".recording.timelapse_interval", 5.0)  # seconds
+        self.timelapse_jobs = self.s.get(self.camera_type + ".recording.timelapse_jobs", False)  # record every job as time-lapse
+        self.queue_size = 64  # frames waiting for the encoder
+
+    @property
+    def last_log(self):
+        return self._last_log
+
+    @last_log.setter
+    def last_log(self, value):
+        self._last_log = value
+        for callback in self.log_callbacks:
+            callback(value)
+
+    def set_log_callback(self, callback):
+        self.log_callbacks.append(callback)
+
+    def set_recording_changed_callback(self, callback):
+        """
+        :param callback: called with True when a recording starts and False when it ended
+        """
+        self.recording_changed_callbacks.append(callback)
+
+    @property
+    def recording(self):
+        """
+        True from start until stop. The encoder of a stopped recording may still be finishing, a new one can start anyway.
+        """
+        return self.thread is not None and self.thread.is_alive() and not self._stop.is_set()
+
+    def start(self, interval=0.0, name=None):
+        """
+        :param interval: seconds between two recorded frames, 0 records every frame
+        :param name: of the recording directory, the date and time if None
+        :return: directory of the recording or None
+        """
+        if self.recording:
+            self.last_log = "Recording is already running."
+            return None
+        if self.camera_controller.latest_frame() is None:
+            self.last_log = f"Recording needs a running {self.camera_type.replace('_', ' ')}."
+            return None
+        name = name if name is not None else datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        self.directory = os.path.join(self.base_directory or "recordings", f"{self.camera_type}_{name}")
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+        except OSError as e:
+            self.last_log = f"Could not create the recording directory: {e}"
+            return None
+
+        # tags (and frames the encoder cannot take from the frame bus) go to the encoder process through a queue
+        frame_queue = multiprocessing.Queue(self.queue_size)
+        status_queue = multiprocessing.Queue()
+        encoder_handled = multiprocessing.Value('q', -1)
+        encoder = multiprocessing.Process(target=encode_frames, args=(frame_queue, status_queue, encoder_handled, self.directory,
+                                                                      self.output_format, self.codec, self.video_fps, self.image_format))
+        encoder.daemon = True
+        encoder.start()
+
+        self._stop = threading.Event()
+        self.thread = threading.Thread(target=self.run, args=(self._stop, interval, frame_queue, status_queue, encoder_handled, encoder, self.directory))
+        self.thread.daemon = True
+        self.thread.start()
+        mode = f"time-lapse every {interval:g} s" if interval > 0 else "every frame"
+        self.last_log = f"Recording {mode} to {self.directory}."
+        for callback in self.recording_changed_callbacks:
+            callback(True)
+        return self.directory
+
+    def start_timelapse(self, name=None):
+        return self.start(self.timelapse_interval, name)
+
+    def stop(self):
+        self._stop.set()
+
+    def flip_code(self):
+        """
+        cv2.flip code of the camera's flips, None if the image is not flipped.
+        """
+        flip_vertical, flip_horizontal = self.camera_controller.flip_vertical, self.camera_controller.flip_horizontal
+        if flip_vertical and flip_horizontal:
+            return -1
+        if flip_vertical:
+            return 0
+        if flip_horizontal:
+            return 1
+        return None
+
+    def tags(self, frame):
+        """
+        Time (wall clock, seconds since the epoch) and the machine position (work coordinates) of a frame.
+        The position is the one tracked by the ArtisanController, reading it does not send a command.
+        """
+        position = [None, None, None]
+        if self.artisan_controller is not None and self.artisan_controller.connected:
+            position = list(self.artisan_controller.current_position)
+        return {"frame_id": frame.frame_id, "time": round(time.time() - (time.monotonic() - frame.timestamp), 3),
+                "x": position[0], "y": position[1], "z": position[2]}
+
+    def run(self, stop, interval, frame_queue, status_queue, encoder_handled, encoder, directory):
+        """
+        Runs in the sampler thread of a recording until stop is set.
+        """
+        frame_id = -1
+        next_sample = time.monotonic()
+        frames_sent = frames_dropped = 0
+        while not stop.is_set():
+            if interval > 0:
+                # time-lapse: wait until the next sample is due, then take the newest frame
+                if stop.wait(max(next_sample - time.monotonic(), 0)):
+                    break
+                next_sample += interval
+                frame = self.camera_controller.latest_frame(max_age=1.0)
+                if frame is None or frame.frame_id == frame_id:
+                    continue
+            else:
+                frame = self.camera_controller.frames.wait_newer(frame_id, timeout=0.5)
+                if frame is None:
+                    continue
+            frame_id = frame.frame_id
+            tags = self.tags(frame)
+            bus_name = self.camera_controller.frame_bus_name
+            if bus_name is not None and encoder_handled.value == frames_sent:
+                # the encoder is waiting and reads the frame from the bus before it is overwritten, it orients it as
+                # shown in the GUI. While it is busy the frames are copied, the queue holds more frames than the bus
+                image = None
+                tags["bus"] = bus_name
+                tags["flip"] = self.flip_code()
+            else:
+                image = self.camera_controller.orient(frame.image)  # a copy as shown in the GUI, the ring buffer slot is reused
+            try:
+                frame_queue.put_nowait((image, tags))
+                frames_sent += 1
+            except queue.Full:
+                frames_dropped += 1
+
+        frame_queue.put(None)
+        encoder.join(timeout=30)
+        try:
+            status, value = status_queue.get(timeout=1.0)
+        except queue.Empty:
+            status, value = "error", "the encoder did not finish"
+        if status == "done":
+            count, lost = value
+            frames_dropped += lost
+            dropped = f", {frames_dropped} dropped" if frames_dropped else ""
+            self.last_log = f"Recording finished: {count} frames{dropped} in {directory}."
+        else:
+            self.last_log = f"Recording failed: {value}."
+        if self.thread is threading.current_thread():
+            # no newer recording was started while this one was finishing
+            self.job_recording = False
+            for callback in self.recording_changed_callbacks:
+                callback(False)
+
+    def start_job_timelapse(self, name):
+        if self.timelapse_jobs and not self.recording:
+            if self.start_timelapse(name=name + "_" + datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")) is not None:
+                self.job_recording = True
+
+    def process_state_changed(self, state):
+        """
+        Process state callback of the ProcessHandler: with timelapse_jobs every process is recorded as a time-lapse.
+        The jobs of the JobQueue set with set_job_queue are recorded one by one by job_state_changed instead.
+        """
+        if self.job_queue is not None and self.job_queue.running:
+            return
+        if state == "Running":
+            self.start_job_timelapse("job")
+        elif state == "Idle" and self.job_recording:
+            self.stop()
+
+    def set_job_queue(self, job_queue):
+        """
+        Record every job of the queue as its own time-lapse, the process state stays Running for the whole queue.
+        """
+        self.job_queue = job_queue
+        job_queue.set_job_state_callback(self.job_state_changed)
+
+    def job_state_changed(self, job):
+        """
+        Job state callback of the JobQueue, called in the execution thread.
+        """
+        if job.state == "Running":
+            self.start_job_timelapse("job_" + "".join(c if c.isalnum() or c in "-_" else "_" for c in job.name))
+        elif job.state in ["Done", "Canceled", "Failed"] and self.job_recording:
+            self.stop()
@@ -1,7 +1,320 @@
+import os
+import threading
 import numpy as np
 from PyQt6 import QtWidgets, QtGui, QtCore
-from pyqtgraph.opengl import GLViewWidget,GLLinePlotItem
+from pyqtgraph.opengl import GLViewWidget,GLLinePlotItem,GLScatterPlotItem
+from pyqtgraph.opengl.items.GLLinePlotItem import DirtyFlag
 from OpenGL.GL import glDisable, GL_LIGHTING, glClearColor,glEnable, glBlendFunc, GL_BLEND, GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA
+from BaseClasses import SignalEmitter
+from Raster_Preview import RasterPreviewWidget
+
+G1_COLOR = (0, 0, 0, 1)
+G0_COLOR = (0.7, 0.7, 0.7, 0.5)
+G0_HIDDEN_COLOR = (1, 1, 1, 0)
+EXECUTED_RGB = (0.0, 0.45, 1.0)  # color of the executed part of the toolpath, the alpha of the moves is kept
+
+def build_vertex_buffer(motion, positions, show_moves=True, start_motion=0, start_position=(0,0,0), return_command_vertices=False):
+    """
+    Build the vertices and colors of a line strip from parsed moves without looping over the commands.
+    Where the motion switches between G0 and G1, two vertices are inserted at the switching position,
+    so the color changes sharply instead of blending over the next segment.
+    :param motion: motion of each command (0 for G0, 1 for G1, -1 for no move), e.g. GCodeMoves.motion
+    :param positions: (N,3) position after each command, e.g. GCodeMoves.positions
+    :param show_moves: if False, G0 moves are transparent
+    :param start_motion, start_position: state before the first command, to continue a previous chunk of the same file
+    :param return_command_vertices: also return the number of vertices up to and including each command
+    :return: positions (M,3) and colors (M,4) as float32 (and command vertices (N,))
+    """
+    is_move = motion >= 0
+    move_motion = motion[is_move]
+    move_positions = positions[is_move]
+    n = len(move_motion)
+    if n == 0:
+        empty = np.zeros((0,3), dtype=np.float32), np.zeros((0,4), dtype=np.float32)
+        return empty + (np.zeros(len(motion), dtype=np.int64),) if return_command_vertices else empty
+
+    palette = np.array([G0_COLOR if show_moves else G0_HIDDEN_COLOR, G1_COLOR], dtype=np.float32)
+    prev_motion = np.empty_like(move_motion)
+    prev_motion[0] = start_motion  # by default the plot starts like after a G0 move
+    prev_motion[1:] = move_motion[:-1]
+    prev_positions = np.empty_like(move_positions)
+    prev_positions[0] = start_position
+    prev_positions[1:] = move_positions[:-1]
+    transition = move_motion != prev_motion
+
+    # every move gets one vertex, plus two in front of it on a transition
+    counts = 1 + 2*transition
+    own_idx = np.cumsum(counts) - 1
+    transition_idx = own_idx[transition] - 2
+
+    vertices = np.empty((own_idx[-1]+1, 3), dtype=np.float32)
+    colors = np.empty((own_idx[-1]+1, 4), dtype=np.float32)
+    vertices[own_idx] = move_positions
+    colors[own_idx] = palette[move_motion]
+    vertices[transition_idx] = prev_positions[transition]
+    vertices[transition_idx+1] = prev_positions[transition]
+    colors[transition_idx] = palette[prev_motion[transition]]
+    colors[transition_idx+1] = palette[move_motion[transition]]
+    if return_command_vertices:
+        command_counts = np.zeros(len(motion), dtype=np.int64)
+        command_counts[is_move] = counts
+        return vertices, colors, np.cumsum(command_counts)
+    return vertices, colors
+
+def simplify_segments(vertices, colors, cell_size, mode='line_strip'):
+    """
+    Screen space simplification of a line plot for a given tolerance.
+    All endpoints are snapped to a grid of cell_size and segments that snap to the same cells with the same color
+    are drawn only once, no matter their direction. For a raster job, all hatch lines within one cell row collapse into one.
+    The error is at most one cell, so the result looks the same as long as a cell is smaller than a pixel.
+    :param vertices: (N,3) vertices
+    :param colors: (N,4) colors of the vertices
+    :param cell_size: grid size in mm
+    :param mode: 'line_strip' or 'lines', the mode of the input. The result is always 'lines'.
+    :return: vertices and colors of the simplified plot in 'lines' mode
+    """
+    if mode == 'line_strip':
+        starts, ends = np.arange(len(vertices)-1), np.arange(1, len(vertices))
+    else:
+        starts, ends = np.arange(0, len(vertices)-1, 2), np.arange(1, len(vertices), 2)
+    if len(starts) == 0:
+        return vertices[:0], colors[:0]
+
+    cells = np.floor(vertices/cell_size).astype(np.int32)
+    color_key = np.round(colors*255).astype(np.uint8).view(np.int32).ravel()
+    a, b = cells[starts], cells[ends]
+    # sort the endpoints of each segment so both directions give the same key
+    swap = (a[:, 0] > b[:, 0]) | ((a[:, 0] == b[:, 0]) & ((a[:, 1] > b[:, 1]) | ((a[:, 1] == b[:, 1]) & (a[:, 2] > b[:, 2]))))
+    a, b = np.where(swap[:, None], b, a), np.where(swap[:, None], a, b)
+    keys = np.column_stack([a, b, color_key[starts], color_key[ends]])
+    keys = np.ascontiguousarray(keys).view(np.dtype((np.void, keys.dtype.itemsize*keys.shape[1]))).ravel()
+    _, first = np.unique(keys, return_index=True)
+    first.sort()  # keep the drawing order
+
+    segment_vertices = np.empty((2*len(first), 3), dtype=np.float32)
+    segment_colors = np.empty((2*len(first), 4), dtype=np.float32)
+    segment_vertices[0::2], segment_vertices[1::2] = vertices[starts[first]], vertices[ends[first]]
+    segment_colors[0::2], segment_colors[1::2] = colors[starts[first]], colors[ends[first]]
+    return segment_vertices, segment_colors
+
+
+class ProgressLinePlotItem(GLLinePlotItem):
+    """
+    GLLinePlotItem whose colors can be changed in sub-ranges. Only the changed part of the color buffer is written
+    to the GPU on the next paint, instead of uploading all colors again.
+    """
+    def __init__(self, **kwds):
+        self._pending_color_ranges = []
+        super().__init__(**kwds)
+
+    def write_color_range(self, start, end):
+        """
+        Upload self.color[start:end] to the GPU. Change self.color in place before calling this.
+        """
+        if end > start and isinstance(self.color, np.ndarray):
+            self._pending_color_ranges.append((start, end))
+            self.update()
+
+    def paint(self):
+        # a full upload is pending anyway if the colors were replaced by setData
+        if self._pending_color_ranges and DirtyFlag.COLOR not in self.dirty_bits and self.m_vbo_color.isCreated():
+            self.m_vbo_color.bind()
+            for start, end in self._pending_color_ranges:
+                block = self.color[start:end]
+                self.m_vbo_color.write(start*block.itemsize*4, block, block.nbytes)
+            self.m_vbo_color.release()
+        self._pending_color_ranges = []
+        super().paint()
+
+
+def rotate_about_axis(points, axis_point, axis_direction, angle):
+    """
+    Rotate points about an axis (Rodrigues' rotation formula).
+    :param angle: angle in degrees, counterclockwise when looking against axis_direction
+    """
+    axis_point = np.asarray(axis_point, dtype=float)
+    k = np.asarray(axis_direction, dtype=float)
+    k = k/np.linalg.norm(k)
+    theta = np.radians(angle)
+    v = points - axis_point
+    rotated = v*np.cos(theta) + np.cross(k, v)*np.sin(theta) + np.outer(v @ k, k)*(1-np.cos(theta))
+    return rotated + axis_point
+
+
+class ToolpathData():
+    """
+    Vertices of one process step in machine coordinates with its detail levels.
+    Holds no Qt objects, so it is built in the plot thread and cached per step.
+    All toolpaths use the same cell size per level, so the levels of several toolpaths can be merged.
+    """
+    min_vertices = 200000  # toolpaths smaller than this have no simplified levels
+    base_cell_size = 0.01  # in mm, level k has a cell size of base_cell_size*level_factor**k
+    level_factor = 4
+    max_levels = 8
+
+    def __init__(self, vertices, colors, command_vertices, file_offsets):
+        """
+        :param vertices, colors: full detail line strip
+        :param command_vertices: number of vertices up to and including each command of the step, for the execution progress
+        :param file_offsets: index of the first command of each gcode file in command_vertices
+        """
+        self.vertices = vertices
+        self.colors = colors
+        self.command_vertices = command_vertices
+        self.file_offsets = file_offsets
+        self.levels = self.build_levels(vertices, colors)  # list of (level, vertices, colors) in 'lines' mode
+
+    @classmethod
+    def cell_size(cls, level):
+        return cls.base_cell_size*cls.level_factor**level
+
+    @classmethod
+    def build_levels(cls, vertices, colors):
+        """
+        Simplify the line strip with growing cell sizes. Levels that hardly reduce the number of vertices are skipped.
+        """
+        levels = []
+        if len(vertices) > cls.min_vertices:
+            level_vertices, level_colors, mode = vertices, colors, 'line_strip'
+            for level in range(1, cls.max_levels):
+                if len(level_vertices) <= cls.min_vertices/10:
+                    break
+                simplified = simplify_segments(level_vertices, level_colors, cls.cell_size(level), mode)
+                if len(simplified[0]) > 0.8*len(level_vertices):
+                    continue  # hardly any gain, try a coarser grid
+                level_vertices, level_colors, mode = simplified[0], simplified[1], 'lines'
+                levels.append((level, level_vertices, level_colors))
+        return levels
+
+    def level_lines(self, level):
+        """
+        Vertices and colors in 'lines' mode of the coarsest level that is not coarser than level.
+        """
+        best = None
+        for idx, vertices, colors in self.levels:
+            if idx <= level:
+                best = (vertices, colors)
+        if best is None:
+            # full detail, the line strip as single segments
+            strip_idx = np.repeat(np.arange(len(self.vertices)), 2)[1:-1]
+            return self.vertices[strip_idx], self.colors[strip_idx]
+        return best
+
+
+class MergedToolpathPlot():
+    """
+    All toolpaths of a job in one line item, so the whole job is drawn with one call.
+    Level 0 is the full detail line strip of all toolpaths, joined by invisible segments.
+    Coarser levels are merged from the levels of the toolpaths when they are shown for the first time.
+    set_pixel_size() swaps to the coarsest level whose error is still below the given tolerance.
+    """
+    def __init__(self, width=2):
+        self.line_item = ProgressLinePlotItem(pos=np.zeros((0,3), dtype=np.float32), color=np.zeros((0,4), dtype=np.float32),
+                                              width=width, mode='line_strip')
+        self.toolpaths = {}  # key -> ToolpathData
+        self.offsets = {}  # key -> index of the first vertex of the toolpath in level 0
+        self.levels = {}  # level -> (vertices, colors, mode)
+        self.max_level = 0
+        self.level = 0
+        self.pinned = False  # stay at full detail, e.g. while the job is executed
+        self.progress = {}  # key -> number of vertices of the toolpath shown as executed
+        self._original_colors = None
+
+    def set_toolpaths(self, toolpaths):
+        """
+        :param toolpaths: list of (key, ToolpathData) in drawing order
+        """
+        self.toolpaths = dict(toolpaths)
+        self.offsets = {}
+        vertex_parts, color_parts = [], []
+        count = 0
+        for key, data in toolpaths:
+            if len(data.vertices) == 0:
+                continue
+            if vertex_parts:
+                # invisible segment from the end of the last toolpath to the start of this one
+                vertex_parts.append(np.array([vertex_parts[-1][-1], data.vertices[0]], dtype=np.float32))
+                color_parts.append(np.zeros((2,4), dtype=np.float32))
+                count += 2
+            self.offsets[key] = count
+            vertex_parts.append(data.vertices)
+            color_parts.append(data.colors)
+            count += len(data.vertices)
+        if vertex_parts:
+            vertices, colors = np.concatenate(vertex_parts), np.concatenate(color_parts)
+        else:
+            vertices, colors = np.zeros((0,3), dtype=np.float32), np.zeros((0,4), dtype=np.float32)
+
+        self.levels = {0: (vertices, colors, 'line_strip')}
+        self.max_level = max([data.levels[-1][0] for data in self.toolpaths.values() if data.levels], default=0)
+        self.progress = {}
+        self._original_colors = None
+        self.show_level(0)
+
+    def show_level(self, level):
+        if level not in self.levels:
+            parts = [data.level_lines(level) for key, data in self.toolpaths.items() if key in self.offsets]
+            self.levels[level] = (np.concatenate([part[0] for part in parts]), np.concatenate([part[1] for part in parts]), 'lines')
+        self.level = level
+        vertices, colors, mode = self.levels[level]
+        self.line_item.setData(pos=vertices, color=colors, mode=mode)
+        if level == 0:
+            # share the arrays with the line item, so progress colors are written to both
+            self.levels[0] = (self.line_item.pos, self.line_item.color, mode)
+
+    def set_pixel_size(self, pixel_size, tolerance=1.0):
+        """
+        Show the coarsest level with a cell size below tolerance*pixel_size.
+        :param pixel_size: size of a screen pixel in mm, e.g. from GLViewWidget.pixelSize
+        :return: True if the level changed
+        """
+        if self.pinned:
+            return False
+        level = 0
+        for idx in range(1, self.max_level+1):
+            if ToolpathData.cell_size(idx) <= tolerance*pixel_size:
+                level = idx
+        if level == self.level:
+            return False
+        self.show_level(level)
+        return True
+
+    def pin(self, pinned=True):
+        """
+        Pin the plot to full detail, the execution progress is only drawn there.
+        """
+        self.pinned = pinned
+        if pinned and self.level != 0:
+            self.show_level(0)
+
+    def set_progress(self, key, file_idx, command_idx):
+        """
+        Color everything of a toolpath up to the command as executed. Only the vertices between the old and the new progress are changed.
+        :return: position of the tool after the command, None if it is unknown
+        """
+        data = self.toolpaths.get(key)
+        if data is None or key not in self.offsets or file_idx >= len(data.file_offsets):
+            return None
+        idx = min(data.file_offsets[file_idx] + max(command_idx, 0), len(data.command_vertices)-1)
+        vertex_end = int(data.command_vertices[idx]) if command_idx >= 0 else 0
+        vertices, colors, _ = self.levels[0]
+        if self._original_colors is None:
+            self._original_colors = colors.copy()
+        progress = self.progress.get(key, 0)
+        start, end = self.offsets[key] + min(progress, vertex_end), self.offsets[key] + max(progress, vertex_end)
+        if vertex_end > progress:
+            colors[start:end, 0:3] = EXECUTED_RGB
+        else:
+            colors[start:end] = self._original_colors[start:end]
+        self.progress[key] = vertex_end
+        if self.level == 0:
+            self.line_item.write_color_range(start, end)
+        return vertices[self.offsets[key]+vertex_end-1] if vertex_end > 0 else None
+
+    def reset_progress(self):
+        for key in list(self.progress):
+            self.set_progress(key, 0, -1)
+
 
 class GCodePlotter():
     def __init__(self, gui, process_handler):
@@ -13,6 +326,28 @@ class GCodePlotter():
         self.gcode_canvas = gui.gcode_canvas
         self.plot_gcode_button.clicked.connect(self.plot_gcode)
         self.show_moves_checkBox = gui.show_moves_checkBox
+        self.cancel_plot_button = gui.cancel_plot_button
+        self.cancel_plot_button.clicked.connect(self.cancel_plot)
+        self.plot_status_label = gui.plot_status_label
+
+        # Live execution overlay. Progress events come from the execution thread at a bounded rate
+        self.plot_options = None  # (show_moves, plot_transform) of the last plot, to find the plot of a running step
+        self.running = False
+        self.progress_emitter = SignalEmitter()
+        self.progress_emitter.list_signal.connect(self.show_progress)
+        self.progress_emitter.string_signal.connect(self.process_state_changed)
+        self.process_handler.set_progress_callback(lambda step, file_idx, command_idx: self.progress_emitter.list_signal.emit([step, file_idx, command_idx]))
+        self.process_handler.set_process_state_callback(self.progress_emitter.string_signal.emit)
+
+        # Without usable OpenGL drivers the toolpaths are rasterized with numpy instead ("raster")
+        settings = self.process_handler.controller.s
+        self.raster_view = None
+        if settings.get("ui.preview_renderer", "opengl") == "raster":
+            self.raster_view = RasterPreviewWidget()
+            self.raster_view.set_options(power_weighted=settings.get("ui.preview_power_weighted", False))
+            self.gcode_canvas.layout().addWidget(self.raster_view)
+            self.raster_positions = {}  # step_plot_key -> (positions of the commands, index of the first command of each file)
+            return
 
         # Set up the PyQtGraph GLViewWidget for 3D plotting
         self.view = GLViewWidget()
@@ -25,75 +360,310 @@ class GCodePlotter():
         # Initialize OpenGL settings
         self.initializeGL()
 
+        # The GLViewWidget has no signal for camera changes, so the level of detail is checked with a timer
+        self.plot_cache = {}  # step_plot_key -> ToolpathData of the plotted steps
+        self.plot_order = []  # step_plot_keys in the order of the process steps
+        self.merged_plot = MergedToolpathPlot(width=2)  # all steps in one line item
+        self.lod_pixel_tolerance = 1.0  # allowed simplification error in screen pixels
+        self._last_camera_params = None
+        self.lod_timer = QtCore.QTimer()
+        self.lod_timer.timeout.connect(self.update_lod)
+        self.lod_timer.start(100)
+
+        # Toolpaths are prepared in a worker thread and sent to the GUI thread in chunks
+        self.plot_chunk_size = 200000  # commands per chunk
+        self.plot_generation = 0  # incremented with every plot_gcode, results of older generations are dropped
+        self.plot_canceled = threading.Event()
+        self.plot_thread = None
+        self.chunk_items = {}  # step_plot_key -> list of GLLinePlotItem shown while the step is prepared
+        self.plot_emitter = SignalEmitter()
+        self.plot_emitter.list_signal.connect(self.receive_plot_data)
+
+        # Tool marker of the execution overlay
+        self.tool_marker = GLScatterPlotItem(pos=np.zeros((1,3)), color=(1.0, 0.2, 0.0, 1.0), size=10)
+        self.tool_marker.setGLOptions("translucent")
+        self.tool_marker.hide()
+        self.view.addItem(self.tool_marker)
+
     def plot_data(self):
-        self.view.clear()
+        """
+        Bring the view in line with plot_line_items. Only items that were removed or added are touched.
+        """
+        for item in list(self.view.items):
+            if isinstance(item, GLLinePlotItem) and not any(item is line_item for line_item in self.plot_line_items):
+                self.view.removeItem(item)
         for line_item in self.plot_line_items:
-            line_item.setGLOptions("opaque")
-            self.view.addItem(line_item)
+            if not any(item is line_item for item in self.view.items):
+                line_item.setGLOptions("opaque")
+                self.view.addItem(line_item)
+
+    def get_plot_transform(self):
+        """
+        Everything besides the steps themselves that determines where the toolpaths are drawn.
+        :return: laser offset, rotary axis point, rotary axis direction
+        """
+        controller = self.process_handler.controller
+        laser_offset = tuple(controller.laser_offset) if controller.laser_offset is not None else (0, 0, 0)
+        axis_point = tuple(controller.s.get("rotary_motors.axis_point", [0.0, 0.0, 0.0]))
+        axis_direction = tuple(controller.s.get("rotary_motors.axis_direction", [1.0, 0.0, 0.0]))
+        return laser_offset, axis_point, axis_direction
+
+    @staticmethod
+    def machine_positions(process_step, plot_transform):
+        """
+        Positions of all commands of a step in machine coordinates: work position + laser offset + J0 offset.
+        Files of steps with a rotary motor are rotated back by their angle about the rotary axis,
+        so they show where they end up on the rotated part.
+        :return: (N,3) positions, position of the step's origin
+        """
+        laser_offset, axis_point, axis_direction = plot_transform
+        wp = process_step.work_position
+        step_origin = np.array(wp[0:3], dtype=float) + laser_offset
+        file_positions = []
+        for gcode_file in process_step.gcode_files:
+            positions = gcode_file.moves.positions + step_origin + gcode_file.work_offset[0:3]
+            if process_step.rot_motor_id is not None:
+                angle = wp[3] + gcode_file.work_offset[3]
+                if angle != 0:
+                    positions = rotate_about_axis(positions, axis_point, axis_direction, -angle)
+            file_positions.append(positions)
+        return np.concatenate(file_positions), step_origin
     
-    def add_data_to_plot_items(self, command_list, show_moves=True):
-        pos, colors = self.extract_gcode_positions_and_colors(command_list, show_moves)
-        # Create a line item for the current hatch line and add it to the view
-        line_item = GLLinePlotItem(pos=pos, color=colors, width=2, mode='line_strip')
-        self.plot_line_items.append(line_item)
+    def prepare_step_plots(self, generation, steps_to_build, show_moves, plot_transform, canceled):
+        """
+        Runs in the plot thread. Builds the vertex buffers of the steps chunk by chunk and sends every chunk to the GUI,
+        followed by the ToolpathData with its detail levels when a step is complete.
+        :param steps_to_build: list of (step_plot_key, ProcessStep)
+        :param plot_transform: from get_plot_transform
+        :param canceled: threading.Event that stops the preparation
+        """
+        emit = self.plot_emitter.list_signal.emit
+        total = sum([sum([len(gcode_file.moves) for gcode_file in step.gcode_files]) for _, step in steps_to_build])
+        done = 0
+        for step_idx, (key, step) in enumerate(steps_to_build):
+            motion = np.concatenate([gcode_file.moves.motion for gcode_file in step.gcode_files])
+            positions, step_origin = self.machine_positions(step, plot_transform)
+            file_offsets = np.cumsum([0] + [len(gcode_file.moves) for gcode_file in step.gcode_files])[:-1]
+            vertex_chunks, color_chunks, command_vertex_chunks = [], [], []
+            vertex_count = 0
+            start_motion, start_position = 0, step_origin
+            for start in range(0, len(motion), self.plot_chunk_size):
+                if canceled.is_set():
+                    return
+                chunk_motion = motion[start:start+self.plot_chunk_size]
+                chunk_positions = positions[start:start+self.plot_chunk_size]
+                vertices, colors, command_vertices = build_vertex_buffer(chunk_motion, chunk_positions, show_moves, start_motion, start_position,
+                                                                         return_command_vertices=True)
+                command_vertex_chunks.append(command_vertices + vertex_count)
+                vertex_count += len(vertices)
+                if len(vertices):
+                    # connect the chunk to the end of the previous one
+                    if vertex_chunks:
+                        shown_vertices = np.concatenate([vertex_chunks[-1][-1:], vertices])
+                        shown_colors = np.concatenate([color_chunks[-1][-1:], colors])
+                    else:
+                        shown_vertices, shown_colors = vertices, colors
+                    vertex_chunks.append(vertices)
+                    color_chunks.append(colors)
+                    last_move = np.flatnonzero(chunk_motion >= 0)[-1]
+                    start_motion, start_position = chunk_motion[last_move], chunk_positions[last_move]
+                    done += len(chunk_motion)
+                    emit(["chunk", generation, key, shown_vertices, shown_colors,
+                          f"Preparing step {step_idx+1}/{len(steps_to_build)} ({done/total*100:.0f}%)"])
+                else:
+                    done += len(chunk_motion)
+            if canceled.is_set():
+                return
+            if vertex_chunks:
+                emit(["step", generation, key, ToolpathData(np.concatenate(vertex_chunks), np.concatenate(color_chunks),
+                                                            np.concatenate(command_vertex_chunks), file_offsets)])
+        emit(["done", generation])
+
+    def receive_plot_data(self, data):
+        """
+        GUI thread side of prepare_step_plots.
+        """
+        if data[1] != self.plot_generation:
+            return  # from a canceled or replaced plot
+        if data[0] == "chunk":
+            _, _, key, vertices, colors, status = data
+            line_item = GLLinePlotItem(pos=vertices, color=colors, width=2, mode='line_strip')
+            self.chunk_items.setdefault(key, []).append(line_item)
+            self.plot_status_label.setText(status)
+        elif data[0] == "step":
+            _, _, key, toolpath_data = data
+            self.chunk_items.pop(key, None)
+            self.plot_cache[key] = toolpath_data
+            self.update_merged_plot()
+        elif data[0] == "done":
+            self.plot_status_label.setText("Plot finished")
+        self.update_plot_items()
+
+    def update_merged_plot(self):
+        """
+        Pack the toolpaths of all prepared steps into the merged plot.
+        """
+        self.merged_plot.set_toolpaths([(key, self.plot_cache[key]) for key in self.plot_order if key in self.plot_cache])
+        self._last_camera_params = None
+
+    def update_plot_items(self):
+        self.plot_line_items = [self.merged_plot.line_item]
+        for line_items in self.chunk_items.values():
+            self.plot_line_items.extend(line_items)
+        self.plot_data()
+        self.update_lod()
+
+    def cancel_plot(self):
+        """
+        Stop the preparation of the plot. Steps that are not complete are removed from the view.
+        """
+        if self.raster_view is not None:
+            return  # the raster preview is drawn at once
+        self.plot_canceled.set()
+        self.plot_generation += 1
+        if self.chunk_items:
+            self.chunk_items = {}
+            self.update_plot_items()
+            self.plot_status_label.setText("Plot canceled")
+
+    def step_plot_key(self, process_step, show_moves, plot_transform):
+        """
+        Cache key of a step's plot: the files it plots (path and modification time), its work position, the transformation and the display options.
+        """
+        files = [process_step.nc_file] + [gcode_file.file_path for gcode_file in process_step.gcode_files]
+        file_identity = []
+        for file_path in files:
+            try:
+                file_identity.append((file_path, os.path.getmtime(file_path)))
+            except (OSError, TypeError):
+                file_identity.append((file_path, None))
+        return (tuple(file_identity), tuple(process_step.work_position), process_step.rot_motor_id, plot_transform, show_moves)
     
     def plot_gcode(self):
-        self.plot_line_items = []
+        """
+        Plot all process steps. Plots of steps whose files, work position and options did not change are reused,
+        all others are prepared in the plot thread and shown progressively.
+        """
+        if self.raster_view is not None:
+            self.plot_raster()
+            return
+        self.cancel_plot()
         show_moves = self.show_moves_checkBox.isChecked()
+        plot_transform = self.get_plot_transform()
+        self.plot_options = (show_moves, plot_transform)
+        self.plot_order = []
+        plot_cache = {}
+        steps_to_build = []
         for step in self.process_handler.process_step_list:
-                command_list=step.command_list
-                self.add_data_to_plot_items(command_list, show_moves)
-        self.plot_data()
+            if not step.gcode_files:
+                continue
+            key = self.step_plot_key(step, show_moves, plot_transform)
+            if key in self.plot_order:
+                continue
+            self.plot_order.append(key)
+            if key in self.plot_cache:
+                plot_cache[key] = self.plot_cache[key]
+            else:
+                steps_to_build.append((key, step))
+        self.plot_cache = plot_cache
+        self.update_merged_plot()
+        self.update_plot_items()
 
-    def extract_gcode_positions_and_colors(self, command_list, show_moves = True):
-        positions = []
-        colors = []
-        x = y = z = 0.0
-        prev_command=0
-        if show_moves:
-            g0_color = [0.7,0.7,0.7,0.5]
+        if steps_to_build:
+            self.plot_canceled = threading.Event()
+            self.plot_status_label.setText(f"Preparing {len(steps_to_build)} steps...")
+            self.plot_thread = threading.Thread(target=self.prepare_step_plots,
+                                                args=(self.plot_generation, steps_to_build, show_moves, plot_transform, self.plot_canceled))
+            self.plot_thread.daemon = True
+            self.plot_thread.start()
         else:
-            g0_color = [1,1,1,0]
-        g1_color = [0,0,0,1]
-
-        for command in command_list:
-            command = command.strip().upper()
-            if command.startswith(("G0", "G1")):
-
-                #detect switch between move and write depending on previous command
-                if command.startswith("G0") and prev_command==1:
-                    colors.append(g1_color)
-                    positions.append([x, y, z])
-                    colors.append(g0_color)
-                    positions.append([x, y, z])
-                    
-                elif command.startswith("G1") and prev_command==0:
-                    colors.append(g0_color)
-                    positions.append([x, y, z])
-                    colors.append(g1_color)
-                    positions.append([x, y, z])
-
-                # get the new point
-                for token in command.split():
-                    if token.startswith("X"):
-                        x = float(token[1:])
-                    elif token.startswith("Y"):
-                        y = float(token[1:])
-                    elif token.startswith("Z"):
-                        z = float(token[1:])
-                
-                
-                
-                if command.startswith("G0"): 
-                    colors.append(g0_color)
-                    positions.append([x, y, z])
-                    prev_command=0
-                else:  # G1
-                    colors.append(g1_color)
-                    positions.append([x, y, z])
-                    prev_command=1
-        
-        return np.array(positions), np.array(colors)
+            self.plot_status_label.setText("Plot finished")
+
+    def plot_raster(self):
+        """
+        Show all process steps in the 2D raster preview, seen from the top in machine coordinates.
+        """
+        show_moves = self.show_moves_checkBox.isChecked()
+        plot_transform = self.get_plot_transform()
+        self.plot_options = (show_moves, plot_transform)
+        self.raster_positions = {}
+        starts, ends, laser_on, power = [], [], [], []
+        for step in self.process_handler.process_step_list:
+            if not step.gcode_files:
+                continue
+            positions, step_origin = self.machine_positions(step, plot_transform)
+            file_starts = np.cumsum([0] + [len(gcode_file.commands) for gcode_file in step.gcode_files])
+            self.raster_positions[self.step_plot_key(step, show_moves, plot_transform)] = (positions, file_starts)
+            motion = np.concatenate([gcode_file.moves.motion for gcode_file in step.gcode_files])
+            is_move = motion >= 0
+            move_positions = positions[is_move, 0:2]
+            if not len(move_positions):
+                continue
+            starts.append(np.concatenate([[step_origin[0:2]], move_positions[:-1]]))
+            ends.append(move_positions)
+            step_power = np.concatenate([gcode_file.moves.power for gcode_file in step.gcode_files])[is_move]
+            step_laser = np.concatenate([gcode_file.moves.laser_enabled for gcode_file in step.gcode_files])[is_move]
+            laser_on.append((motion[is_move] == 1) & step_laser & (step_power > 0))
+            power.append(step_power)
+        if not starts:
+            self.plot_status_label.setText("Nothing to plot")
+            return
+        self.raster_view.set_options(show_moves=show_moves)
+        self.raster_view.set_toolpaths(np.concatenate(starts), np.concatenate(ends), np.concatenate(laser_on), np.concatenate(power))
+        self.plot_status_label.setText("Plot finished")
+
+    def show_progress(self, data):
+        """
+        Color the executed part of the running step and move the tool marker. Called in the GUI thread.
+        """
+        step, file_idx, command_idx = data
+        # the JobQueue runs copies of the plotted steps, they are found by their content like in the plot cache
+        key = self.step_plot_key(step, *self.plot_options) if self.plot_options is not None and step.gcode_files else None
+        if self.raster_view is not None:
+            # the raster tiles are not redrawn during the execution, only the tool marker moves
+            positions, file_starts = self.raster_positions.get(key, (None, None))
+            if positions is None or command_idx < 0:
+                self.raster_view.set_tool_position(None)
+            else:
+                self.raster_view.set_tool_position(positions[file_starts[file_idx] + command_idx, 0:2])
+            return
+        if key not in self.merged_plot.offsets:
+            self.tool_marker.hide()
+            return
+        if not self.merged_plot.pinned:
+            self.merged_plot.pin(True)
+        position = self.merged_plot.set_progress(key, file_idx, command_idx)
+        if position is not None:
+            self.tool_marker.setData(pos=np.array([position]))
+            self.tool_marker.show()
+
+    def process_state_changed(self, state):
+        if self.raster_view is not None:
+            if state == "Idle":
+                self.raster_view.set_tool_position(None)
+            return
+        if state == "Running" and not self.running:
+            # a new run starts, clear the progress of the last one
+            self.running = True
+            self.merged_plot.reset_progress()
+        elif state == "Idle":
+            self.running = False
+            self.merged_plot.pin(False)
+            self._last_camera_params = None
+            self.tool_marker.hide()
+
+    def update_lod(self):
+        """
+        Switch the detail level of the plot if the camera changed since the last check.
+        """
+        camera_params = self.view.cameraParams()
+        camera_params = (tuple(camera_params['center']), camera_params['distance'], camera_params['fov'],
+                         camera_params.get('elevation'), camera_params.get('azimuth'), self.view.width())
+        if camera_params == self._last_camera_params:
+            return
+        self._last_camera_params = camera_params
+        pixel_size = self.view.pixelSize(self.view.opts['center'])
+        self.merged_plot.set_pixel_size(pixel_size, self.lod_pixel_tolerance)
 
     def initializeGL(self):
         """
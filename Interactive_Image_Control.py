@@ -3,8 +3,12 @@ from typing import Tuple, Optional, Dict
 from PyQt6 import QtWidgets, QtCore, QtGui, uic
 from pathlib import Path
 from PathManager import get_gui_file_path
+from Visual_Servo import VisualServo
+from Autofocus import Autofocus
 
 class InteractiveImageControl(QtCore.QObject):
+    servo_state_signal = QtCore.pyqtSignal(object)
+
     def __init__(self, gui, settings, camera_GUI, artisan_controller):
         super().__init__()
         self.gui = gui
@@ -16,7 +20,7 @@ class InteractiveImageControl(QtCore.QObject):
 
         self.camera_view = camera_GUI.camera_view
         self.camera_scene = camera_GUI.camera_scene
-        self.pixmap_item = camera_GUI.pixmap_item
+        self.frame_item = camera_GUI.frame_item
         self.camera_type = camera_GUI.camera_type
 
         # track created cross items if you want to clear later
@@ -32,6 +36,21 @@ class InteractiveImageControl(QtCore.QObject):
         # Calibration button
         gui.calibrate_interactive_movement_action.triggered.connect(self.calibrate_coordinate_transformer)
 
+        # Shift + right click drives the laser cross onto the clicked feature in a closed loop (laser camera only)
+        self.visual_servo = None
+        if self.camera_type == 'laser_camera':
+            self.visual_servo = VisualServo(settings, camera_GUI.camera_controller, artisan_controller, self.coord_transformer)
+            self.visual_servo.set_state_callback(self.servo_state_signal.emit)
+            self.visual_servo.set_log_callback(camera_GUI.threadsafe_append_log)
+            self.servo_state_signal.connect(self._show_servo_state)
+
+        # Autofocus moves Z until the laser cross is sharp (laser camera only), a second click cancels it
+        self.autofocus = None
+        if self.camera_type == 'laser_camera':
+            self.autofocus = Autofocus(settings, camera_GUI.camera_controller, artisan_controller)
+            self.autofocus.set_log_callback(camera_GUI.threadsafe_append_log)
+            gui.laser_camera_autofocus_button.clicked.connect(self.toggle_autofocus)
+
         # Load settings
         self.load_settings()
     
@@ -52,6 +71,13 @@ class InteractiveImageControl(QtCore.QObject):
 
             # Start dragging on right-button press
             if event.type() == QtCore.QEvent.Type.MouseButtonPress:
+                if self.visual_servo is not None and self.visual_servo.running:
+                    self.visual_servo.stop()  # any click cancels the centering
+                    return True
+                if (event.button() == QtCore.Qt.MouseButton.RightButton and self._cross_items and self.visual_servo is not None
+                        and event.modifiers() & QtCore.Qt.KeyboardModifier.ShiftModifier):
+                    self._center_on_cross()
+                    return True
                 if event.button() == QtCore.Qt.MouseButton.LeftButton:
                     scene_pt = self.camera_view.mapToScene(event.pos())
                     self._dragging_left_mouse = True
@@ -84,7 +110,7 @@ class InteractiveImageControl(QtCore.QObject):
             return False
         
     def _add_cross(self, scene_pt: QtCore.QPoint):
-        """Draw a small cross centered at scene_pt, parented to the pixmap so it stays glued to the image."""
+        """Draw a small cross centered at scene_pt, parented to the frame item so it stays glued to the image."""
 
         # Remove previous cross items if they exist
         if hasattr(self, '_cross_items'):
@@ -94,18 +120,18 @@ class InteractiveImageControl(QtCore.QObject):
             self._cross_pos = []
 
 
-        local = self.pixmap_item.mapFromScene(scene_pt)
-        pm = self.pixmap_item.pixmap()
-        if not pm.isNull():
-            if not QtCore.QRectF(0, 0, pm.width(), pm.height()).contains(local):
+        local = self.frame_item.mapFromScene(scene_pt)
+        frame_rect = self.frame_item.boundingRect()
+        if not frame_rect.isEmpty():
+            if not frame_rect.contains(local):
                 return        
             
         
         x, y = local.x(), local.y()
         pen = QtGui.QPen(QtGui.QColor(0, 255, 255))
         pen.setWidth(1)
-        h_line = QtWidgets.QGraphicsLineItem(0, y, pm.width(), y)
-        v_line = QtWidgets.QGraphicsLineItem(x, 0, x, pm.height())
+        h_line = QtWidgets.QGraphicsLineItem(0, y, frame_rect.width(), y)
+        v_line = QtWidgets.QGraphicsLineItem(x, 0, x, frame_rect.height())
         h_line.setPen(pen)
         v_line.setPen(pen)
         self.camera_scene.addItem(h_line)
@@ -117,15 +143,15 @@ class InteractiveImageControl(QtCore.QObject):
         """Update the position of the existing cross to a new scene_pt."""
         if not self._cross_items:
             return  # No cross to update
-        local = self.pixmap_item.mapFromScene(scene_pt)
-        pm = self.pixmap_item.pixmap()
-        if not pm.isNull():
-            if not QtCore.QRectF(0, 0, pm.width(), pm.height()).contains(local):
+        local = self.frame_item.mapFromScene(scene_pt)
+        frame_rect = self.frame_item.boundingRect()
+        if not frame_rect.isEmpty():
+            if not frame_rect.contains(local):
                 return        
         x, y = local.x(), local.y()
         h_line, v_line = self._cross_items
-        h_line.setLine(0, y, pm.width(), y)
-        v_line.setLine(x, 0, x, pm.height())
+        h_line.setLine(0, y, frame_rect.width(), y)
+        v_line.setLine(x, 0, x, frame_rect.height())
         self._cross_pos = [x, y]
     
     def _move_to_cross(self):
@@ -151,6 +177,30 @@ class InteractiveImageControl(QtCore.QObject):
         except Exception as e:
             print(f"Error moving artisan controller: {e}")
     
+    def _center_on_cross(self):
+        """Drive the laser cross onto the feature under the cross with the visual servo."""
+        if not self._cross_pos or self.frame_item.width == 0:
+            return
+        frame_size = (self.frame_item.width, self.frame_item.height)
+        self.visual_servo.start(self.visual_servo.from_display(self._cross_pos, frame_size))
+
+    def _show_servo_state(self, state):
+        """Keep the cross on the feature while the machine moves, remove it when the laser cross arrived."""
+        if state.status == "converged":
+            for item in self._cross_items:
+                self.camera_scene.removeItem(item)
+            self._cross_items = []
+            self._cross_pos = []
+        elif state.target is not None and self._cross_items:
+            x, y = self.visual_servo.to_display(state.target, (self.frame_item.width, self.frame_item.height))
+            self._update_cross(self.frame_item.mapToScene(QtCore.QPointF(x, y)))
+
+    def toggle_autofocus(self):
+        if self.autofocus.running:
+            self.autofocus.stop()
+        else:
+            self.autofocus.start()
+
     def calibrate_coordinate_transformer(self):
         if self.calibration_window:
             self.calibration_window.close()
@@ -0,0 +1,291 @@
+import json
+import threading
+from pathlib import Path
+from Process_Handler import ProcessStep
+
+class ProcessJob():
+    def __init__(self, name, process_step_list, confirm_before_start=False):
+        self.name = name
+        self.process_step_list = process_step_list  # List of ProcessStep of this job
+        self.confirm_before_start = confirm_before_start  # wait for the operator before this job starts
+        self.state = "Queued"  # Possible states: "Queued", "Prefetching", "Ready", "Waiting", "Running", "Done", "Failed", "Canceled"
+        self.prefetch_log = ''
+        self.prefetch_done = threading.Event()
+        self.prefetch_thread = None
+
+    @property
+    def process_time(self):
+        return sum([step.process_time for step in self.process_step_list])
+
+    def prefetch(self):
+        """
+        Parse all NC files of this job in a background thread, so the job can start without reading from disk.
+        Calling it again while the prefetch is running or done does nothing.
+        """
+        if self.prefetch_thread is not None:
+            return
+
+        def load_files():
+            self.state = "Prefetching"
+            try:
+                for step in self.process_step_list:
+                    log = step.set_nc_file(step.nc_file)
+                    if step.nc_file is None:
+                        self.prefetch_log = log
+                        self.state = "Failed"
+                        return
+                self.prefetch_log = f"Job {self.name} prefetched with process time {self.process_time:.2f}s"
+                self.state = "Ready"
+            except Exception as e:
+                self.prefetch_log = f"Failed to prefetch job {self.name}: {e}"
+                self.state = "Failed"
+            finally:
+                self.prefetch_done.set()
+
+        self.prefetch_thread = threading.Thread(target=load_files)
+        self.prefetch_thread.daemon = True
+        self.prefetch_thread.start()
+
+    def to_dict(self):
+        return {"name": self.name,
+                "confirm_before_start": self.confirm_before_start,
+                "steps": [{"work_position": list(step.work_position),
+                           "nc_file": step.nc_file,
+                           "rot_motor_id": step.rot_motor_id} for step in self.process_step_list]
+                }
+
+    @staticmethod
+    def from_dict(data):
+        steps = []
+        for step_data in data["steps"]:
+            step = ProcessStep(list(step_data["work_position"]))
+            step.nc_file = step_data["nc_file"]  # parsed on prefetch
+            step.rot_motor_id = step_data.get("rot_motor_id", None)
+            steps.append(step)
+        return ProcessJob(data["name"], steps, data.get("confirm_before_start", False))
+
+
+class JobQueue():
+    """
+    Queue of jobs (lists of ProcessSteps) that are executed back to back by the ProcessHandler.
+    While one job runs, the NC files of the next job are parsed in the background.
+    Jobs with confirm_before_start wait for confirm_next_job() before they are started.
+    """
+    def __init__(self, process_handler):
+        self.process_handler = process_handler
+        self.jobs = []  # List of ProcessJob
+        self.confirmation = threading.Event()
+        self._lock = threading.RLock()
+        self._last_log = ''
+        self.running = False  # the queue is executed, the process state stays Running from the first to the last job
+
+        # Callbacks for GUI updates
+        self.log_callbacks = []
+        self.queue_changed_callbacks = []
+        self.job_state_callbacks = []
+
+    @property
+    def last_log(self):
+        return self._last_log
+
+    @last_log.setter
+    def last_log(self, value):
+        self._last_log = value
+        for callback in self.log_callbacks:
+            callback(value)
+
+    def set_log_callback(self, callback):
+        self.log_callbacks.append(callback)
+
+    def set_queue_changed_callback(self, callback):
+        self.queue_changed_callbacks.append(callback)
+
+    def queue_changed(self):
+        for callback in self.queue_changed_callbacks:
+            callback(self.jobs)
+
+    def set_job_state_callback(self, callback):
+        """
+        :param callback: called with the job in the execution thread when a job starts running and when it ended
+        (state Running, then Done or Canceled)
+        """
+        self.job_state_callbacks.append(callback)
+
+    def job_state_changed(self, job):
+        for callback in self.job_state_callbacks:
+            callback(job)
+
+    def add_job(self, name, process_step_list, confirm_before_start=False):
+        """
+        Add a job to the end of the queue.
+        :param name: Name of the job, shown in the GUI.
+        :param process_step_list: List of ProcessStep. The nc_file of each step is (re-)parsed on prefetch.
+        :param confirm_before_start: If True, the queue waits for the operator before the job starts.
+        """
+        job = ProcessJob(name, process_step_list, confirm_before_start)
+        with self._lock:
+            self.jobs.append(job)
+            if self._next_job() is job:
+                job.prefetch()
+        self.last_log = f"Job {name} added to queue."
+        self.queue_changed()
+        return job
+
+    def add_current_steps(self, name=None, confirm_before_start=False):
+        """
+        Add a snapshot of the ProcessHandler's current process steps as a new job.
+        """
+        process_step_list = []
+        for step in self.process_handler.process_step_list:
+            if not step.nc_file:
+                self.last_log = "Error: One or more process steps do not have a valid NC file set."
+                return None
+            new_step = ProcessStep(list(step.work_position))
+            new_step.nc_file = step.nc_file
+            new_step.rot_motor_id = step.rot_motor_id
+            process_step_list.append(new_step)
+
+        if not process_step_list:
+            self.last_log = "Error: No process steps defined. Please add process steps before queuing."
+            return None
+
+        if name is None:
+            name = f"Job {len(self.jobs)+1}"
+        return self.add_job(name, process_step_list, confirm_before_start)
+
+    def remove_job(self, job):
+        if job.state in ["Running", "Waiting"]:
+            self.last_log = f"Error: Cannot remove job {job.name} while it is active."
+            return False
+        with self._lock:
+            self.jobs.remove(job)
+        self.queue_changed()
+        return True
+
+    def clear_finished(self):
+        with self._lock:
+            self.jobs = [job for job in self.jobs if job.state not in ["Done", "Failed", "Canceled"]]
+        self.queue_changed()
+
+    def confirm_next_job(self):
+        """
+        Operator confirmation for a job that waits for it.
+        """
+        self.confirmation.set()
+
+    def _next_job(self, after=None):
+        """
+        Return the first job that has not been run yet (optionally the first one after a given job).
+        """
+        with self._lock:
+            start = self.jobs.index(after)+1 if after in self.jobs else 0
+            for job in self.jobs[start:]:
+                if job.state in ["Queued", "Prefetching", "Ready"]:
+                    return job
+        return None
+
+    def start(self, fire_forget=False):
+        """
+        Execute all queued jobs back to back in the execution thread of the ProcessHandler.
+        """
+        if not self.process_handler.controller.connected:
+            self.last_log = "Error: Not connected to Artisan!"
+            return
+        first_job = self._next_job()
+        if first_job is None:
+            self.last_log = "Error: No jobs in queue."
+            return
+        first_job.prefetch()
+
+        def execute():
+            handler = self.process_handler
+            try:
+                handler.process_state = "Running"
+                start_position = handler.controller.get_absolute_position()
+                job = self._next_job()
+                while job is not None:
+                    job.prefetch_done.wait()
+
+                    # parse the next job's files while this one runs
+                    next_job = self._next_job(after=job)
+                    if next_job is not None:
+                        next_job.prefetch()
+
+                    if job.state == "Failed" or not handler.pre_start_check(job.process_step_list):
+                        job.state = "Failed"
+                        self.last_log = f"Job {job.name} skipped: {job.prefetch_log if job.prefetch_log else handler.last_log}"
+                        self.queue_changed()
+                        job = next_job
+                        continue
+
+                    if job.confirm_before_start:
+                        job.state = "Waiting"
+                        self.queue_changed()
+                        self.last_log = f"Job {job.name} is ready. Waiting for operator confirmation."
+                        self.confirmation.clear()
+                        handler.process_state = "Idle"  # the operator may jog, focus or servo before confirming
+                        while not self.confirmation.wait(0.1):
+                            if handler.execution_canceled.is_set():
+                                break
+                        handler.work_offsets.invalidate()  # the axes may have been moved, execute_steps reads the position again
+                        if not handler.execution_canceled.is_set():
+                            handler.process_state = "Running"
+
+                    if handler.execution_canceled.is_set():
+                        job.state = "Canceled"
+                        break
+
+                    job.state = "Running"
+                    self.queue_changed()
+                    self.job_state_changed(job)
+                    self.last_log = f"Starting job {job.name}."
+                    finished = False
+                    try:
+                        finished = handler.execute_steps(job.process_step_list, fire_forget=fire_forget)
+                    finally:
+                        job.state = "Done" if finished else "Canceled"
+                        self.job_state_changed(job)  # also when the job failed with an exception
+                    self.queue_changed()
+                    if not finished:
+                        break
+
+                    job = self._next_job(after=job)
+
+                #Restore the old position after the last job
+                handler.controller.move_axis_absolute(start_position[0], start_position[1], start_position[2], speed=30, z_save=True, job_save=True)
+                self.last_log = "Job queue finished."
+            except Exception as e:
+                self.last_log = f"Error during queue execution: {e}"
+            finally:
+                self.running = False
+                handler.execution_thread = None  # before Idle, the queue can not be canceled any more
+                handler.process_state = "Idle"
+                self.queue_changed()
+
+        self.running = True  # before the process state changes to Running
+        if not self.process_handler.start_execution_thread(execute):
+            self.running = False
+
+    def save_queue(self, file_path):
+        with self._lock:
+            data = [job.to_dict() for job in self.jobs if job.state not in ["Done", "Canceled"]]
+        Path(file_path).write_text(json.dumps(data, indent=2), encoding="utf-8")
+        self.last_log = f"Job queue saved to {file_path}"
+
+    def load_queue(self, file_path):
+        """
+        Append the jobs stored in a queue file. The files are parsed when a job is prefetched.
+        """
+        try:
+            data = json.loads(Path(file_path).read_text(encoding="utf-8"))
+            for job_data in data:
+                job = ProcessJob.from_dict(job_data)
+                with self._lock:
+                    self.jobs.append(job)
+            first_job = self._next_job()
+            if first_job is not None:
+                first_job.prefetch()
+            self.last_log = f"Loaded {len(data)} jobs from {file_path}"
+        except Exception as e:
+            self.last_log = f"Failed to load job queue: {e}"
+        self.queue_changed()
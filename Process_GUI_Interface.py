@@ -299,7 +299,7 @@ class ProcessInterface(BaseClass):
             pass
             icon = QIcon("GUI_files/resources/start.png")
             self.toggle_process_button.setIcon(icon)
-            self.cancel_process_button.setEnabled(False)
+            self.cancel_process_button.setEnabled(self.process_handler.execution_active())  # queue waiting for confirmation
 
     def run_bounding_box(self):
         step_to_run = self.bounding_box_step_combobox.currentIndex()
@@ -316,3 +316,55 @@ class ProcessInterface(BaseClass):
         else:
             self.process_handler.run_bounding_box(step_to_run-1, in_laser_coord)
         
+
+
+class JobQueueInterface(BaseClass):
+    def __init__(self, gui, job_queue):
+        super().__init__()
+        self.gui = gui
+        self.job_queue = job_queue
+
+        # Add gui callbacks
+        self.job_queue_listWidget = gui.job_queue_listWidget
+        self.job_confirm_checkBox = gui.job_confirm_checkBox
+        gui.queue_current_steps_button.clicked.connect(self.queue_current_steps)
+        gui.start_queue_button.clicked.connect(self.job_queue.start)
+        gui.confirm_job_button.clicked.connect(self.job_queue.confirm_next_job)
+        gui.remove_job_button.clicked.connect(self.remove_selected_job)
+        gui.clear_finished_jobs_button.clicked.connect(self.job_queue.clear_finished)
+        gui.save_queue_button.clicked.connect(self.save_queue)
+        gui.load_queue_button.clicked.connect(self.load_queue)
+
+        #Log tracking
+        logger = TextLogger(log_object="Job Queue", log_widget=gui.log_textEdit)
+        self.job_queue.set_log_callback(logger.log)
+
+        # the queue changes from the execution thread, so update the list through a signal
+        self.queue_emitter = SignalEmitter()
+        self.queue_emitter.list_signal.connect(self.update_job_list)
+        self.job_queue.set_queue_changed_callback(self.queue_emitter.list_signal.emit)
+
+    def queue_current_steps(self):
+        self.job_queue.add_current_steps(confirm_before_start=self.job_confirm_checkBox.isChecked())
+
+    def remove_selected_job(self):
+        row = self.job_queue_listWidget.currentRow()
+        if row < 0 or row >= len(self.job_queue.jobs):
+            return
+        self.job_queue.remove_job(self.job_queue.jobs[row])
+
+    def update_job_list(self, jobs):
+        self.job_queue_listWidget.clear()
+        for job in jobs:
+            confirm = " (confirm)" if job.confirm_before_start else ""
+            self.job_queue_listWidget.addItem(f"{job.name}{confirm} - {job.state}")
+
+    def save_queue(self):
+        file_path, _ = QFileDialog.getSaveFileName(self.gui, "Save Job Queue", "job_queue.json", "JSON (*.json)")
+        if file_path:
+            self.job_queue.save_queue(file_path)
+
+    def load_queue(self):
+        file_path, _ = QFileDialog.getOpenFileName(self.gui, "Load Job Queue", "", "JSON (*.json)")
+        if file_path:
+            self.job_queue.load_queue(file_path)
@@ -1,6 +1,8 @@
 import threading
 import time
+import re
 from BaseClasses import BaseClass
+from Work_Offset_Manager import WorkOffsetManager
 import os
 
 class ProcessHandler(BaseClass):
@@ -13,14 +15,22 @@ class ProcessHandler(BaseClass):
         self.execution_running = threading.Event()
         self.execution_canceled = threading.Event()
         self.process_step_list = []  # List to hold process steps
+        self.work_offsets = WorkOffsetManager(artisan_controller)  # host side work coordinates during execution
         self._last_log = ''
         self._process_state = "Idle"  # Track the process state
         self._remaining_time = 0
+        self._remaining_time_emitted = 0  # time.monotonic() of the last remaining time callback
+        self.remaining_time_interval = 0.5  # minimum seconds between remaining time callbacks during execution
+        self._progress_step = None  # ProcessStep that is executed right now
+        self._progress_file = 0  # index of the gcode file of _progress_step that is executed right now
+        self._progress_emitted = 0  # time.monotonic() of the last progress callback
+        self.progress_interval = 0.1  # minimum seconds between progress callbacks
         
         # Callbacks for GUI updates
         self.log_callbacks = []
         self.process_state_callbacks = []
         self.remaining_time_callbacks = []
+        self.progress_callbacks = []
         
     @property
     def last_log(self):
@@ -57,17 +67,46 @@ class ProcessHandler(BaseClass):
 
     @remaining_time.setter
     def remaining_time(self, value):
+        self.update_remaining_time(value, force=True)
+
+    def update_remaining_time(self, value, force=False):
+        """
+        Set the remaining time. Callbacks are only triggered every remaining_time_interval seconds,
+        so the per-command updates during execution do not flood the GUI thread with signals.
+        :param value: remaining time in seconds
+        :param force: trigger the callbacks regardless of the interval
+        """
         self._remaining_time = value
+        now = time.monotonic()
+        if not force and now - self._remaining_time_emitted < self.remaining_time_interval:
+            return
+        self._remaining_time_emitted = now
         if self.remaining_time_callbacks:
+            h=int(value//3600)
+            m=int((value%3600)//60)
+            s=int(value%60)
+            remaining_time_string = f"ETA. - {h}:{m}:{s}"
             for callback in self.remaining_time_callbacks:
-                h=int(value//3600)
-                m=int((value%3600)//60)
-                s=int(value%60)
-                remaining_time_string = f"ETA. - {h}:{m}:{s}"
                 callback(remaining_time_string)
 
     def set_remaining_time_callback(self, callback):
         self.remaining_time_callbacks.append(callback)
+
+    def update_progress(self, command_idx, force=False):
+        """
+        Report the last command that was sent. Callbacks get (process_step, gcode file index, command index)
+        and are triggered at most every progress_interval seconds.
+        :param force: trigger the callbacks regardless of the interval
+        """
+        now = time.monotonic()
+        if not force and now - self._progress_emitted < self.progress_interval:
+            return
+        self._progress_emitted = now
+        for callback in self.progress_callbacks:
+            callback(self._progress_step, self._progress_file, command_idx)
+
+    def set_progress_callback(self, callback):
+        self.progress_callbacks.append(callback)
        
     def add_process_step(self):
         """
@@ -189,16 +228,19 @@ class ProcessHandler(BaseClass):
             return
         
         self.last_log = process_step.set_nc_file(file_path)
+        tool_head = self.controller.tool_head
+        if process_step.laser_statistics is not None and tool_head is not None:
+            full_power_w = self.controller.s.get(f"artisan.{tool_head}.full_power_w", None)
+            full_power_s = self.controller.s.get(f"artisan.{tool_head}.full_power_s", 255.0)
+            if full_power_w:
+                self.last_log = f"Laser energy of this step: {process_step.laser_statistics.energy(full_power_w, full_power_s):.1f}J"
 
     def start_process(self, fire_forget=False):
         """
         Execute all process steps in the job handler.
-        1. Move to work position of this step
-        2. Move to the laser offset position.
-        3. Set the current position as the new work position with the laser offset applied.
-        4. Execute each command in the process steps.
-        5. Restore the old work position after execution.
-        6. Move back to the laser offset position.
+        1. Move to work position of this step with the laser offset applied.
+        2. Set the work position as origin (one G92 computed by the WorkOffsetManager) and execute each command in the process steps.
+        3. Restore the old position after execution.
         """
         if not self.pre_start_check():
             return
@@ -210,78 +252,131 @@ class ProcessHandler(BaseClass):
                 #Here the Process state is set to running. Will use the threading events to control the execution interanlly
                 self.process_state = "Running"  # Update state to Running
                 start_position = self.controller.get_absolute_position()
-                for step_idx, process_step in enumerate(self.process_step_list):
-
-                    #get wp, commands, and time for each command
-                    wp= process_step.work_position
-                    nc_file=process_step.nc_file
-                    time_lists=process_step.time_lists
-                    rot_motor_id=process_step.rot_motor_id
-
-                    #Move to Work Position, then switch to laser tool.
-                    pos_now=self.controller.get_absolute_position()
-                    self.controller.move_axis_absolute(wp[0], wp[1], wp[2], speed=30, z_save=True, job_save=True)
-                    time.sleep(np.sqrt((wp[0]-pos_now[0])**2 + (wp[1]-pos_now[1])**2 + (wp[2]-pos_now[2])**2)/30*0.5)
-                    if rot_motor_id is not None:
-                        self.rot_motor_controller.move_to_angle(rot_motor_id, wp[3], wait_for_position=True)
-                    if self.execution_canceled.is_set():
-                        break
-                    self.controller.move_axis_to("relative", self.controller.laser_offset[0], self.controller.laser_offset[1], self.controller.laser_offset[2], speed=30, job_save=True)  # Move to laser offset position
-                    time.sleep(np.sqrt(self.controller.laser_offset[0]**2 + self.controller.laser_offset[1]**2 + self.controller.laser_offset[2]**2)/30*0.5)
-                    if self.execution_canceled.is_set():
-                        break
-                    self.controller.set_work_position(job_save=True)  # Set the current position as the new work position with the laser offset applied
-
-                    #Execute the NC File
-                    if process_step.file_type == "gcode":
-                        self.execute_gcode_file(nc_file, time_lists[0], fire_forget=fire_forget)
-                    elif process_step.file_type == "jcode":
-                        step_laser_wp = self.controller.get_absolute_position()
-                        step_laser_wp.append(wp[3])  # Append rot motor position
-                        self.execute_jcode_file(nc_file, rot_motor_id, step_laser_wp, time_lists, fire_forget=fire_forget)
-
-                    #finished NC File of this step. apply logging and wait for all movements to finish
-                    self.last_log = f"Commands of process_step {step_idx+1} sent. Waiting for finish. Pausing and Stopping in this step no longer possible"
-                    if not fire_forget:
-                        time.sleep(0.5)
-                        self.last_log = f"Execution of process_step {step_idx+1} completed successfully."
-                    
-                    if self.execution_canceled.is_set():
-                        break
+                self.execute_steps(self.process_step_list, fire_forget=fire_forget)
 
                 #Restore the old position after execution
                 self.controller.move_axis_absolute(start_position[0], start_position[1], start_position[2], speed=30, z_save=True, job_save=True)
-                self.process_state = "Idle"  # Reset state after completion
                 self.remaining_time = sum([step.process_time for step in self.process_step_list]) # reset remaining time
             except Exception as e:
                 self.last_log = f"Error during execution: {e}"
-                self.process_state = "Idle"  # Reset state on error
             finally:
                 self.execution_thread = None
+                self.process_state = "Idle"  # Reset state after completion or error
+
+        self.start_execution_thread(execute)
 
-        # Start execution in a separate thread
-        if self.process_state == "Idle":
+    def start_execution_thread(self, target):
+        """
+        Run target in the execution thread, so pause/resume/cancel act on it.
+        Used by start_process and by the JobQueue.
+        :param target: function to run. Is responsible for resetting the process state when done.
+        :return: True if the thread was started.
+        """
+        # Start execution in a separate thread. A job queue waiting for confirmation is Idle but still has its thread
+        if self.process_state == "Idle" and not self.execution_active():
             self.last_log= "Start Processing..."
             self.process_state = "Running"  # Set process state to Running
             self.execution_canceled.clear()
             self.execution_running.set()
-            self.execution_thread = threading.Thread(target=execute)
+            self.execution_thread = threading.Thread(target=target)
             self.execution_thread.daemon = True  # Make thread a daemon
             self.execution_thread.start()
+            return True
         else:
             self.last_log = "Execution already in progress or paused. Please cancel or resume first."
+            return False
+
+    def execution_active(self):
+        """
+        True while the execution thread exists, also while a job queue waits Idle for confirmation.
+        """
+        thread = self.execution_thread
+        return thread is not None and thread.is_alive()
+
+    def execute_steps(self, process_step_list, fire_forget=False):
+        """
+        Execute a list of process steps one after another. Must be called from the execution thread.
+        Does not restore the start position, so several step lists (jobs) can run back to back.
+        :param process_step_list: list of ProcessStep to execute
+        :return: False if the execution was canceled, True otherwise
+        """
+        time_after_lists = self.get_time_after_lists(process_step_list)
+        self.remaining_time = sum([step.process_time for step in process_step_list])
+        self.work_offsets.prepare()  # the only position query of the job
+
+        for step_idx, process_step in enumerate(process_step_list):
+
+            #get wp, commands, and time for each command
+            wp= process_step.work_position
+            nc_file=process_step.nc_file
+            time_lists=process_step.time_lists
+            gcode_command_lists=process_step.gcode_command_lists
+            cumulative_time_lists=process_step.cumulative_time_lists
+            time_after_list=time_after_lists[step_idx]
+            rot_motor_id=process_step.rot_motor_id
+            gcode_files=process_step.gcode_files
+            self._progress_step = process_step
+            self._progress_file = 0
+
+            #Move to Work Position with the laser offset applied. The origin is set with a G92 computed on the host, no M114 needed.
+            step_origin = self.work_offsets.step_origin(wp)
+            distance = self.work_offsets.move_to(step_origin, speed=30)
+            time.sleep(distance/30*0.5)
+            if rot_motor_id is not None:
+                self.rot_motor_controller.move_to_angle(rot_motor_id, wp[3], wait_for_position=True)
+            if self.execution_canceled.is_set():
+                return False
+
+            #Execute the NC File
+            if process_step.file_type == "gcode":
+                self.execute_gcode_file(nc_file, time_lists[0], fire_forget=fire_forget, gcode_commands=gcode_command_lists[0] if gcode_command_lists else None,
+                                        cumulative_time=cumulative_time_lists[0] if cumulative_time_lists else None, time_after=time_after_list[0] if len(time_after_list) else 0,
+                                        origin=step_origin, moves=gcode_files[0].moves if gcode_files else None)
+            elif process_step.file_type == "jcode":
+                step_laser_wp = list(step_origin)
+                step_laser_wp.append(wp[3])  # Append rot motor position
+                self.execute_jcode_file(nc_file, rot_motor_id, step_laser_wp, time_lists, fire_forget=fire_forget, gcode_command_lists=gcode_command_lists,
+                                        cumulative_time_lists=cumulative_time_lists, time_after_list=time_after_list, gcode_files=gcode_files)
+
+            #finished NC File of this step. apply logging and wait for all movements to finish
+            self.last_log = f"Commands of process_step {step_idx+1} sent. Waiting for finish. Pausing and Stopping in this step no longer possible"
+            if not fire_forget:
+                time.sleep(0.5)
+                self.last_log = f"Execution of process_step {step_idx+1} completed successfully."
+            
+            if self.execution_canceled.is_set():
+                return False
+
+        return True
+
+    def get_time_after_lists(self, process_step_list):
+        """
+        For every gcode file of every step, get the process time of everything that is executed after this file.
+        Together with the cumulative time of the file, the remaining time is a single lookup per command.
+        :param process_step_list: list of ProcessStep
+        :return: list (per step) of arrays (per gcode file) with the time after that file in seconds
+        """
+        file_times = [np.array([cumulative[-1] if len(cumulative) else 0 for cumulative in step.cumulative_time_lists], dtype=float) for step in process_step_list]
+        if not file_times:
+            return []
+        all_file_times = np.concatenate(file_times)
+        time_after = np.cumsum(all_file_times[::-1])[::-1] - all_file_times  # suffix sum without the file itself
+        return np.split(time_after, np.cumsum([len(times) for times in file_times])[:-1])
     
-    def pre_start_check(self):
+    def pre_start_check(self, process_step_list=None):
+        if process_step_list is None:
+            process_step_list = self.process_step_list
+
         #check if controller is connected
         if not self.controller.connected:
             self.last_log = "Error: Not connected to Artisan!"
             return False
-        if not self.process_step_list:
+        if not process_step_list:
             self.last_log = "Error: No process steps defined. Please add process steps before starting."
             return False
         
         # Check if all process steps have valid data set
-        for process_step in self.process_step_list:
+        for process_step in process_step_list:
             #check work position and nc file
             if process_step.work_position is None:
                 self.last_log = "Error: One or more process steps do not have a valid work position set."
@@ -303,19 +398,119 @@ class ProcessHandler(BaseClass):
                         if r != 0:
                             self.last_log = f"Error: Process step with J-code file {process_step.nc_file} requires a rotational motor assignment."
                             return False
+            #the work origin of every file is set on the host, files must not change it themselves
+            for gcode_file in process_step.gcode_files:
+                command = WorkOffsetManager.unsupported_command(gcode_file.commands)
+                if command is not None:
+                    self.last_log = f"Error: {gcode_file.file_path} changes the work coordinates ({command}), the work position of the step is set by the process."
+                    return False
+
+        #check that no move leaves the machine envelope or enters a keep-out zone
+        violations = self.check_soft_limits(process_step_list)
+        if violations:
+            self.last_log = "Error: Soft limit check failed!\n" + "\n".join(violations)
+            return False
 
         return True
+
+    def check_soft_limits(self, process_step_list):
+        """
+        Transform the moves of all steps into machine coordinates and check them against the machine envelope
+        (artisan.machine_envelope) and the keep-out zones (artisan.keep_out_zones) from the settings.
+        Machine coordinates are work position + laser offset + J0 offset + position in the gcode file.
+        :param process_step_list: list of ProcessStep with parsed nc files
+        :return: list of messages with the file and line of the first violating command of each step. Empty if everything is fine.
+        """
+        s = self.controller.s
+        envelope = s.get("artisan.machine_envelope", {})
+        zones = [zone for zone in s.get("artisan.keep_out_zones", {}).items() if zone[1].get("active", False)]
+        check_envelope = envelope.get("active", False)
+        if not check_envelope and not zones:
+            return []
+
+        laser_offset = np.array(self.controller.laser_offset if self.controller.laser_offset is not None else [0,0,0], dtype=float)
+        violations = []
+        for step_idx, process_step in enumerate(process_step_list):
+            first_violation = None  # (file path, line in the file, reason, command)
+            for gcode_file in process_step.gcode_files:
+                moves = gcode_file.moves
+                if len(moves) == 0:
+                    continue
+                origin = np.array(process_step.work_position[0:3], dtype=float) + laser_offset + np.array(gcode_file.work_offset[0:3], dtype=float)
+                is_move = moves.motion >= 0
+                ends = moves.positions[is_move] + origin
+                starts = moves.start_positions()[is_move] + origin
+                move_idx = np.flatnonzero(is_move)
+
+                bad = np.zeros(len(ends), dtype=bool)
+                reasons = np.full(len(ends), "", dtype=object)
+                if check_envelope:
+                    # the envelope is convex, so checking the end points is enough
+                    outside = np.any((ends < envelope["min"]) | (ends > envelope["max"]), axis=1)
+                    reasons[outside & ~bad] = "outside of machine envelope"
+                    bad |= outside
+                for name, zone in zones:
+                    hit = self._segments_hit_box(starts, ends, np.array(zone["min"], dtype=float), np.array(zone["max"], dtype=float))
+                    reasons[hit & ~bad] = f"enters keep-out zone {name}"
+                    bad |= hit
+
+                if bad.any():
+                    first = np.argmax(bad)
+                    first_violation = (gcode_file.file_path, gcode_file.line_numbers[move_idx[first]], reasons[first],
+                                       gcode_file.commands[move_idx[first]])
+                    break
+
+            if first_violation is not None:
+                file_path, line, reason, command = first_violation
+                violations.append(f"Step {step_idx+1}, {file_path} line {line} ({command}): {reason}")
+        return violations
+
+    @staticmethod
+    def _segments_hit_box(starts, ends, box_min, box_max):
+        """
+        Slab test of many line segments against one axis aligned box.
+        :return: bool array, True for every segment that touches the box
+        """
+        direction = ends - starts
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t0 = (box_min - starts)/direction
+            t1 = (box_max - starts)/direction
+        t_near = np.minimum(t0, t1)
+        t_far = np.maximum(t0, t1)
+        # axes without movement: inside the slab for the whole segment or never
+        parallel = direction == 0
+        inside_slab = (starts >= box_min) & (starts <= box_max)
+        t_near = np.where(parallel, np.where(inside_slab, -np.inf, np.inf), t_near)
+        t_far = np.where(parallel, np.where(inside_slab, np.inf, -np.inf), t_far)
+        t_enter = np.maximum(t_near.max(axis=1), 0)
+        t_exit = np.minimum(t_far.min(axis=1), 1)
+        return t_enter <= t_exit
     
-    def execute_gcode_file(self, file_path, time_list, fire_forget=False):
+    def execute_gcode_file(self, file_path, time_list, fire_forget=False, gcode_commands=None, cumulative_time=None, time_after=0, origin=None, moves=None):
         """
         Execute a single gcode file immediately.
         :param file_path: Path to the NC file.
+        :param gcode_commands: Already parsed commands of the file. If None, the file is read from disk.
+        :param cumulative_time: cumulative sum of time_list. If None, it is calculated here.
+        :param time_after: process time of everything executed after this file, for the remaining time.
+        :param origin: machine coordinates of the file's origin. Set as the work origin by self.work_offsets before the commands are sent.
+        :param moves: GCodeMoves of the commands. Parsed here if not given.
         """
-        with open(file_path, 'r') as file:
-            gcode_commands = [line.strip() for line in file if line.strip() and not line.startswith(';')]
+        if gcode_commands is None:
+            with open(file_path, 'r') as file:
+                gcode_commands = [line.strip() for line in file if line.strip() and not line.startswith(';')]
+        if moves is None:
+            moves = NCCodeInterpreter().parse_moves(gcode_commands)
+        if origin is None:
+            origin = self.work_offsets.current_position()
+        self.work_offsets.begin_file(origin, moves, gcode_commands)
         filename = os.path.basename(file_path)
         filename = filename.split('.')[0]
+        if cumulative_time is None:
+            cumulative_time = np.cumsum(time_list)
+        file_time = cumulative_time[-1] if len(cumulative_time) else 0
 
+        last_idx = -1
         for idx, command in enumerate(gcode_commands):
 
             self.execution_running.wait()  # Wait if paused
@@ -325,18 +520,28 @@ class ProcessHandler(BaseClass):
                 break
 
             self.controller.send_command(command)
+            last_idx = idx
+            self.update_progress(idx)
             if not fire_forget:
-                self.remaining_time=round((self.remaining_time-time_list[idx]) * (self.remaining_time > 0)) #
+                self.update_remaining_time(time_after + file_time - cumulative_time[idx])
                 time.sleep(time_list[idx]*0.5)  # Add a delay between commands. Factor 0.5 probably accounts for wait for ok or smth like that
         else:
             if not fire_forget:
                 self.controller.add_sync_position(text=f"step_{filename}_done", timeout=999)  # Ensure all movements are finished before proceeding
+                self.update_remaining_time(time_after, force=True)
+        self.work_offsets.end_file(last_idx)
+        self.update_progress(last_idx, force=True)
 
  
-    def execute_jcode_file(self, file_path, rot_motor_id, step_laser_wp, time_lists, fire_forget=False):
+    def execute_jcode_file(self, file_path, rot_motor_id, step_laser_wp, time_lists, fire_forget=False, gcode_command_lists=None, cumulative_time_lists=None, time_after_list=None, gcode_files=None):
         """
         Execute a J-code file which may reference multiple gcode files.
         :param file_path: Path to the J-code file.
+        :param step_laser_wp: machine coordinates of the step's origin (laser offset applied) and the rot motor position.
+        :param gcode_command_lists: Already parsed commands of the referenced gcode files (optional).
+        :param cumulative_time_lists: cumulative sums of time_lists (optional).
+        :param time_after_list: process time after each referenced gcode file (optional).
+        :param gcode_files: GCodeFile of each referenced gcode file (optional).
         """        
         try:
             with open(file_path, 'r') as file:
@@ -345,6 +550,7 @@ class ProcessHandler(BaseClass):
             self.last_log = f"Executing J-code file: {file_path}"
 
             g_code_files_counter = 0
+            x, y, z, r = step_laser_wp[0:4]
             for command in jcode_commands:
                 if command.startswith("J0"):
                     parts = command.split()
@@ -358,15 +564,20 @@ class ProcessHandler(BaseClass):
                         elif part.startswith("R"):
                             r = float(part[1:])+step_laser_wp[3]
 
-                    self.controller.move_axis_absolute(x, y, z, job_save=True)
-                    self.controller.set_work_position(job_save=True)
+                    self.work_offsets.move_to([x, y, z])
                     if rot_motor_id is not None:
                         self.rot_motor_controller.move_to_angle(rot_motor_id, r, wait_for_position=True)
                     time.sleep(0.5)  # Wait for movement to ensure stability
                 elif command.startswith("J1"):
                     parts = command.split()
                     nc_file = parts[1]
-                    self.execute_gcode_file(nc_file, time_lists[g_code_files_counter], fire_forget=fire_forget)
+                    gcode_commands = gcode_command_lists[g_code_files_counter] if gcode_command_lists else None
+                    cumulative_time = cumulative_time_lists[g_code_files_counter] if cumulative_time_lists else None
+                    time_after = time_after_list[g_code_files_counter] if time_after_list is not None else 0
+                    self._progress_file = g_code_files_counter
+                    self.execute_gcode_file(nc_file, time_lists[g_code_files_counter], fire_forget=fire_forget, gcode_commands=gcode_commands,
+                                            cumulative_time=cumulative_time, time_after=time_after, origin=[x, y, z],
+                                            moves=gcode_files[g_code_files_counter].moves if gcode_files else None)
                     g_code_files_counter += 1
             
             self.last_log = f"Execution of J-code file {file_path} completed successfully."
@@ -393,6 +604,7 @@ class ProcessHandler(BaseClass):
             self.last_log = "Error: Not connected to Artisan!"
             return
         
+        self.work_offsets.invalidate()  # axes may have been moved while paused
         self.execution_running.set()
         self.last_log = "Execution resumed."
         self.process_state = "Running"  # Update state to Running
@@ -405,7 +617,7 @@ class ProcessHandler(BaseClass):
             self.last_log = "Error: Not connected to Artisan!"
             return
         
-        if self.process_state in ["Running", "Paused"]:  # Only allow canceling if running or paused
+        if self.process_state in ["Running", "Paused"] or self.execution_active():  # Only allow canceling if running, paused or waiting
             self.execution_canceled.set()
             self.execution_running.set() #Ensure the thread can exit if it is waiting
             
@@ -467,6 +679,10 @@ class ProcessStep:
         self.command_list = []  # List to hold G-code commands for this step
         self.process_time = 0  # in seconds
         self.time_lists = []  # in seconds for each command
+        self.cumulative_time_lists = []  # cumulative sum of each time list, for remaining time lookups
+        self.gcode_command_lists = []  # commands of each gcode file, same order as time_lists
+        self.gcode_files = []  # GCodeFile with parsed moves of each gcode file, same order as time_lists
+        self.laser_statistics = None  # LaserStatistics of all gcode files of this step
         self.bounding_box = [[0,0],[0,0],[0,0],[0,0]]  #x min max, y min max, z min max
         self.rot_motor_id = None  # ID of the rotational motor if used
 
@@ -480,10 +696,13 @@ class ProcessStep:
 
         try:
 
-            self.time_lists, self.bounding_box, self.file_type, self.command_list = ncCode_interpreter.interpret_nc_file(file_path)
-            self.process_time = sum(map(sum, self.time_lists))
+            self.time_lists, self.bounding_box, self.file_type, self.command_list, self.gcode_files = ncCode_interpreter.interpret_nc_file(file_path)
+            self.gcode_command_lists = [gcode_file.commands for gcode_file in self.gcode_files]
+            self.cumulative_time_lists = [np.cumsum(time_list) for time_list in self.time_lists]
+            self.process_time = sum([cumulative[-1] for cumulative in self.cumulative_time_lists if len(cumulative)])
+            self.laser_statistics = LaserStatistics.combine([gcode_file.statistics for gcode_file in self.gcode_files])
             self.nc_file = file_path
-            return f"Successfully read singe Data file: {file_path} of type {self.file_type} with process time {self.process_time:.2f}s"
+            return f"Successfully read singe Data file: {file_path} of type {self.file_type} with process time {self.process_time:.2f}s\n{self.laser_statistics.summary()}"
 
         except Exception as e:
             self.nc_file = None
@@ -491,6 +710,10 @@ class ProcessStep:
             self.command_list = []
             self.process_time = 0
             self.time_lists = []
+            self.cumulative_time_lists = []
+            self.gcode_command_lists = []
+            self.gcode_files = []
+            self.laser_statistics = None
             self.bounding_box = [[0,0],[0,0],[0,0],[0,0]]
             return f"Failed to read Data file: {e}"
         
@@ -505,13 +728,130 @@ class ProcessStep:
 
 
 import numpy as np
+class GCodeMoves():
+    """
+    Modal machine state after every command of a gcode command list, stored as numpy arrays.
+    Index i of every array belongs to command i, so results can be mapped back to the command list.
+    """
+    def __init__(self, motion, positions, feed, power, laser_enabled, absolute):
+        self.motion = motion  # int8: 0 for G0, 1 for G1, -1 for commands that are no move
+        self.positions = positions  # (N,3) x, y, z after the command, in file coordinates
+        self.feed = feed  # feed rate in mm/min after the command
+        self.power = power  # laser power (S-value) after the command
+        self.laser_enabled = laser_enabled  # laser switched on (M3/M4) or off (M5) after the command
+        self.absolute = absolute  # G90 (True) or G91 (False) mode while the command is executed
+
+    def __len__(self):
+        return len(self.motion)
+
+    def start_positions(self, start=(0,0,0)):
+        """
+        Positions before each command, i.e. the positions shifted by one with start as the first entry.
+        """
+        start_positions = np.empty_like(self.positions)
+        start_positions[0] = start
+        start_positions[1:] = self.positions[:-1]
+        return start_positions
+
+
+class GCodeFile():
+    def __init__(self, file_path, work_offset, commands, moves, time_list, statistics=None, line_numbers=None):
+        self.file_path = file_path
+        self.work_offset = work_offset  # [x, y, z, r] offset of the J0 line before this file. 0 for plain gcode
+        self.commands = commands  # list of command strings
+        # 1-based line of each command in the file, empty lines and comments are not in commands
+        self.line_numbers = line_numbers if line_numbers is not None else list(range(1, len(commands)+1))
+        self.moves = moves  # GCodeMoves of the commands
+        self.time_list = time_list  # estimated time of each command in seconds
+        self.statistics = statistics  # LaserStatistics of the commands
+
+
+class LaserStatistics():
+    """
+    Laser usage of a gcode file or a whole process step.
+    Power values are the S-values of the gcode. Use energy() to convert them to Joule.
+    The dose histogram is the S-value integrated over time per mm² on a grid with cell_size,
+    cell (0,0) of the dose array is at dose_origin*cell_size in step coordinates.
+    """
+    def __init__(self, laser_on_time=0, travel_time=0, other_time=0, mean_power=0, max_power=0, power_integral=0,
+                 dose=None, dose_origin=(0,0), cell_size=1.0):
+        self.laser_on_time = laser_on_time  # time of G1 moves with the laser on in s
+        self.travel_time = travel_time  # time of G0 moves and G1 moves with the laser off in s
+        self.other_time = other_time  # time of all other commands in s
+        self.mean_power = mean_power  # time weighted mean S-value while the laser is on
+        self.max_power = max_power  # max S-value while the laser is on
+        self.power_integral = power_integral  # sum of S-value * time in s
+        self.dose = dose if dose is not None else np.zeros((0,0))  # S-value * s / mm², index [x, y]
+        self.dose_origin = dose_origin  # cell index of dose[0,0]
+        self.cell_size = cell_size  # in mm
+
+    @property
+    def travel_ratio(self):
+        """
+        Share of the process time spent on travel. Jobs with a high ratio are limited by travel rather than by engraving.
+        """
+        total_time = self.laser_on_time + self.travel_time + self.other_time
+        return self.travel_time/total_time if total_time > 0 else 0
+
+    def energy(self, full_power_w, full_power_s):
+        """
+        Total energy in J, with full_power_w being the laser power in W at the S-value full_power_s.
+        """
+        return self.power_integral/full_power_s*full_power_w
+
+    def dose_extent(self):
+        """
+        Area covered by the dose histogram: [x min, x max, y min, y max] in mm
+        """
+        return [self.dose_origin[0]*self.cell_size, (self.dose_origin[0]+self.dose.shape[0])*self.cell_size,
+                self.dose_origin[1]*self.cell_size, (self.dose_origin[1]+self.dose.shape[1])*self.cell_size]
+
+    def summary(self):
+        return (f"Laser on {self.laser_on_time:.1f}s, travel {self.travel_time:.1f}s ({self.travel_ratio*100:.0f}%), "
+                f"S mean {self.mean_power:.1f} max {self.max_power:.1f}")
+
+    @staticmethod
+    def combine(statistics_list):
+        """
+        Combine the statistics of several files (e.g. of one jcode step) into one.
+        All statistics must have the same cell size.
+        """
+        statistics_list = [statistics for statistics in statistics_list if statistics is not None]
+        if not statistics_list:
+            return LaserStatistics()
+        cell_size = statistics_list[0].cell_size
+        laser_on_time = sum([statistics.laser_on_time for statistics in statistics_list])
+        power_integral = sum([statistics.power_integral for statistics in statistics_list])
+
+        # sum the dose histograms on a grid that covers all of them
+        histograms = [statistics for statistics in statistics_list if statistics.dose.size]
+        if histograms:
+            origin = np.min([statistics.dose_origin for statistics in histograms], axis=0)
+            end = np.max([np.add(statistics.dose_origin, statistics.dose.shape) for statistics in histograms], axis=0)
+            dose = np.zeros(end-origin)
+            for statistics in histograms:
+                x0, y0 = np.subtract(statistics.dose_origin, origin)
+                dose[x0:x0+statistics.dose.shape[0], y0:y0+statistics.dose.shape[1]] += statistics.dose
+        else:
+            origin = (0,0)
+            dose = None
+
+        return LaserStatistics(laser_on_time=laser_on_time,
+                               travel_time=sum([statistics.travel_time for statistics in statistics_list]),
+                               other_time=sum([statistics.other_time for statistics in statistics_list]),
+                               mean_power=power_integral/laser_on_time if laser_on_time > 0 else 0,
+                               max_power=max([statistics.max_power for statistics in statistics_list]),
+                               power_integral=power_integral,
+                               dose=dose, dose_origin=tuple(int(i) for i in origin), cell_size=cell_size)
+
+
 class NCCodeInterpreter():
     def interpret_nc_file(self, file_path):
         """
         Interpret an NC file and return command list, time list, and bounding box.
         Supported file types: G-code (.nc) and J-code (.jcode).
         :param file_path: Path to the NC file.
-        :return: command_list, time_list, bounding_box
+        :return: time_lists, bounding_box, file_type, command_list, gcode_files (list of GCodeFile)
         """
         #first get a list of pointers to gcode files
         gcode_file_list = []# this is a list of [file_path, wp]
@@ -520,9 +860,6 @@ class NCCodeInterpreter():
         if file_path.lower().endswith('.nc'):
             file_type = "gcode"
             gcode_file_list.append([file_path,wp])
-            with open(file_path, 'r') as file:
-                gcode_commands = [line.strip() for line in file if line.strip() and not line.startswith(';')]
-                full_command_list.extend(gcode_commands)
         elif file_path.lower().endswith('.jcode'):
             file_type = "jcode"
             with open(file_path, 'r') as file:
@@ -542,21 +879,28 @@ class NCCodeInterpreter():
                     
                 elif command.startswith("J1"):
                     parts = command.split()
-                    gcode_file_list.append([parts[1],wp])  # The G-code file name is the second part
+                    gcode_file_list.append([parts[1],list(wp)])  # The G-code file name is the second part. Copy wp, it changes with the next J0
 
 
         #now read all gcode files and extract time_lists and bounding box
         time_lists = []
+        gcode_files = []
         combined_bounding_box = [[0,0],[0,0],[0,0],[0,0]]
         for gcode_file in gcode_file_list:
             file_path = gcode_file[0]
             wp = gcode_file[1]
             try:
                 with open(file_path, 'r') as file:
-                    gcode_commands = [line.strip() for line in file if line.strip() and not line.startswith(';')]
+                    numbered_commands = [(number, line.strip()) for number, line in enumerate(file, 1)
+                                         if line.strip() and not line.startswith(';')]
+                gcode_commands = [command for _, command in numbered_commands]
+                line_numbers = [number for number, _ in numbered_commands]
                 full_command_list.extend(gcode_commands)
-                time_list, bounding_box = self.interpret_gcode(gcode_commands, wp=wp[0:3])
+                moves = self.parse_moves(gcode_commands)
+                time_list, bounding_box = self.interpret_gcode(gcode_commands, wp=wp[0:3], moves=moves)
+                statistics = self.laser_statistics(moves, time_list, wp=wp[0:3])
                 time_lists.append(time_list)
+                gcode_files.append(GCodeFile(file_path, wp, gcode_commands, moves, time_list, statistics, line_numbers))
                 #update bounding box
                 combined_bounding_box[0][0] = min(combined_bounding_box[0][0], bounding_box[0][0])
                 combined_bounding_box[0][1] = max(combined_bounding_box[0][1], bounding_box[0][1])
@@ -570,42 +914,202 @@ class NCCodeInterpreter():
             except Exception as e:
                 print(f"Failed to read G-code file {gcode_file}: {e}")
         
-        return time_lists, combined_bounding_box, file_type, full_command_list
+        return time_lists, combined_bounding_box, file_type, full_command_list, gcode_files
 
-    def interpret_gcode(self, command_list, wp= [0,0,0]):
+    def interpret_gcode(self, command_list, wp= [0,0,0], moves=None):
         """
-        Returns all G0 and G1 commands as arrays of doubles: [x, y, z, speed].
-        Only commands with X, Y, Z, and F (speed) are included.
+        Estimate the time of every command and the bounding box of all G0 and G1 moves.
+        :param command_list: list of gcode commands
+        :param wp: offset that is added to all coordinates
+        :param moves: GCodeMoves of command_list. Parsed here if not given.
+        :return: time_list (array with time of each command in seconds, at least 0.01s), bounding_box
         """
-        time_list = [0.01 for _ in command_list]
+        if moves is None:
+            moves = self.parse_moves(command_list)
+        if len(moves) == 0:
+            return np.zeros(0), [[0,0],[0,0],[0,0]]
+
+        distance = np.linalg.norm(moves.positions - moves.start_positions(), axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            time_list = np.maximum(np.where(moves.motion >= 0, distance/moves.feed*60, 0), 0.01)
+
         bounding_box = [[0,0],[0,0],[0,0]]  # x min max, y min max, z min max
-        f=6000
-        x, y, z = wp[0], wp[1], wp[2]
-        x_new, y_new, z_new = x, y, z
-        for idx,command in enumerate(command_list):
-            if command.startswith("G0") or command.startswith("G1"):
-                # Example: "G1 X10.0 Y20.0 Z5.0 F1200"
-                parts = command.split()
-                for part in parts:
-                    if part.startswith("X"):
-                        x_new = float(part[1:])+wp[0]
-                    elif part.startswith("Y"):
-                        y_new = float(part[1:])+wp[1]
-                    elif part.startswith("Z"):
-                        z_new = float(part[1:])+wp[2]
-                    elif part.startswith("F"):
-                        f = float(part[1:])
-                command_time = np.sqrt((x-x_new)**2+(y-y_new)**2+(z-z_new)**2)/f*60
-                bounding_box[0][0] = min(bounding_box[0][0], x_new)
-                bounding_box[0][1] = max(bounding_box[0][1], x_new)
-                bounding_box[1][0] = min(bounding_box[1][0], y_new)
-                bounding_box[1][1] = max(bounding_box[1][1], y_new)
-                bounding_box[2][0] = min(bounding_box[2][0], z_new)
-                bounding_box[2][1] = max(bounding_box[2][1], z_new)
-                if command_time>0.01:
-                    time_list[idx]=command_time
-                x=x_new
-                y=y_new
-                z=z_new
+        move_positions = moves.positions[moves.motion >= 0]
+        if len(move_positions):
+            for axis in range(3):
+                bounding_box[axis][0] = min(0, float(move_positions[:, axis].min()+wp[axis]))
+                bounding_box[axis][1] = max(0, float(move_positions[:, axis].max()+wp[axis]))
   
-        return time_list, bounding_box
\ No newline at end of file
+        return time_list, bounding_box
+
+    def laser_statistics(self, moves, time_list, wp=[0,0,0], cell_size=1.0, max_samples=2000000):
+        """
+        Laser on time, travel time, power and dose histogram of a gcode file.
+        A G1 move burns if the laser is enabled and S > 0. Long moves are split into pieces of cell_size for the dose histogram,
+        or into longer pieces if this would give more than max_samples pieces.
+        :param moves: GCodeMoves of the file
+        :param time_list: time of each command from interpret_gcode
+        :param wp: offset that is added to all coordinates
+        :param cell_size: cell size of the dose histogram in mm
+        :return: LaserStatistics
+        """
+        if len(moves) == 0:
+            return LaserStatistics(cell_size=cell_size)
+        time_list = np.asarray(time_list)
+        burning = (moves.motion == 1) & moves.laser_enabled & (moves.power > 0)
+        travel = (moves.motion >= 0) & ~burning
+        laser_on_time = time_list[burning].sum()
+        power_integral = (moves.power[burning]*time_list[burning]).sum()
+
+        dose = None
+        dose_origin = (0,0)
+        if burning.any():
+            starts = moves.start_positions()[burning, 0:2] + wp[0:2]
+            ends = moves.positions[burning, 0:2] + wp[0:2]
+            energy = moves.power[burning]*time_list[burning]
+            length = np.linalg.norm(ends-starts, axis=1)
+            piece_length = max(cell_size, length.sum()/max_samples)
+            pieces = np.maximum(np.ceil(length/piece_length).astype(np.int64), 1)
+            # sample every piece at its center and give it an equal share of the move's S*t
+            move_idx = np.repeat(np.arange(len(pieces)), pieces)
+            piece_idx = np.arange(len(move_idx)) - np.repeat(np.cumsum(pieces)-pieces, pieces)
+            fraction = ((piece_idx+0.5)/pieces[move_idx])[:, None]
+            points = starts[move_idx] + (ends[move_idx]-starts[move_idx])*fraction
+            cells = np.floor(points/cell_size).astype(np.int64)
+            dose_origin = cells.min(axis=0)
+            cells -= dose_origin
+            shape = cells.max(axis=0)+1
+            dose = np.bincount(cells[:, 0]*shape[1]+cells[:, 1], weights=energy[move_idx]/pieces[move_idx],
+                               minlength=shape[0]*shape[1]).reshape(shape)/cell_size**2
+            dose_origin = tuple(int(i) for i in dose_origin)
+
+        return LaserStatistics(laser_on_time=float(laser_on_time),
+                               travel_time=float(time_list[travel].sum()),
+                               other_time=float(time_list[moves.motion < 0].sum()),
+                               mean_power=float(power_integral/laser_on_time) if laser_on_time > 0 else 0,
+                               max_power=float(moves.power[burning].max()) if burning.any() else 0,
+                               power_integral=float(power_integral),
+                               dose=dose, dose_origin=dose_origin, cell_size=cell_size)
+
+    def parse_moves(self, command_list, default_feed=6000):
+        """
+        Parse a gcode command list into a GCodeMoves object.
+        Only G0/G1 commands change the position and feed. S changes the power on any command,
+        M3/M4 and M5 switch the laser on and off. If a file never switches the laser, it is assumed to be on.
+        :param command_list: list of gcode commands
+        :param default_feed: feed rate in mm/min before the first F word
+        """
+        n = len(command_list)
+        letters, values, lines = self._tokenize(command_list)
+
+        def modal(line_idx, line_values, start_value, dtype=float):
+            # value set on a command stays valid until the next command that sets it
+            result = np.full(n, np.nan)
+            result[line_idx] = line_values
+            has_value = ~np.isnan(result)
+            last = np.maximum.accumulate(np.where(has_value, np.arange(n), -1))
+            return np.where(last >= 0, result[np.maximum(last, 0)], start_value).astype(dtype)
+
+        is_g = letters == ord('G')
+        is_m = letters == ord('M')
+
+        motion = np.full(n, -1, dtype=np.int8)
+        is_move_word = is_g & ((values == 0) | (values == 1))
+        motion[lines[is_move_word]] = values[is_move_word]
+        is_move = motion >= 0
+
+        is_mode_word = is_g & ((values == 90) | (values == 91))
+        absolute = modal(lines[is_mode_word], values[is_mode_word] == 90, 1, dtype=bool)
+
+        is_laser_word = is_m & ((values == 3) | (values == 4) | (values == 5))
+        laser_enabled = modal(lines[is_laser_word], values[is_laser_word] != 5, not is_laser_word.any(), dtype=bool)
+
+        on_move = is_move[lines]
+        is_feed = (letters == ord('F')) & on_move
+        feed = modal(lines[is_feed], values[is_feed], default_feed)
+        is_power = letters == ord('S')
+        power = modal(lines[is_power], values[is_power], 0)
+
+        positions = np.zeros((n, 3))
+        for axis, letter in enumerate("XYZ"):
+            is_axis = (letters == ord(letter)) & on_move
+            axis_values = np.full(n, np.nan)
+            axis_values[lines[is_axis]] = values[is_axis]
+            has_value = ~np.isnan(axis_values)
+            # absolute words set the position, relative words add to it
+            relative_steps = np.where(has_value & ~absolute, axis_values, 0)
+            relative_sum = np.cumsum(relative_steps)
+            last_absolute = np.maximum.accumulate(np.where(has_value & absolute, np.arange(n), -1))
+            safe_last = np.maximum(last_absolute, 0)
+            positions[:, axis] = np.where(last_absolute >= 0,
+                                          axis_values[safe_last] + relative_sum - relative_sum[safe_last],
+                                          relative_sum)
+
+        return GCodeMoves(motion, positions, feed, power, laser_enabled, absolute)
+
+    def _tokenize(self, command_list):
+        """
+        Split commands into words (letter + number) without looping over the commands in python.
+        The numbers of all words are parsed in one call by blanking every character that is not part of a word's number.
+        Falls back to a per-command loop if a number cannot be parsed.
+        :return: letters (uint8 ascii code), values (float), lines (index of the command of each word)
+        """
+        if not command_list:
+            return np.zeros(0, dtype=np.uint8), np.zeros(0), np.zeros(0, dtype=np.int64)
+
+        text = "\n".join(command_list).upper()
+        if ';' in text:
+            text = re.sub(r';[^\n]*', '', text)  # inline comments
+        chars = np.frombuffer(text.encode('ascii', 'replace'), dtype=np.uint8)
+
+        is_num = ((chars >= ord('0')) & (chars <= ord('9'))) | (chars == ord('.')) | (chars == ord('-')) | (chars == ord('+'))
+        is_letter = (chars >= ord('A')) & (chars <= ord('Z'))
+        prev_num = np.zeros_like(is_num)
+        prev_num[1:] = is_num[:-1]
+        run_starts = np.flatnonzero(is_num & ~prev_num)
+        run_ends = np.flatnonzero(~is_num & prev_num)
+        if len(run_ends) < len(run_starts):
+            run_ends = np.append(run_ends, len(chars))
+
+        # a number belongs to a word if it directly follows a single letter, like X12.5 (but not in M118 step_1_done)
+        letter_pos = run_starts - 1
+        is_word = np.zeros(len(run_starts), dtype=bool)
+        valid = letter_pos >= 0
+        is_word[valid] = is_letter[letter_pos[valid]]
+        before_letter = letter_pos - 1
+        check = is_word & (before_letter >= 0)
+        is_word[check] = ~is_letter[before_letter[check]]
+        run_starts = run_starts[is_word]
+        run_ends = run_ends[is_word]
+
+        keep = np.zeros(len(chars)+1, dtype=np.int8)
+        keep[run_starts] = 1  # runs never touch, so starts and ends are unique
+        keep[run_ends] = -1
+        keep = np.cumsum(keep[:-1], dtype=np.int8).astype(bool)
+        number_text = np.where(keep, chars, ord(' ')).astype(np.uint8).tobytes()
+
+        letters = chars[run_starts-1]
+        lines = np.searchsorted(np.flatnonzero(chars == ord('\n')), run_starts)
+        try:
+            values = np.array(number_text.split(), dtype=float)
+        except ValueError:
+            values = None
+        if values is None or len(values) != len(run_starts):
+            return self._tokenize_loop(command_list)
+        return letters, values, lines
+
+    def _tokenize_loop(self, command_list):
+        """
+        Slow fallback of _tokenize. Words with numbers that cannot be parsed are skipped.
+        """
+        letters, values, lines = [], [], []
+        for idx, command in enumerate(command_list):
+            command = command.split(';')[0].upper()
+            for word in re.findall(r'(?<![A-Z])([A-Z])([-+.0-9]+)', command):
+                try:
+                    values.append(float(word[1]))
+                except ValueError:
+                    continue
+                letters.append(ord(word[0]))
+                lines.append(idx)
+        return np.array(letters, dtype=np.uint8), np.array(values, dtype=float), np.array(lines, dtype=np.int64)
@@ -0,0 +1,332 @@
+import numpy as np
+from PyQt6 import QtWidgets, QtGui, QtCore
+
+TRAVEL_GRAY = 76  # how much a travel move darkens the white background
+LASER_GAIN = 255  # darkening of one pass at full weight. Overlapping passes add up until the pixel is black
+
+
+def clip_segments(start, end, width, height):
+    """
+    Clip segments in pixel coordinates to the image [0, width) x [0, height) (Liang-Barsky, for all segments at once).
+    Only segments that cross the image border are clipped, the others are kept or dropped by their bounding box.
+    :param start, end: (N,2) x, y of the segment ends
+    :return: clipped start, end and the indices of the segments that are (partly) inside
+    """
+    limits = np.array([width - 1e-3, height - 1e-3])
+    low = np.minimum(start, end)
+    high = np.maximum(start, end)
+    overlaps = (high >= 0).all(axis=1) & (low <= limits).all(axis=1)
+    crossing = overlaps & ((low < 0).any(axis=1) | (high > limits).any(axis=1))
+    keep = overlaps & ~crossing
+
+    idx = np.flatnonzero(crossing)
+    s = start[idx]
+    delta = end[idx] - s
+    t0 = np.zeros(len(idx))
+    t1 = np.ones(len(idx))
+    for p, q in [(-delta[:,0], s[:,0]), (delta[:,0], limits[0]-s[:,0]),
+                 (-delta[:,1], s[:,1]), (delta[:,1], limits[1]-s[:,1])]:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = q/p
+        t0 = np.where(p < 0, np.maximum(t0, t), t0)
+        t1 = np.where(p > 0, np.minimum(t1, t), t1)
+    inside = t0 <= t1
+    # clip once more against rounding errors of the intersections
+    clipped_start = np.clip(s[inside] + t0[inside,None]*delta[inside], 0, limits)
+    clipped_end = np.clip(s[inside] + t1[inside,None]*delta[inside], 0, limits)
+
+    kept = np.flatnonzero(keep)
+    return (np.concatenate([start[kept], clipped_start]), np.concatenate([end[kept], clipped_end]),
+            np.concatenate([kept, idx[inside]]))
+
+
+def _accumulate_runs(x0, y0, x1, y1, weights, height, width, max_runs):
+    """
+    Accumulate segments whose x extent is at least their y extent. Each segment is split into one horizontal run
+    per image row it crosses, the runs are added to a difference image which is integrated along the rows.
+    The work is proportional to the number of runs instead of the length of the segments.
+    If there are more than max_runs runs (many long diagonal segments), the segments are sampled instead.
+    """
+    r0 = np.floor(y0).astype(np.int64)
+    r1 = np.floor(y1).astype(np.int64)
+    run_count = np.abs(r1-r0)+1
+    if run_count.sum() > max_runs:
+        return _accumulate_samples(x0, y0, x1, y1, weights, height, width, max_runs)
+    seg = np.repeat(np.arange(len(x0)), run_count)
+    run = np.arange(len(seg)) - np.repeat(np.cumsum(run_count)-run_count, run_count)
+    row = r0[seg] + run*np.where(r1 >= r0, 1, -1)[seg]
+
+    dy = y1-y0
+    flat = dy == 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = np.where(flat, 0, (x1-x0)/dy)
+    y_low = np.maximum(np.minimum(y0, y1)[seg], row)
+    y_high = np.minimum(np.maximum(y0, y1)[seg], row+1)
+    xa = np.where(flat[seg], x0[seg], x0[seg] + (y_low-y0[seg])*slope[seg])
+    xb = np.where(flat[seg], x1[seg], x0[seg] + (y_high-y0[seg])*slope[seg])
+    c_start = np.clip(np.floor(np.minimum(xa, xb)).astype(np.int64), 0, width-1)
+    c_end = np.clip(np.floor(np.maximum(xa, xb)).astype(np.int64), 0, width-1)
+
+    run_weights = weights[seg]
+    diff = np.bincount(np.concatenate([row*(width+1)+c_start, row*(width+1)+c_end+1]),
+                       weights=np.concatenate([run_weights, -run_weights]), minlength=height*(width+1))
+    return np.cumsum(diff.reshape(height, width+1), axis=1)[:, :width]
+
+
+def _accumulate_samples(x0, y0, x1, y1, weights, height, width, max_samples):
+    """
+    Approximate the segments by at most about max_samples points, each carrying the line length it stands for.
+    A pixel crossed by a segment gets about the segment's weight, like in _accumulate_runs.
+    """
+    length = np.hypot(x1-x0, y1-y0)
+    piece_length = max(1.0, length.sum()/max_samples)
+    sample_count = np.maximum(np.ceil(length/piece_length).astype(np.int64), 1)
+    seg = np.repeat(np.arange(len(x0)), sample_count)
+    t = (np.arange(len(seg)) - np.repeat(np.cumsum(sample_count)-sample_count, sample_count) + 0.5)/sample_count[seg]
+    x = np.clip(np.floor(x0[seg] + (x1-x0)[seg]*t).astype(np.int64), 0, width-1)
+    y = np.clip(np.floor(y0[seg] + (y1-y0)[seg]*t).astype(np.int64), 0, height-1)
+    sample_weights = (weights*np.maximum(length, 1)/sample_count)[seg]
+    return np.bincount(y*width+x, weights=sample_weights, minlength=height*width).reshape(height, width)
+
+
+def rasterize_segments(start, end, height, width, weights=None, max_runs=2000000):
+    """
+    Draw line segments into an accumulation image. Every pixel a segment passes through gets the segment's weight added.
+    :param start, end: (N,2) x, y of the segment ends in pixel coordinates (x to the right, y down)
+    :param weights: (N,) weight of each segment, 1 if None
+    :param max_runs: above this number of pixel runs the segments are sampled, which bounds the time for dense jobs
+    :return: (height, width) float32 image
+    """
+    image = np.zeros((height, width), dtype=np.float32)
+    if weights is None:
+        weights = np.ones(len(start))
+    start, end, idx = clip_segments(np.asarray(start, dtype=np.float64), np.asarray(end, dtype=np.float64), width, height)
+    if not len(idx):
+        return image
+    weights = np.asarray(weights, dtype=np.float64)[idx]
+    delta = np.abs(end-start)
+    x_major = delta[:,0] >= delta[:,1]
+    if x_major.any():
+        s, e = start[x_major], end[x_major]
+        image += _accumulate_runs(s[:,0], s[:,1], e[:,0], e[:,1], weights[x_major], height, width, max_runs*len(s)/len(idx))
+    if not x_major.all():
+        # y-major segments are x-major segments of the transposed image
+        s, e = start[~x_major], end[~x_major]
+        image += _accumulate_runs(s[:,1], s[:,0], e[:,1], e[:,0], weights[~x_major], width, height, max_runs*len(s)/len(idx)).T
+    return image
+
+
+class RasterPreview():
+    """
+    2D preview of toolpaths without OpenGL. The segments are rasterized with numpy into square tiles.
+    Level 0 shows the whole job in one tile, every further level halves the pixel size.
+    Rendered tiles are cached per level, so panning and zooming back only renders tiles that were not seen yet.
+    """
+    def __init__(self, tile_size=256, max_level=20, max_tiles=512, max_runs=2000000):
+        self.tile_size = tile_size
+        self.max_runs = max_runs  # work limit of one render pass, see rasterize_segments
+        self.max_level = max_level
+        self.max_tiles = max_tiles
+        self.show_moves = True
+        self.power_weighted = False
+        self.tiles = {}  # (level, tx, ty) -> (QImage, pixel array). Oldest first
+        self.set_toolpaths(np.zeros((0,2)), np.zeros((0,2)), np.zeros(0, dtype=bool))
+
+    def set_toolpaths(self, start, end, laser_on, power=None):
+        """
+        :param start, end: (N,2) x, y of the segments in mm (machine coordinates)
+        :param laser_on: (N,) True for segments with the laser on, False for travel moves
+        :param power: (N,) laser power of the segments, used for the power weighted intensity
+        """
+        start = np.asarray(start, dtype=np.float64)
+        end = np.asarray(end, dtype=np.float64)
+        self.layers = {}
+        for name, mask in [("laser", laser_on), ("travel", ~laser_on)]:
+            layer_start, layer_end = start[mask], end[mask]
+            weights = np.ones(len(layer_start))
+            if name == "laser" and power is not None and len(layer_start):
+                max_power = np.max(power[mask])
+                if max_power > 0:
+                    weights = power[mask]/max_power
+            self.layers[name] = (layer_start, layer_end, np.minimum(layer_start, layer_end), np.maximum(layer_start, layer_end), weights)
+
+        if len(start):
+            self.bounds_min = np.minimum(start.min(0), end.min(0))
+            self.bounds_max = np.maximum(start.max(0), end.max(0))
+        else:
+            self.bounds_min, self.bounds_max = np.zeros(2), np.ones(2)
+        extent = max(np.max(self.bounds_max-self.bounds_min), 1e-3)
+        self.base_pixel_size = extent/self.tile_size
+        # the tile grid starts at the top left corner of the job, y points down in the tiles
+        self.origin = np.array([self.bounds_min[0], self.bounds_max[1]])
+        self.tiles = {}
+
+    def set_options(self, show_moves=None, power_weighted=None):
+        if show_moves is not None:
+            self.show_moves = show_moves
+        if power_weighted is not None:
+            self.power_weighted = power_weighted
+        self.tiles = {}
+
+    def pixel_size(self, level):
+        return self.base_pixel_size/2**level
+
+    def level_for_pixel_size(self, pixel_size):
+        """
+        Finest level that is not finer than needed for the given size of a screen pixel in mm.
+        """
+        if pixel_size <= 0:
+            return self.max_level
+        level = int(np.ceil(np.log2(self.base_pixel_size/pixel_size) - 1e-9))
+        return min(max(level, 0), self.max_level)
+
+    def tile_bounds(self, level, tx, ty):
+        """
+        :return: x of the left edge and y of the top edge of a tile in mm, size of the tile in mm
+        """
+        size = self.tile_size*self.pixel_size(level)
+        return self.origin[0] + tx*size, self.origin[1] - ty*size, size
+
+    def render_block(self, level, tx, ty, columns=1, rows=1):
+        """
+        Rasterize the layers into a block of tiles in one pass.
+        :return: (rows*tile_size, columns*tile_size) uint8 gray values
+        """
+        left, top, size = self.tile_bounds(level, tx, ty)
+        pixel_size = self.pixel_size(level)
+        height, width = rows*self.tile_size, columns*self.tile_size
+        gray = np.full((height, width), 255.0, dtype=np.float32)
+        layers = ["travel", "laser"] if self.show_moves else ["laser"]
+        visible = {}
+        for name in layers:
+            _, _, seg_min, seg_max, _ = self.layers[name]
+            visible[name] = np.flatnonzero((seg_max[:,0] >= left) & (seg_min[:,0] <= left+columns*size) &
+                                           (seg_min[:,1] <= top) & (seg_max[:,1] >= top-rows*size))
+        visible_count = max(sum([len(idx) for idx in visible.values()]), 1)
+        to_pixels = np.array([1, -1])/pixel_size
+        for name in layers:
+            start, end, _, _, weights = self.layers[name]
+            idx = visible[name]
+            if not len(idx):
+                continue
+            image = rasterize_segments((start[idx]-(left, top))*to_pixels, (end[idx]-(left, top))*to_pixels, height, width,
+                                       weights[idx] if self.power_weighted else None, self.max_runs*len(idx)/visible_count)
+            if name == "travel":
+                gray -= TRAVEL_GRAY*np.minimum(image, 1)
+            else:
+                gray *= 1 - np.minimum(image*LASER_GAIN, 255)/255
+        return gray.astype(np.uint8)
+
+    def tile_images(self, level, tx_range, ty_range):
+        """
+        Cached QImages of a range of tiles. All missing tiles are rendered together.
+        :return: dict (tx, ty) -> QImage
+        """
+        missing = [(tx, ty) for ty in ty_range for tx in tx_range if (level, tx, ty) not in self.tiles]
+        if missing:
+            tx0, ty0 = min(tx for tx, _ in missing), min(ty for _, ty in missing)
+            columns, rows = max(tx for tx, _ in missing)-tx0+1, max(ty for _, ty in missing)-ty0+1
+            block = self.render_block(level, tx0, ty0, columns, rows)
+            size = self.tile_size
+            for tx, ty in missing:
+                pixels = np.ascontiguousarray(block[(ty-ty0)*size:(ty-ty0+1)*size, (tx-tx0)*size:(tx-tx0+1)*size])
+                image = QtGui.QImage(pixels.data, size, size, size, QtGui.QImage.Format.Format_Grayscale8)
+                self.tiles[(level, tx, ty)] = (image, pixels)  # the QImage does not own the pixel buffer
+
+        images = {}
+        for ty in ty_range:
+            for tx in tx_range:
+                # move the used tiles to the end, the oldest unused ones are dropped first
+                images[(tx, ty)] = self.tiles[(level, tx, ty)] = self.tiles.pop((level, tx, ty))
+        while len(self.tiles) > max(self.max_tiles, len(images)):
+            self.tiles.pop(next(iter(self.tiles)))
+        return {key: tile[0] for key, tile in images.items()}
+
+
+class RasterPreviewWidget(QtWidgets.QWidget):
+    """
+    Shows a RasterPreview and the tool marker of a running job. Drag to pan, scroll to zoom, double click to show the whole job.
+    """
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.preview = RasterPreview()
+        self.center = np.array([0.5, 0.5])  # mm at the center of the widget
+        self.view_pixel_size = 1.0  # mm per screen pixel
+        self._drag_start = None
+        self.tool_position = None  # x, y in mm of the tool marker, None to hide it
+        self.setMinimumSize(100, 100)
+
+    def set_toolpaths(self, start, end, laser_on, power=None):
+        self.preview.set_toolpaths(start, end, laser_on, power)
+        self.fit_view()
+
+    def set_options(self, show_moves=None, power_weighted=None):
+        self.preview.set_options(show_moves, power_weighted)
+        self.update()
+
+    def set_tool_position(self, position):
+        self.tool_position = None if position is None else np.array(position[0:2], dtype=float)
+        self.update()
+
+    def fit_view(self):
+        self.center = (self.preview.bounds_min + self.preview.bounds_max)/2
+        extent = np.maximum(self.preview.bounds_max - self.preview.bounds_min, 1e-3)
+        self.view_pixel_size = max(extent[0]/max(self.width()-20, 1), extent[1]/max(self.height()-20, 1))
+        self.update()
+
+    def screen_to_world(self, x, y):
+        return self.center + (np.array([x - self.width()/2, self.height()/2 - y]))*self.view_pixel_size
+
+    def paintEvent(self, event):
+        painter = QtGui.QPainter(self)
+        painter.fillRect(self.rect(), QtGui.QColor(255, 255, 255))
+        preview = self.preview
+        level = preview.level_for_pixel_size(self.view_pixel_size)
+        tile_mm = preview.tile_size*preview.pixel_size(level)
+        left, top = self.screen_to_world(0, 0)
+        right, bottom = self.screen_to_world(self.width(), self.height())
+        # only tiles that overlap the job and the widget
+        tx_range = range(max(int(np.floor((left-preview.origin[0])/tile_mm)), 0),
+                         min(int(np.floor((right-preview.origin[0])/tile_mm)), int((preview.bounds_max[0]-preview.origin[0])/tile_mm)) + 1)
+        ty_range = range(max(int(np.floor((preview.origin[1]-top)/tile_mm)), 0),
+                         min(int(np.floor((preview.origin[1]-bottom)/tile_mm)), int((preview.origin[1]-preview.bounds_min[1])/tile_mm)) + 1)
+        for (tx, ty), image in preview.tile_images(level, tx_range, ty_range).items():
+            tile_left, tile_top, _ = preview.tile_bounds(level, tx, ty)
+            x = (tile_left - self.center[0])/self.view_pixel_size + self.width()/2
+            y = (self.center[1] - tile_top)/self.view_pixel_size + self.height()/2
+            size = tile_mm/self.view_pixel_size
+            painter.drawImage(QtCore.QRectF(x, y, size, size), image)
+        if self.tool_position is not None:
+            x = (self.tool_position[0] - self.center[0])/self.view_pixel_size + self.width()/2
+            y = (self.center[1] - self.tool_position[1])/self.view_pixel_size + self.height()/2
+            painter.setRenderHint(QtGui.QPainter.RenderHint.Antialiasing)
+            painter.setPen(QtCore.Qt.PenStyle.NoPen)
+            painter.setBrush(QtGui.QColor(255, 51, 0))
+            painter.drawEllipse(QtCore.QPointF(x, y), 5, 5)
+        painter.end()
+
+    def wheelEvent(self, event):
+        # zoom about the mouse position
+        position = event.position()
+        anchor = self.screen_to_world(position.x(), position.y())
+        factor = 0.8 if event.angleDelta().y() > 0 else 1.25
+        self.view_pixel_size *= factor
+        self.center = anchor + (self.center-anchor)*factor
+        self.update()
+
+    def mousePressEvent(self, event):
+        self._drag_start = (event.position(), self.center.copy())
+
+    def mouseMoveEvent(self, event):
+        if self._drag_start is None:
+            return
+        position, center = self._drag_start
+        delta = event.position() - position
+        self.center = center + np.array([-delta.x(), delta.y()])*self.view_pixel_size
+        self.update()
+
+    def mouseReleaseEvent(self, event):
+        self._drag_start = None
+
+    def mouseDoubleClickEvent(self, event):
+        self.fit_view()
@@ -0,0 +1,269 @@
+import threading
+import time
+import cv2
+import numpy as np
+from Cross_Detection import LaserCrossDetector, create_cross_detector
+
+class ServoState():
+    """
+    One step of the visual servo, in pixel coordinates of the captured (not flipped) frame.
+    """
+    def __init__(self, iteration, cross=None, target=None, move=None, status="running"):
+        self.iteration = iteration
+        self.cross = cross  # (x, y) of the detected laser cross
+        self.target = target  # (x, y) where the clicked feature is now
+        self.move = move  # (dx, dy) of the relative move issued after this step, in machine units
+        self.status = status  # "running", "converged", "failed" or "cancelled"
+
+    @property
+    def error(self):
+        if self.cross is None or self.target is None:
+            return None
+        return float(np.hypot(self.target[0] - self.cross[0], self.target[1] - self.cross[1]))
+
+
+class VisualServo():
+    """
+    Drives the laser cross onto a feature of the camera image in a closed loop.
+    The feature is found again in every frame by template matching against the frame it was clicked in,
+    the cross by the cross detector.
+    Every step maps both positions through the camera homography (pixels -> relative move) and moves by the
+    difference, waits until the machine stands still and looks at the next frame, until they are closer than
+    tolerance pixels. Because the error is measured again after each move, an inaccurate homography only costs
+    an extra step instead of leaving an offset.
+    Runs in its own thread, the states are published to the state callbacks (in that thread).
+    """
+    def __init__(self, settings, camera_controller, artisan_controller, coord_transformer):
+        self.s = settings
+        self.camera_controller = camera_controller
+        self.artisan_controller = artisan_controller
+        self.coord_transformer = coord_transformer
+        self.mask_detector = LaserCrossDetector()  # red mask of the laser cross
+        self.thread = None
+        self._stop = threading.Event()
+        self._last_log = ''
+        self.latest_state = None
+
+        # Callbacks for GUI updates
+        self.state_callbacks = []
+        self.log_callbacks = []
+
+        self.load_settings()
+        settings.settingChanged.connect(self.load_settings)  # Reload settings if they change
+        settings.settingsReplaced.connect(self.load_settings)  # Reload settings if they are replaced
+
+    def load_settings(self):
+        self.tolerance = self.s.get("laser_camera.visual_servo.tolerance_px", 1.0)  # pixels between cross and target
+        self.max_iterations = self.s.get("laser_camera.visual_servo.max_iterations", 10)
+        self.gain = self.s.get("laser_camera.visual_servo.gain", 1.0)  # share of the measured error that is moved per step
+        self.template_size = self.s.get("laser_camera.visual_servo.template_size", 96)  # pixels, edge of the feature patch
+        self.search_radius = self.s.get("laser_camera.visual_servo.search_radius", 64)  # pixels around the predicted position
+        self.laser_margin = self.s.get("laser_camera.visual_servo.laser_margin", 7)  # pixels around the laser cross not used for matching
+        self.min_match = self.s.get("laser_camera.visual_servo.min_match", 0.5)  # normalized correlation of the feature
+        self.settle_frames = self.s.get("laser_camera.visual_servo.settle_frames", 2)  # frames dropped after a move
+        self.detection_attempts = 5  # frames the cross may be missing in before the servo gives up
+        self.frame_timeout = 2.0  # seconds
+
+    @property
+    def last_log(self):
+        return self._last_log
+
+    @last_log.setter
+    def last_log(self, value):
+        self._last_log = value
+        for callback in self.log_callbacks:
+            callback(value)
+
+    def set_log_callback(self, callback):
+        self.log_callbacks.append(callback)
+
+    def set_state_callback(self, callback):
+        self.state_callbacks.append(callback)
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, target):
+        """
+        :param target: (x, y) of the feature in pixel coordinates of the captured (not flipped) frame
+        """
+        if self.running:
+            self.last_log = "Visual servo is already running."
+            return
+        H = self.coord_transformer.H_21
+        if H is None or not np.any(H) or not np.all(np.isfinite(H)):
+            self.last_log = "Visual servo needs a calibrated camera homography."
+            return
+        if self.artisan_controller is None or not self.artisan_controller.connected:
+            self.last_log = "Visual servo needs a connected Artisan."
+            return
+        if self.artisan_controller.process_state != "Idle":
+            self.last_log = "Visual servo can only run while no process is running or paused."
+            return
+        self._stop.clear()
+        self.thread = threading.Thread(target=self.run, args=(target,))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def publish(self, state):
+        self.latest_state = state
+        for callback in self.state_callbacks:
+            callback(state)
+        return state
+
+    def to_display(self, point, frame_size):
+        """
+        Pixel position of the captured frame -> item coordinates of the flipped frame shown in the GUI,
+        the coordinate system the homography was calibrated in (see FrameItem.map_from_frame).
+        """
+        width, height = frame_size
+        x, y = point[0] + 0.5, point[1] + 0.5
+        return (width - x if self.camera_controller.flip_horizontal else x,
+                height - y if self.camera_controller.flip_vertical else y)
+
+    def from_display(self, point, frame_size):
+        width, height = frame_size
+        x = width - point[0] if self.camera_controller.flip_horizontal else point[0]
+        y = height - point[1] if self.camera_controller.flip_vertical else point[1]
+        return x - 0.5, y - 0.5
+
+    @staticmethod
+    def crop(image, x0, y0, width, height):
+        """
+        image[y0:y0+height, x0:x0+width], zero outside of the image.
+        """
+        out = np.zeros((height, width) + image.shape[2:], image.dtype)
+        xs, ys = max(x0, 0), max(y0, 0)
+        xe, ye = min(x0 + width, image.shape[1]), min(y0 + height, image.shape[0])
+        if xe > xs and ye > ys:
+            out[ys-y0:ye-y0, xs-x0:xe-x0] = image[ys:ye, xs:xe]
+        return out
+
+    def laser_free(self, image):
+        """
+        Mask of the pixels that are not covered by the laser cross or its glow.
+        """
+        size = 2*self.laser_margin + 1
+        laser = cv2.dilate(self.mask_detector.red_mask(image), np.ones((size, size), np.uint8))
+        return (laser == 0).astype(np.uint8)
+
+    def locate(self, reference, target, image, prediction):
+        """
+        Where the feature is in image. The patch around the predicted position is searched for in the reference frame
+        (the frame the target was clicked in) near the target. Pixels covered by the laser cross in either frame
+        are left out, so the feature is found even when the cross lies on it.
+        :param reference: (image, laser free mask) of the reference frame
+        :param target: (x, y) of the feature in the reference frame
+        :return: (x, y) of the feature with sub-pixel refinement and the match score
+        """
+        reference_image, reference_free = reference
+        size, radius = self.template_size, self.search_radius
+        x0, y0 = int(round(prediction[0])) - size//2, int(round(prediction[1])) - size//2
+        dx, dy = int(round(prediction[0] - target[0])), int(round(prediction[1] - target[1]))
+        # the green channel is least affected by the red laser cross moving over the feature
+        template = self.crop(image[:, :, 1], x0, y0, size, size).astype(np.float32)
+        mask = self.crop(self.laser_free(image), x0, y0, size, size) & self.crop(reference_free, x0 - dx, y0 - dy, size, size)
+        if mask.mean() < 0.1:
+            return prediction, 0.0
+        search = self.crop(reference_image[:, :, 1], x0 - dx - radius, y0 - dy - radius, size + 2*radius, size + 2*radius)
+        scores = cv2.matchTemplate(search.astype(np.float32), template, cv2.TM_CCOEFF_NORMED, mask=mask.astype(np.float32))
+        scores = np.nan_to_num(scores, nan=-1.0, posinf=-1.0, neginf=-1.0)
+        _, score, _, (x, y) = cv2.minMaxLoc(scores)
+        # parabola through the neighbours of the best match
+        sub_x = sub_y = 0.0
+        if 0 < x < scores.shape[1] - 1:
+            left, center, right = scores[y, x-1], scores[y, x], scores[y, x+1]
+            denominator = left - 2*center + right
+            sub_x = 0.5*(left - right)/denominator if denominator < 0 else 0.0
+        if 0 < y < scores.shape[0] - 1:
+            top, center, bottom = scores[y-1, x], scores[y, x], scores[y+1, x]
+            denominator = top - 2*center + bottom
+            sub_y = 0.5*(top - bottom)/denominator if denominator < 0 else 0.0
+        # the patch at (x0, y0) of image was at the match position of the search window in the reference frame,
+        # the scene moved by the difference since the reference frame was taken
+        shift_x = dx + radius - x - sub_x
+        shift_y = dy + radius - y - sub_y
+        return (target[0] + shift_x, target[1] + shift_y), float(score)
+
+    def next_frame(self, frame_id):
+        return self.camera_controller.frames.wait_newer(frame_id, timeout=self.frame_timeout)
+
+    def run(self, target):
+        detector = create_cross_detector(self.s)
+        detector.reset()
+        frame = self.camera_controller.latest_frame()
+        if frame is None:
+            self.last_log = "Visual servo: no camera frame."
+            self.publish(ServoState(0, target=target, status="failed"))
+            return
+        reference_image = frame.image.copy()  # the ring buffer slot is reused by the capture thread
+        reference = (reference_image, self.laser_free(reference_image))
+        reference_target = prediction = target
+        # the laser cross does not move in the image (camera and laser are on the head), its detections are averaged
+        cross_detections = []
+        start_time = time.monotonic()
+        iteration = 0
+        frame_id = frame.frame_id - 1  # the clicked frame is the first one to look at
+        while not self._stop.is_set():
+            # the cross and the feature in a frame taken after the last move
+            result = None
+            for _ in range(self.detection_attempts):
+                frame = self.next_frame(frame_id)
+                if frame is None:
+                    break
+                frame_id = frame.frame_id
+                image = frame.image.copy()  # the ring buffer slot is reused by the capture thread
+                result = detector.detect(image)
+                if result.found:
+                    break
+            if frame is None or result is None or not result.found:
+                self.last_log = "Visual servo: laser cross not found."
+                self.publish(ServoState(iteration, target=target, status="failed"))
+                return
+            cross_detections.append(result.center)
+            cross = tuple(float(v) for v in np.median(cross_detections, axis=0))
+            target, score = self.locate(reference, reference_target, image, prediction)
+            state = ServoState(iteration, cross=cross, target=target)
+            if score < self.min_match:
+                self.last_log = f"Visual servo: target lost (match {score:.2f})."
+                state.status = "failed"
+                self.publish(state)
+                return
+            if state.error <= self.tolerance:
+                state.status = "converged"
+                self.last_log = f"Visual servo converged to {state.error:.2f} px in {iteration} moves ({time.monotonic() - start_time:.2f} s)."
+                self.publish(state)
+                return
+            if iteration >= self.max_iterations:
+                state.status = "failed"
+                self.last_log = f"Visual servo did not converge in {iteration} moves, {state.error:.2f} px left."
+                self.publish(state)
+                return
+
+            # relative move that brings the target where the cross is
+            frame_size = (image.shape[1], image.shape[0])
+            world = self.coord_transformer.transform_cs2_to_cs1(np.array([self.to_display(target, frame_size),
+                                                                          self.to_display(cross, frame_size)]))
+            move = self.gain*(world[0] - world[1])
+            state.move = (float(move[0]), float(move[1]))
+            self.publish(state)
+            if self.artisan_controller.process_state != "Idle" or \
+                    not self.artisan_controller.move_axis_to("relative", x=round(state.move[0], 4), y=round(state.move[1], 4), z=0):
+                self.last_log = "Visual servo: move refused, a process was started."
+                self.publish(ServoState(iteration, target=target, status="failed"))
+                return
+            self.artisan_controller.add_sync_position(timeout=30)  # returns when the machine stands still
+            # the feature should now be where the cross is (or gain of the way there)
+            prediction = (target[0] + self.gain*(cross[0] - target[0]), target[1] + self.gain*(cross[1] - target[1]))
+
+            # frames that were exposed while the machine was moving are skipped
+            latest = self.camera_controller.latest_frame()
+            frame_id = latest.frame_id + self.settle_frames - 1 if latest is not None else frame_id
+            iteration += 1
+
+        self.last_log = "Visual servo cancelled."
+        self.publish(ServoState(iteration, target=target, status="cancelled"))
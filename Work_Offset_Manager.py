@@ -0,0 +1,115 @@
+import re
+import numpy as np
+
+class WorkOffsetManager():
+    """
+    Host side work coordinates for the execution of a job.
+    Instead of moving to every work position, querying it (M114) and setting it as origin (G92 X0 Y0 Z0),
+    the origins of all steps and files are calculated on the host. Before a file is streamed, one G92 with the
+    commanded position relative to the file's origin sets the controller's work coordinates, so every command of the
+    file (G0/G1, arcs, relative moves) runs in the file's own coordinate system and is sent unchanged.
+    The last commanded position is tracked, so moves between the files do not need position queries either.
+    Commands that change the coordinate system themselves (G92, G28) can not be tracked and are rejected by
+    unsupported_command.
+    """
+    _frame_command = re.compile(r'(?<![A-Z0-9.])G0*(92|28)(?![0-9.])', re.IGNORECASE)  # change the work coordinates
+    _untracked_move = re.compile(r'(?<![A-Z0-9.])G0*(2|3|53)(?![0-9.])', re.IGNORECASE)  # end position not known from GCodeMoves
+
+    def __init__(self, controller):
+        self.controller = controller
+        self.laser_offset = np.zeros(3)
+        self.origin_offset = np.zeros(3)  # machine coordinates of the controller's work origin
+        self.commanded_position = None  # last commanded position in machine coordinates. None if unknown
+        self._file_origin = np.zeros(3)
+        self._moves = None
+        self._end_known = True  # the end position of the current file follows from its GCodeMoves
+
+    @classmethod
+    def unsupported_command(cls, commands):
+        """
+        :return: first command of commands that changes the work coordinates, None if there is none
+        """
+        for command in commands:
+            if cls._frame_command.search(command.partition(';')[0]):
+                return command
+        return None
+
+    def prepare(self):
+        """
+        Read the offsets and the current position once before the job loop starts.
+        """
+        self.laser_offset = np.array(self.controller.laser_offset if self.controller.laser_offset is not None else [0,0,0], dtype=float)
+        self.origin_offset = np.array(self.controller.origin_offset, dtype=float)
+        self.commanded_position = None
+        self.commanded_position = self.current_position()
+
+    def current_position(self):
+        """
+        Position in machine coordinates. Only queries the machine if no position was commanded yet.
+        """
+        if self.commanded_position is None:
+            position = self.controller.get_absolute_position()
+            self.commanded_position = np.array(position, dtype=float) if position is not None else None
+        return self.commanded_position
+
+    def invalidate(self):
+        """
+        Forget the commanded position, e.g. after the axes were moved manually while paused.
+        """
+        self.commanded_position = None
+
+    def step_origin(self, work_position):
+        """
+        Machine coordinates of the gcode origin of a step: work position with the laser offset applied.
+        """
+        return np.array(work_position[0:3], dtype=float) + self.laser_offset
+
+    def move_to(self, position, speed=None):
+        """
+        Move to a position in machine coordinates.
+        :return: travelled distance in mm
+        """
+        position = np.array(position[0:3], dtype=float)
+        pos_now = self.current_position()
+        self.controller.move_axis_absolute(position[0], position[1], position[2], speed=speed, z_save=True, job_save=True,
+                                           pos_now=None if pos_now is None else list(pos_now))
+        distance = np.linalg.norm(position-pos_now) if pos_now is not None else 0
+        self.commanded_position = position
+        return distance
+
+    def set_origin(self, origin):
+        """
+        Make origin (machine coordinates) the controller's work origin with one G92, computed from the commanded position.
+        The origin offset of the controller is updated, so its absolute moves stay correct.
+        """
+        origin = np.array(origin[0:3], dtype=float)
+        position = self.current_position()
+        if position is None:
+            raise Exception("Position of the machine unknown, can not set the work origin.")
+        if np.allclose(origin, self.origin_offset, atol=1e-5):
+            return
+        work = position - origin
+        self.controller.send_command(f"G92 X{work[0]:.4f} Y{work[1]:.4f} Z{work[2]:.4f}")
+        self.origin_offset = origin
+        self.controller.origin_offset = [float(v) for v in origin]
+
+    def begin_file(self, origin, moves, commands):
+        """
+        Set the work origin for a gcode file whose origin is at origin (machine coordinates).
+        :param moves: GCodeMoves of the file, for the position after the file
+        :param commands: commands of the file
+        """
+        self._file_origin = np.array(origin[0:3], dtype=float)
+        self._moves = moves
+        self._end_known = not any(self._untracked_move.search(command.partition(';')[0]) for command in commands)
+        self.set_origin(self._file_origin)
+
+    def end_file(self, last_idx):
+        """
+        Update the commanded position after the commands of the current file up to last_idx were sent.
+        If the file contains moves GCodeMoves does not follow (arcs, G53), the position is queried before the next move.
+        """
+        if not self._end_known:
+            self.commanded_position = None
+        elif last_idx >= 0 and len(self._moves):
+            self.commanded_position = self._file_origin + self._moves.positions[last_idx]
@@ -0,0 +1,135 @@
+"""
+Compare the former per-command vertex extraction of GCodePlotter with the vectorized build_vertex_buffer
+and time the 2D raster preview of the same job.
+Run: python benchmark_gcode_plotter.py [number of lines]
+"""
+import sys
+import time
+import numpy as np
+from Gcode_Plotter import build_vertex_buffer, G0_COLOR, G0_HIDDEN_COLOR, G1_COLOR
+from Process_Handler import NCCodeInterpreter
+from Raster_Preview import RasterPreview
+
+
+def extract_gcode_positions_and_colors(command_list, show_moves=True):
+    """
+    Per-command reference implementation of build_vertex_buffer, works directly on the command strings.
+    This is how GCodePlotter extracted the vertices before build_vertex_buffer.
+    """
+    positions = []
+    colors = []
+    x = y = z = 0.0
+    prev_command=0
+    if show_moves:
+        g0_color = list(G0_COLOR)
+    else:
+        g0_color = list(G0_HIDDEN_COLOR)
+    g1_color = list(G1_COLOR)
+
+    for command in command_list:
+        command = command.strip().upper()
+        if command.startswith(("G0", "G1")):
+
+            #detect switch between move and write depending on previous command
+            if command.startswith("G0") and prev_command==1:
+                colors.append(g1_color)
+                positions.append([x, y, z])
+                colors.append(g0_color)
+                positions.append([x, y, z])
+
+            elif command.startswith("G1") and prev_command==0:
+                colors.append(g0_color)
+                positions.append([x, y, z])
+                colors.append(g1_color)
+                positions.append([x, y, z])
+
+            # get the new point
+            for token in command.split():
+                if token.startswith("X"):
+                    x = float(token[1:])
+                elif token.startswith("Y"):
+                    y = float(token[1:])
+                elif token.startswith("Z"):
+                    z = float(token[1:])
+
+            if command.startswith("G0"):
+                colors.append(g0_color)
+                positions.append([x, y, z])
+                prev_command=0
+            else:  # G1
+                colors.append(g1_color)
+                positions.append([x, y, z])
+                prev_command=1
+
+    return np.array(positions), np.array(colors)
+
+
+def make_hatch_gcode(n_lines, line_length=50.0, hatch_distance=0.05):
+    """
+    Hatch pattern like a laser engraving job: G0 to the start of every line, G1 along the line.
+    """
+    commands = ["G90", "M3 P100 S255"]
+    y = 0.0
+    for i in range(n_lines//2):
+        x_start, x_end = (0.0, line_length) if i % 2 == 0 else (line_length, 0.0)
+        commands.append(f"G0 X{x_start:.3f} Y{y:.3f} F6000")
+        commands.append(f"G1 X{x_end:.3f} Y{y:.3f} F3000")
+        y = (y + hatch_distance) % line_length
+    commands.append("M5")
+    return commands
+
+
+def run(n_lines=1000000):
+    commands = make_hatch_gcode(n_lines)
+    print(f"{len(commands)} commands")
+
+    t = time.perf_counter()
+    ref_positions, ref_colors = extract_gcode_positions_and_colors(commands)
+    t_loop = time.perf_counter()-t
+    print(f"per-command extraction:   {t_loop:.3f}s")
+
+    t = time.perf_counter()
+    moves = NCCodeInterpreter().parse_moves(commands)
+    t_parse = time.perf_counter()-t
+    t = time.perf_counter()
+    positions, colors = build_vertex_buffer(moves.motion, moves.positions)
+    t_build = time.perf_counter()-t
+    print(f"parse_moves:              {t_parse:.3f}s (done once when the file is loaded)")
+    print(f"build_vertex_buffer:      {t_build:.3f}s")
+    print(f"speedup incl. parsing:    {t_loop/(t_parse+t_build):.1f}x")
+    print(f"speedup from parsed file: {t_loop/t_build:.1f}x")
+
+    same = positions.shape == ref_positions.shape and np.allclose(positions, ref_positions, atol=1e-4) and np.allclose(colors, ref_colors)
+    print(f"identical vertices: {same}")
+    return same
+
+
+def run_raster(n_lines=1000000):
+    """
+    Time the 2D preview of the whole job (level 0) and of a zoomed in view of 4x4 tiles.
+    """
+    moves = NCCodeInterpreter().parse_moves(make_hatch_gcode(n_lines))
+    is_move = moves.motion >= 0
+    end = moves.positions[is_move, 0:2]
+    start = np.concatenate([[[0.0, 0.0]], end[:-1]])
+    print(f"{len(end)} segments")
+
+    t = time.perf_counter()
+    preview = RasterPreview()
+    preview.set_toolpaths(start, end, moves.motion[is_move] == 1, moves.power[is_move])
+    t_set = time.perf_counter()-t
+    t = time.perf_counter()
+    preview.render_block(0, 0, 0)
+    t_full = time.perf_counter()-t
+    t = time.perf_counter()
+    preview.render_block(4, 3, 3, 4, 4)
+    t_zoom = time.perf_counter()-t
+    print(f"raster set_toolpaths:     {t_set:.3f}s")
+    print(f"raster whole job:         {t_full:.3f}s")
+    print(f"raster 4x4 tiles zoomed:  {t_zoom:.3f}s")
+
+
+if __name__ == "__main__":
+    n_lines = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    run(n_lines)
+    run_raster(n_lines)
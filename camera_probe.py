@@ -0,0 +1,79 @@
+"""
+Modes, delivered frame rate and latency of a USB camera.
+Run: python camera_probe.py <camera index> [backend]            list the modes the camera accepts with their delivered fps
+     python camera_probe.py <camera index> [backend] latency    point the camera at the window that opens, it flashes
+                                                                 between black and white and the latency of each flash is measured
+
+The camera is opened by a USBCameraController with the backend (auto, dshow, msmf, v4l2), the latency is measured in
+the driver's default format with a buffer of one frame. It includes the screen, it is an upper bound of the camera latency.
+"""
+import sys
+import cv2
+import numpy as np
+from Camera_Controller import USBCameraController, CAPTURE_BACKENDS
+
+class ProbeSettings():
+    """
+    Minimal settings for a controller outside of the GUI: the defaults of the controller with a camera index and backend.
+    """
+    class Signal():
+        def connect(self, callback):
+            pass
+
+    def __init__(self, values):
+        self.values = values
+        self.settingChanged = self.Signal()
+        self.settingsReplaced = self.Signal()
+
+    def get(self, key, default=None):
+        return self.values.get(key, default)
+
+def probe(camera_index, backend="auto"):
+    settings = ProbeSettings({"laser_camera.camera_index": camera_index, "laser_camera.capture.backend": backend})
+    controller = USBCameraController(settings, "laser_camera")
+    controller.set_log_callback(print)
+    modes = controller.probe_modes(measure_frames=30)
+    print(f"{'width':>6} {'height':>6} {'fourcc':>6} {'fps':>6} {'measured':>9}")
+    for mode in modes:
+        print(f"{mode['width']:6d} {mode['height']:6d} {mode['fourcc']:>6} {mode['fps']:6.1f} {mode['measured_fps']:9.1f}")
+    controller.disconnect()
+    return modes
+
+def latency(camera_index, backend="auto", flashes=10):
+    settings = ProbeSettings({"laser_camera.camera_index": camera_index, "laser_camera.capture.backend": backend})
+    controller = USBCameraController(settings, "laser_camera")
+    controller.set_log_callback(print)
+    controller.connect()
+    if not controller.connected:
+        return None
+    window = "camera latency"
+    black, white = np.zeros((600, 800), np.uint8), np.full((600, 800), 255, np.uint8)
+    cv2.imshow(window, black)
+    cv2.waitKey(1000)  # the camera adjusts to the dark screen
+    results = []
+    for i in range(flashes):
+        image = white if i % 2 == 0 else black
+        def trigger():
+            cv2.imshow(window, image)
+            cv2.waitKey(1)
+        result = controller.measure_latency(trigger)
+        print(f"flash {i + 1}: " + ("no change seen" if result is None else f"{result*1000:.0f} ms"))
+        if result is not None:
+            results.append(result)
+        cv2.waitKey(500)
+    cv2.destroyWindow(window)
+    controller.disconnect()
+    if results:
+        print(f"latency median {np.median(results)*1000:.0f} ms, min {min(results)*1000:.0f} ms, max {max(results)*1000:.0f} ms")
+    return results
+
+# --- Execution ---
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    backend = sys.argv[2] if len(sys.argv) > 2 and sys.argv[2] in CAPTURE_BACKENDS else "auto"
+    if sys.argv[-1] == "latency":
+        latency(int(sys.argv[1]), backend)
+    else:
+        probe(int(sys.argv[1]), backend)
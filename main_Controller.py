@@ -1,5 +1,6 @@
 import sys
 import os
+import multiprocessing
 from pathlib import Path
 from PyQt6 import QtWidgets, uic, QtCore
 import Artisan_Controller
@@ -9,6 +10,7 @@ import Camera_GUI_Interface
 import Artisan_GUI_Interface
 import ArduinoController
 import Process_Handler
+import Job_Queue
 import Process_GUI_Interface
 import Settings_Manager
 import RotMotor_Cotroller
@@ -16,6 +18,7 @@ import RotMotor_GUI_Interface
 import Interactive_Image_Control
 import Maschine_Helper
 import Gcode_Plotter
+import Frame_Recorder
 from PathManager import get_gui_file_path, get_settings_path
 
 #Define paths using PathManager
@@ -23,52 +26,64 @@ MAIN_GUI_PATH = get_gui_file_path("Controller.ui")
 DEFAULT_SETTINGS_PATH = get_settings_path("Default_Settings.json")
 SCHEMA_PATH = get_settings_path("schema.json")   
 
-#setup QApplication and load GUI
-app = QtWidgets.QApplication(sys.argv)
-gui = uic.loadUi(str(MAIN_GUI_PATH))
-gui.show()
+# the recorder encodes in a child process, which imports this module again (spawn on Windows)
+if __name__ == "__main__":
+    multiprocessing.freeze_support()  # for the executable built by pyinstaller
 
+    #setup QApplication and load GUI
+    app = QtWidgets.QApplication(sys.argv)
+    gui = uic.loadUi(str(MAIN_GUI_PATH))
+    gui.show()
 
 
-#setup Settings Manager
 
-settings = Settings_Manager.SettingsManager(default_settings_path=DEFAULT_SETTINGS_PATH, schema_path=SCHEMA_PATH, use_validation=False)
+    #setup Settings Manager
 
+    settings = Settings_Manager.SettingsManager(default_settings_path=DEFAULT_SETTINGS_PATH, schema_path=SCHEMA_PATH, use_validation=False)
 
-#setup controllers
-#artisan_controller=Artisan_Controller.ArtisanController(connection_type="usb", port="COM6")
-artisan_controller = Artisan_Controller.ArtisanController(settings=settings)
-overview_camera_controller = Camera_Controller.USBCameraController(settings=settings, camera_type="overview_camera")
-laser_camera_controller = Camera_Controller.USBCameraController(settings=settings, camera_type="laser_camera")
-rot_motor_controller = RotMotor_Cotroller.RotMotorCotroller(settings=settings)
-controllers={"artisan_controller":artisan_controller,
-             "overview_camera_controller":overview_camera_controller, 
-             "laser_camera_controller":laser_camera_controller,
-             "rot_motor_controller":rot_motor_controller
-             }
 
-# arduino_controller = ArduinoController.ArduinoController(gui, artisan_controller=artisan_controller)
-# arduino_controller.connect(port="COM5", baudrate=9600)
-process_handler = Process_Handler.ProcessHandler(gui, artisan_controller, rot_motor_controller)
+    #setup controllers
+    #artisan_controller=Artisan_Controller.ArtisanController(connection_type="usb", port="COM6")
+    artisan_controller = Artisan_Controller.ArtisanController(settings=settings)
+    overview_camera_controller = Camera_Controller.USBCameraController(settings=settings, camera_type="overview_camera")
+    laser_camera_controller = Camera_Controller.USBCameraController(settings=settings, camera_type="laser_camera")
+    rot_motor_controller = RotMotor_Cotroller.RotMotorCotroller(settings=settings)
+    controllers={"artisan_controller":artisan_controller,
+                 "overview_camera_controller":overview_camera_controller, 
+                 "laser_camera_controller":laser_camera_controller,
+                 "rot_motor_controller":rot_motor_controller
+                 }
 
-#setup interfaces
-main_interface=Main_GUI_Interface.MainInterface(gui, controllers, settings)
-artisan_interface=Artisan_GUI_Interface.ArtisanInterface(gui, artisan_controller)
-overview_camera_gui_interface = Camera_GUI_Interface.CameraInterface(gui, settings, overview_camera_controller)
-laser_camera_gui_interface = Camera_GUI_Interface.CameraInterface(gui, settings, laser_camera_controller)
-rot_mot_interface = RotMotor_GUI_Interface.RotMotorInterface(gui, rot_motor_controller)
-process_gui_interface = Process_GUI_Interface.ProcessInterface(gui, process_handler)
+    # arduino_controller = ArduinoController.ArduinoController(gui, artisan_controller=artisan_controller)
+    # arduino_controller.connect(port="COM5", baudrate=9600)
+    process_handler = Process_Handler.ProcessHandler(gui, artisan_controller, rot_motor_controller)
+    job_queue = Job_Queue.JobQueue(process_handler)
 
-#Maschine Helpers
-interactive_image_control_lasercam = Interactive_Image_Control.InteractiveImageControl(gui, settings, laser_camera_gui_interface, artisan_controller)
-interactive_image_control_overvoiew = Interactive_Image_Control.InteractiveImageControl(gui, settings, overview_camera_gui_interface, artisan_controller)
+    #setup interfaces
+    main_interface=Main_GUI_Interface.MainInterface(gui, controllers, settings)
+    artisan_interface=Artisan_GUI_Interface.ArtisanInterface(gui, artisan_controller)
+    overview_camera_recorder = Frame_Recorder.FrameRecorder(settings, overview_camera_controller, artisan_controller)
+    laser_camera_recorder = Frame_Recorder.FrameRecorder(settings, laser_camera_controller, artisan_controller)
+    process_handler.set_process_state_callback(overview_camera_recorder.process_state_changed)  # time-lapse of every job
+    process_handler.set_process_state_callback(laser_camera_recorder.process_state_changed)
+    overview_camera_recorder.set_job_queue(job_queue)  # every job of the queue as its own time-lapse
+    laser_camera_recorder.set_job_queue(job_queue)
+    overview_camera_gui_interface = Camera_GUI_Interface.CameraInterface(gui, settings, overview_camera_controller, overview_camera_recorder)
+    laser_camera_gui_interface = Camera_GUI_Interface.CameraInterface(gui, settings, laser_camera_controller, laser_camera_recorder)
+    rot_mot_interface = RotMotor_GUI_Interface.RotMotorInterface(gui, rot_motor_controller)
+    process_gui_interface = Process_GUI_Interface.ProcessInterface(gui, process_handler)
+    job_queue_gui_interface = Process_GUI_Interface.JobQueueInterface(gui, job_queue)
 
-maschine_helper = Maschine_Helper.MaschineHelpers(gui, artisan_controller)
-maschine_helper.setup_helpers()
+    #Maschine Helpers
+    interactive_image_control_lasercam = Interactive_Image_Control.InteractiveImageControl(gui, settings, laser_camera_gui_interface, artisan_controller)
+    interactive_image_control_overvoiew = Interactive_Image_Control.InteractiveImageControl(gui, settings, overview_camera_gui_interface, artisan_controller)
 
-gcode_plotter = Gcode_Plotter.GCodePlotter(gui, process_handler)
+    maschine_helper = Maschine_Helper.MaschineHelpers(gui, artisan_controller)
+    maschine_helper.setup_helpers()
 
+    gcode_plotter = Gcode_Plotter.GCodePlotter(gui, process_handler)
 
-sys.exit(app.exec())
+
+    sys.exit(app.exec())
 
 
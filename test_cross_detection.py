@@ -1,223 +1,210 @@
+"""
+Laser cross detection on recorded frames.
+Run: python test_cross_detection.py                                  show the detection on image_with_cross.png
+     python test_cross_detection.py make-corpus <directory> [frames]  write a synthetic corpus from image_with_cross.png
+     python test_cross_detection.py benchmark <directory> [summary.json] [full,tracking,pyramid]
+
+A corpus is a directory of frames (png/jpg/bmp) and a ground_truth.json that maps file names to the [x, y] center
+of the cross, or to null for frames without a cross. Frames are processed in the order of their file names, like a
+camera stream, so tracking detectors can use the previous frames. Frames that are not in ground_truth.json are
+timed, but not scored.
+"""
+import json
+import os
+import sys
+import time
 import cv2
 import numpy as np
+from Cross_Detection import LaserCrossDetector, TrackingCrossDetector, PyramidCrossDetector
 
-def get_intersection(line1, line2):
+# center of the cross in image_with_cross.png, read off by hand from the white core of the arms
+REFERENCE_CENTER = (340.0, 214.5)
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+
+# detector variants of the benchmark, a new implementation is added here to be compared with the others
+DETECTORS = {
+    "full": LaserCrossDetector,
+    "tracking": lambda: TrackingCrossDetector(LaserCrossDetector()),
+    "pyramid": PyramidCrossDetector,
+}
+
+def draw_cross_detection(img, result):
     """
-    Calculates the intersection point of two infinite lines.
-    Line 1 is defined by (x1, y1) and (x2, y2).
-    Line 2 is defined by (x3, y3) and (x4, y4).
+    Draws the lines and the center of a CrossDetection into a copy of the image.
     """
+    output_img = img.copy()
+    for x1, y1, x2, y2 in result.v_lines:
+        cv2.line(output_img, (int(x1), int(y1)), (int(x2), int(y2)), (255, 0, 0), 1)
+    for x1, y1, x2, y2 in result.h_lines:
+        cv2.line(output_img, (int(x1), int(y1)), (int(x2), int(y2)), (255, 255, 0), 1)
+    for x1, y1, x2, y2 in result.arm_lines:
+        cv2.line(output_img, (int(x1), int(y1)), (int(x2), int(y2)), (0, 0, 255), 2)
+
+    if result.found:
+        # Draw a bright green crosshair over the calculated center
+        center_x, center_y = int(result.center[0]), int(result.center[1])
+        cv2.line(output_img, (center_x - 30, center_y), (center_x + 30, center_y), (0, 255, 0), 2)
+        cv2.line(output_img, (center_x, center_y - 30), (center_x, center_y + 30), (0, 255, 0), 2)
+    return output_img
 
-    x1, y1, x2, y2 = line1
-    x3, y3, x4, y4 = line2
-    # 1. Calculate the denominator
-    d = (x1 - x2) * (y3 - y4) - (y1 - y2) * (x3 - x4)
-    
-    # 2. Check for parallel lines (denominator is 0)
-    if d == 0:
-        return None, None # Or raise an exception, depending on your needs
-        
-    # 3. Pre-calculate the cross products to avoid repeating operations
-    cross_12 = (x1 * y2 - y1 * x2)
-    cross_34 = (x3 * y4 - y3 * x4)
-    
-    # 4. Calculate the intersection point
-    x_inter = (cross_12 * (x3 - x4) - (x1 - x2) * cross_34) / d
-    y_inter = (cross_12 * (y3 - y4) - (y1 - y2) * cross_34) / d
-    
-    return x_inter, y_inter
-
-def detect_laser_cross_refined(image_path):
-    # 1. Load the image
+def detect_laser_cross_refined(image_path, detector=None):
     img = cv2.imread(image_path)
     if img is None:
         print("Error: Could not load image.")
         return None
-    
-    output_img = img.copy()
-
-    # 2. Convert to HSV color space
-    hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
-
-    # 3. Create a strict mask for RED color
-    # We use a high Saturation threshold (>100) to ignore the white glare completely
-    # We use a high Value threshold (>100) to ignore dark red background noise
-    lower_red_1 = np.array([0, 100, 100])
-    upper_red_1 = np.array([10, 255, 255])
-    mask1 = cv2.inRange(hsv, lower_red_1, upper_red_1)
-
-    lower_red_2 = np.array([160, 100, 100])
-    upper_red_2 = np.array([180, 255, 255])
-    mask2 = cv2.inRange(hsv, lower_red_2, upper_red_2)
-
-    red_mask = mask1 | mask2
-
-    # 4. Clean up the mask to remove tiny specks of noise
-    kernel = np.ones((3,3), np.uint8)
-    red_mask = cv2.morphologyEx(red_mask, cv2.MORPH_OPEN, kernel)
 
-    # 5. Detect lines using Probabilistic Hough Transform
-    # minLineLength=40 ensures we only care about long, distinct laser arms
-    too_many_lines = True
-    threshold = 200
-    while too_many_lines:
-        lines = cv2.HoughLinesP(
-            red_mask, 
-            rho=1, 
-            theta=np.pi/180, 
-            threshold=threshold, 
-            minLineLength=50, 
-            maxLineGap=200 # Bridge the massive white gap in the center
-        )
-
-        if lines is None:
-            print("No cross arms detected.")
-            return output_img
+    detector = detector if detector is not None else LaserCrossDetector()
+    result = detector.detect(img)
+    if result.found:
+        print(f"Precise cross center found at: ({result.center[0]:.2f}, {result.center[1]:.2f})")
+    elif not result.v_lines and not result.h_lines:
+        print("No cross arms detected.")
+    else:
+        print(f"No cross center found ({len(result.v_lines)} vertical, {len(result.h_lines)} horizontal lines).")
+    return draw_cross_detection(img, result)
 
-        if threshold > 600:
-            print("Too many lines detected, even with high threshold. Consider adjusting parameters.")
-            return output_img
-        if len(lines) > 30:
-            threshold += 10
+def make_corpus(directory, image_path="image_with_cross.png", n_frames=120, center=REFERENCE_CENTER, seed=0):
+    """
+    Writes a synthetic camera stream with known centers: the image is moved along a smooth path with sub-pixel steps,
+    slightly rotated, with sensor noise and changing brightness. Every 40th frame has no cross, so trackers
+    have to find it again.
+    """
+    img = cv2.imread(image_path)
+    if img is None:
+        raise FileNotFoundError(image_path)
+    height, width = img.shape[:2]
+    # the top left corner of the image does not contain the cross
+    empty = cv2.resize(img[:height//3, :width//3], (width, height), interpolation=cv2.INTER_LINEAR)
+    rng = np.random.default_rng(seed)
+    os.makedirs(directory, exist_ok=True)
+    ground_truth = {}
+    for i in range(n_frames):
+        name = f"frame_{i:04d}.png"
+        if i % 40 == 39:
+            frame, frame_center = empty, None
         else:
-            too_many_lines = False
-
-    # 6. Group coordinates by orientation
-    v_coords_x = []
-    h_coords_y = []
-
-    v_lines = []
-    h_lines = []
-    
-    for line in lines:
-        x1, y1, x2, y2 = line[0]
-        angle = np.abs(np.arctan2(y2 - y1, x2 - x1) * 180.0 / np.pi)
-
-        # Is it a vertical arm? (Angle near 90 degrees)
-        if 70 < angle < 110:
-            v_coords_x.extend([x1, x2])
-            v_lines.append((x1, y1, x2, y2))
-            
-            cv2.line(output_img, (x1, y1), (x2, y2), (255, 0, 0), 1)
-        # Is it a horizontal arm? (Angle near 0 or 180 degrees)
-        elif angle < 20 or angle > 160:
-            h_coords_y.extend([y1, y2])
-            h_lines.append((x1, y1, x2, y2))
-
-            cv2.line(output_img, (x1, y1), (x2, y2), (255, 255, 0), 1)
-
-    # 7. Calculate the Median Intersection as a first guess for the center (Median is more robust to outliers than mean)
-    # The median naturally ignores outliers (like a false line detected on the glare edge)
-    center_x_guess, center_y_guess = None, None
-    
-    if v_coords_x:
-        center_x_guess = int(np.median(v_coords_x))
-    else:
-        print("No vertical lines detected.")
-        return None
-    if h_coords_y:
-        center_y_guess = int(np.median(h_coords_y))
-    else:
-        print("No horizontal lines detected.")
+            t = i/n_frames*2*np.pi
+            matrix = cv2.getRotationMatrix2D(center, 3.0*np.sin(3*t), 1.0)
+            matrix[:, 2] += (60*np.sin(t), 40*np.sin(2*t))
+            frame = cv2.warpAffine(img, matrix, (width, height), flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+            frame_center = (matrix @ np.array([center[0], center[1], 1.0])).tolist()
+        gain = 1.0 + 0.15*np.sin(0.3*i)
+        noise = rng.normal(0.0, 4.0, frame.shape)
+        frame = np.clip(frame*gain + noise, 0, 255).astype(np.uint8)
+        cv2.imwrite(os.path.join(directory, name), frame)
+        ground_truth[name] = frame_center
+    with open(os.path.join(directory, "ground_truth.json"), 'w') as f:
+        json.dump(ground_truth, f, indent=2)
+    return ground_truth
+
+def load_corpus(directory):
+    """
+    :return: list of (file name, image, center), center is None for frames without a cross and
+    False for frames without ground truth
+    """
+    ground_truth_path = os.path.join(directory, "ground_truth.json")
+    ground_truth = {}
+    if os.path.exists(ground_truth_path):
+        with open(ground_truth_path, 'r') as f:
+            ground_truth = json.load(f)
+    corpus = []
+    for name in sorted(os.listdir(directory)):
+        if not name.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        img = cv2.imread(os.path.join(directory, name))
+        if img is None:
+            print(f"Could not load {name}, skipped.")
+            continue
+        center = ground_truth.get(name, False)
+        corpus.append((name, img, tuple(center) if center else center))
+    return corpus
+
+def percentiles(values, ps=(50, 90, 99)):
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) == 0:
+        return {}
+    summary = {f"p{p}": float(np.percentile(values, p)) for p in ps}
+    summary["mean"] = float(values.mean())
+    summary["max"] = float(values.max())
+    return summary
+
+def benchmark_detector(detector, corpus):
+    """
+    Runs the detector over the frames of the corpus in order, the images are loaded before the timing.
+    :return: dict with latency percentiles (ms), throughput (frames/s), detection rate, false detections on frames
+    without a cross and the center error (pixels) on frames with a cross
+    """
+    detector.reset()
+    latencies = []
+    errors = []
+    with_cross = without_cross = detected = false_detections = 0
+    total_start = time.perf_counter()
+    for name, img, center in corpus:
+        start = time.perf_counter()
+        result = detector.detect(img)
+        latencies.append(time.perf_counter() - start)
+        if center is False:
+            continue
+        if center is None:
+            without_cross += 1
+            false_detections += result.found
+            continue
+        with_cross += 1
+        if result.found:
+            detected += 1
+            errors.append(float(np.hypot(result.center[0] - center[0], result.center[1] - center[1])))
+    total_time = time.perf_counter() - total_start
+
+    summary = {
+        "frames": len(corpus),
+        "frames_with_cross": with_cross,
+        "frames_without_cross": without_cross,
+        "latency_ms": percentiles(np.array(latencies)*1000.0),
+        "throughput_fps": len(corpus)/total_time if total_time > 0 else 0.0,
+        "detection_rate": detected/with_cross if with_cross else None,
+        "false_detections": false_detections,
+        "error_px": percentiles(errors, (50, 95)),
+        "within_1px": float(np.mean(np.array(errors) <= 1.0)) if errors else None,
+    }
+    return summary
+
+def run_benchmark(directory, output_path=None, detector_names=None):
+    corpus = load_corpus(directory)
+    if not corpus:
+        print(f"No frames in {directory}.")
         return None
-
-    #8. Calculate all intersactions of vertical and horizontal lines that are close to the median guess (within 20 pixels), and use these to refine the center guess
-    close_v_lines = [line for line in v_lines if abs(line[0] - center_x_guess) < 20 or abs(line[2] - center_x_guess) < 20]
-    close_h_lines = [line for line in h_lines if abs(line[1] - center_y_guess) < 20 or abs(line[3] - center_y_guess) < 20]
-
-    intersections_x = []
-    intersections_y = []
-    # for v_line in close_v_lines:
-    #     for h_line in close_h_lines:
-    #         x_inter,y_inter = get_intersection(v_line, h_line)
-            
-    #         intersections_x.append(x_inter)
-    #         intersections_y.append(y_inter)
-
-
-    #get the lines closest to the gap
-    #get closes vertical lines
-    for i, v_line in enumerate(close_v_lines):
-        h_line = (0, center_y_guess, img.shape[1], center_y_guess) # A horizontal line through the center guess
-
-        x_inter,y_inter = get_intersection(v_line, h_line)
-        intersections_x.append([x_inter,i])
-    
-    sorted_x = sorted(intersections_x)
-    gaps = [sorted_x[i+1][0] - sorted_x[i][0] for i in range(len(sorted_x)-1)]
-    max_gap_index = np.argmax(gaps)
-
-    v_line_1 = close_v_lines[sorted_x[max_gap_index][1]]
-    v_line_2 = close_v_lines[sorted_x[max_gap_index + 1][1]]
-    
-    #get closes horizontal lines
-    for i,h_line in enumerate(close_h_lines):
-        v_line =(center_x_guess, 0, center_x_guess, img.shape[0]) # A vertical line through the center guess
-
-        x_inter,y_inter = get_intersection(v_line, h_line)
-        intersections_y.append([y_inter,i])
-    sorted_y = sorted(intersections_y)
-    gaps = [sorted_y[i+1][0] - sorted_y[i][0] for i in range(len(sorted_y)-1)]
-    max_gap_index = np.argmax(gaps)
-    
-    h_line_1 = close_h_lines[sorted_y[max_gap_index][1]]
-    h_line_2 = close_h_lines[sorted_y[max_gap_index + 1][1]]
-    
-    #find the intersections of the closest lines to get a refined center guess
-    intersections_x = []
-    intersections_y = []
-    for v_line in [v_line_1, v_line_2]:
-        for h_line in [h_line_1, h_line_2]:
-            x_inter,y_inter = get_intersection(v_line, h_line)
-            
-            intersections_x.append(x_inter)
-            intersections_y.append(y_inter)
-
-    for line in [v_line_1, v_line_2, h_line_1, h_line_2]:
-        x1, y1, x2, y2 = line
-        cv2.line(output_img, (x1, y1), (x2, y2), (0, 0, 255), 2)
-
-    # 9. Refine the center guess by taking the median of these intersections
-    center_x_guess = int(np.mean(intersections_x))
-    center_y_guess = int(np.mean(intersections_y))
-
-    # # 9. Refine the center guess by taking the median of these intersections
-    # if intersections_x and intersections_y:
-    #     # center_x_guess = int(np.mean(intersections_x))
-    #     # center_y_guess = int(np.mean(intersections_y))
-
-    #     #find the gap in the intersections
-    #     if len(intersections_x) > 1:
-    #         sorted_x = sorted(intersections_x)
-    #         gaps = [sorted_x[i+1] - sorted_x[i] for i in range(len(sorted_x)-1)]
-    #         max_gap_index = np.argmax(gaps)
-    #         # The gap should be between the two clusters of intersections around the true center
-    #         if gaps[max_gap_index] > 3: # Only consider it a valid gap if it's larger than 3 pixels
-    #             center_x_guess = int((sorted_x[max_gap_index] + sorted_x[max_gap_index + 1]) / 2)
-
-    #     if len(intersections_y) > 1:
-    #         sorted_y = sorted(intersections_y)
-    #         gaps = [sorted_y[i+1] - sorted_y[i] for i in range(len(sorted_y)-1)]
-    #         max_gap_index = np.argmax(gaps)
-    #         if gaps[max_gap_index] > 3:
-    #             center_y_guess = int((sorted_y[max_gap_index] + sorted_y[max_gap_index + 1]) / 2)
-
-    # 10. Draw the final result
-    if center_x_guess is not None and center_y_guess is not None:
-        center = (center_x_guess, center_y_guess)
-        
-        
-        # Draw a bright green crosshair over the calculated center
-        # cv2.circle(output_img, center, 8, (0, 255, 0), -1)
-        cv2.line(output_img, (center_x_guess - 30, center_y_guess), (center_x_guess + 30, center_y_guess), (0, 255, 0), 2)
-        cv2.line(output_img, (center_x_guess, center_y_guess - 30), (center_x_guess, center_y_guess + 30), (0, 255, 0), 2)
-        
-        print(f"Precise cross center found at: {center}")
-
-    return output_img
+    detector_names = detector_names if detector_names is not None else list(DETECTORS)
+    summary = {"corpus": os.path.abspath(directory), "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+               "frame_size": list(corpus[0][1].shape[1::-1]), "detectors": {}}
+    print(f"{len(corpus)} frames from {directory}")
+    print(f"{'detector':<10} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'fps':>7} {'found':>7} {'false':>6} {'err px':>7} {'p95 px':>7}")
+    for name in detector_names:
+        result = benchmark_detector(DETECTORS[name](), corpus)
+        summary["detectors"][name] = result
+        latency, error = result["latency_ms"], result["error_px"]
+        detection_rate = result["detection_rate"]
+        print(f"{name:<10} {latency['p50']:8.1f} {latency['p90']:8.1f} {latency['p99']:8.1f} {result['throughput_fps']:7.1f} "
+              f"{'-' if detection_rate is None else f'{detection_rate:.0%}':>7} {result['false_detections']:6d} "
+              f"{error.get('p50', float('nan')):7.2f} {error.get('p95', float('nan')):7.2f}")
+    if output_path is not None:
+        with open(output_path, 'w') as f:
+            json.dump(summary, f, indent=2)
+        print(f"Summary written to {output_path}")
+    return summary
 
 # --- Execution ---
-result = detect_laser_cross_refined("image_with_cross.png")
-cv2.imshow("Detected Cross", result)
-cv2.waitKey(0)
-cv2.destroyAllWindows()
+if __name__ == "__main__":
+    if len(sys.argv) > 2 and sys.argv[1] == "make-corpus":
+        n_frames = int(sys.argv[3]) if len(sys.argv) > 3 else 120
+        make_corpus(sys.argv[2], n_frames=n_frames)
+        print(f"{n_frames} frames written to {sys.argv[2]}")
+    elif len(sys.argv) > 2 and sys.argv[1] == "benchmark":
+        output_path = sys.argv[3] if len(sys.argv) > 3 else os.path.join(sys.argv[2], "benchmark_summary.json")
+        detector_names = sys.argv[4].split(",") if len(sys.argv) > 4 else None
+        run_benchmark(sys.argv[2], output_path, detector_names)
+    else:
+        result = detect_laser_cross_refined("image_with_cross.png")
+        if result is not None:
+            cv2.imshow("Detected Cross", result)
+            cv2.waitKey(0)
+            cv2.destroyAllWindows()